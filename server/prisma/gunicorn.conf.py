@@ -0,0 +1,33 @@
+# Production server: gunicorn managing uvicorn workers running prisma.asgi:application
+#   gunicorn prisma.asgi:application -c gunicorn.conf.py
+# Send SIGHUP to the master for a graceful reload, workers finish their in flight requests first.
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = 'uvicorn_worker.UvicornWorker'
+
+# Django runs the sync views of an ASGI worker one at a time on its thread sensitive executor, so
+# parallelism comes from worker processes: the usual 2 x cores + 1, overridable with WEB_CONCURRENCY
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+
+# nginx keeps idle upstream connections for 60s (keepalive_timeout in nginx/conf.d/default.conf), the
+# workers must hold them longer or nginx may reuse a connection the worker is closing
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '75'))
+
+# Graceful restarts: recycle workers after a jittered number of requests so they don't restart together,
+# give in flight requests graceful_timeout seconds on reload/shutdown, kill workers stuck for timeout seconds
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '2000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '200'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+
+# Behind nginx, trust its X-Forwarded-* headers
+forwarded_allow_ips = os.getenv('FORWARDED_ALLOW_IPS', '*')
+
+# Worker heartbeats on tmpfs, a slow container filesystem can otherwise get healthy workers killed
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
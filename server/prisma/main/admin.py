@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django import forms
-from .models import ServiceType, Job, Earning, BankAccount, Review, TrainingRecord, Detailer, User, TimeSlot, Availability
+from .models import ServiceType, Job, Earning, BankAccount, Review, TrainingRecord, Detailer, User, TimeSlot, Availability, PayoutRun, PayoutBatch
 
 # Custom form for ServiceType to handle description as textarea
 class ServiceTypeForm(forms.ModelForm):
@@ -48,6 +48,8 @@ class JobAdmin(admin.ModelAdmin):
     list_display = ('service_type', 'booking_reference', 'client_name', 'vehicle_registration', 'address', 'city', 'post_code','appointment_date','detailer')
     search_fields = ('booking_reference', 'client_name', 'vehicle_registration',)
     list_filter = ('booking_reference', 'client_name')
+    # Newest appointments first, served by job_appt_date_idx
+    ordering = ('-appointment_date',)
 
 @admin.register(Earning)
 class EarningAdmin(admin.ModelAdmin):
@@ -55,6 +57,21 @@ class EarningAdmin(admin.ModelAdmin):
     search_fields = ('detailer__user__first_name', 'detailer__user__last_name', 'job__booking_reference', 'job__client_name', 'job__vehicle_registration')
     list_filter = ('payment_status', 'payout_date')
 
+class PayoutBatchInline(admin.TabularInline):
+    model = PayoutBatch
+    fields = ('detailer', 'bank_account', 'earning_count', 'net_amount', 'tip_amount', 'total_amount')
+    readonly_fields = fields
+    raw_id_fields = ('detailer', 'bank_account')
+    extra = 0
+    can_delete = False
+
+@admin.register(PayoutRun)
+class PayoutRunAdmin(admin.ModelAdmin):
+    list_display = ('run_id', 'payout_date', 'status', 'batch_count', 'earning_count', 'total_amount', 'completed_at')
+    search_fields = ('run_id',)
+    list_filter = ('status', 'payout_date')
+    inlines = [PayoutBatchInline]
+
 @admin.register(BankAccount)
 class BankAccountAdmin(admin.ModelAdmin):
     list_display = ('detailer', 'account_name', 'account_number', 'sort_code', 'bank_name')
@@ -75,9 +92,11 @@ class TrainingRecordAdmin(admin.ModelAdmin):
 
 @admin.register(Detailer)
 class DetailerAdmin(admin.ModelAdmin):
-    list_display = ('user', 'rating', 'city', 'is_active', 'is_verified', 'commission_rate')
+    list_display = ('user', 'rating', 'city', 'is_active', 'is_verified', 'commission_rate', 'unpaid_net_total', 'lifetime_net_total')
     search_fields = ('user__first_name', 'user__last_name', 'user__email', 'city')
     list_filter = ('is_active', 'is_verified', 'city')
+    list_select_related = ('user',)
+    readonly_fields = ('lifetime_net_total', 'unpaid_net_total', 'paid_net_total')
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
@@ -0,0 +1,36 @@
+import time
+from django.core.cache import cache
+
+""" Version numbers of cached data. Entries are stored under the version they were built at, so a bump
+    makes them all unreachable at once and the old entries just expire. A missing version starts at a
+    millisecond timestamp, which never reuses the version of an entry still cached from before an eviction.
+"""
+
+
+def _initial_version():
+    return int(time.time() * 1000)
+
+
+def current_version(key):
+    """ The version stored under the key, started when there is none """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def current_versions(keys):
+    """ {key: version} of many keys, in one cache round trip when they are all set """
+    versions = cache.get_many(list(keys))
+    for key in set(keys) - versions.keys():
+        versions[key] = current_version(key)
+    return versions
+
+
+def bump(key):
+    """ Move the key to a new version """
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _initial_version(), None)
@@ -0,0 +1,104 @@
+import hashlib
+import json
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from .cache_versions import bump, current_version
+
+# The version key is bumped on every ServiceType change, catalogs are stored under the version they were
+# built at so a bump invalidates every process at once and old entries just expire
+VERSION_KEY = 'catalog:service_types:version'
+
+# Process local tier: {'version', 'entries', 'etag', 'checked_at'}, rebuilt from the shared tier
+_local = {'version': None, 'entries': None, 'etag': None, 'checked_at': 0.0}
+_lock = threading.Lock()
+
+
+def _data_key(version):
+    return f'catalog:service_types:{version}'
+
+
+def _build():
+    """ Load the catalog from the database, keyed by id, with an ETag over its content """
+    from .models import ServiceType
+
+    entries = {
+        row['id']: row
+        for row in ServiceType.objects.order_by('id').values('id', 'name', 'description', 'wash_type', 'duration', 'price')
+    }
+    etag = hashlib.sha1(json.dumps(list(entries.values()), sort_keys=True, default=str).encode()).hexdigest()
+    return {'entries': entries, 'etag': f'"{etag}"'}
+
+
+def _catalog():
+    now = time.monotonic()
+    if _local['entries'] is not None and now - _local['checked_at'] < settings.SERVICE_CATALOG_LOCAL_TTL:
+        return _local
+    with _lock:
+        version = current_version(VERSION_KEY)
+        if _local['entries'] is None or _local['version'] != version:
+            catalog = cache.get(_data_key(version))
+            if catalog is None:
+                catalog = _build()
+                cache.set(_data_key(version), catalog, settings.SERVICE_CATALOG_CACHE_TIMEOUT)
+            _local.update(version=version, entries=catalog['entries'], etag=catalog['etag'])
+        _local['checked_at'] = now
+    return _local
+
+
+def invalidate_catalog():
+    """
+    Drop the cached catalog in every process.
+
+    This process rebuilds on its next read, the others within SERVICE_CATALOG_LOCAL_TTL seconds,
+    when they next compare their local version with the shared one.
+    """
+    bump(VERSION_KEY)
+    _local.update(version=None, entries=None, etag=None, checked_at=0.0)
+
+
+def service_types():
+    """ Every service type as a dict of its fields, ordered by id """
+    return list(_catalog()['entries'].values())
+
+
+def catalog_etag():
+    """ Quoted ETag of the current catalog content """
+    return _catalog()['etag']
+
+
+def get_service_type(service_type_id):
+    """
+    Fields of one service type, read from the cached catalog.
+
+    A missing id rebuilds the catalog once, for service types created by another process since
+    this one last checked.
+
+    Returns:
+        dict: id, name, description, wash_type, duration and price, None when the id doesn't exist
+    """
+    if service_type_id is None:
+        return None
+    entry = _catalog()['entries'].get(service_type_id)
+    if entry is None:
+        _local['checked_at'] = 0.0
+        with _lock:
+            _local['version'] = None
+        entry = _catalog()['entries'].get(service_type_id)
+    return entry
+
+
+def service_name(service_type_id):
+    entry = get_service_type(service_type_id)
+    return entry['name'] if entry else None
+
+
+def service_duration(service_type_id):
+    entry = get_service_type(service_type_id)
+    return entry['duration'] if entry else None
+
+
+def service_price(service_type_id):
+    entry = get_service_type(service_type_id)
+    return entry['price'] if entry else None
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Cache backends whose entries only the process that wrote them can see
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """ SHARED_CACHE must not be forced on a cache the web and celery processes each keep to themselves """
+    if settings.SHARED_CACHE and settings.CACHES['default']['BACKEND'] in PROCESS_LOCAL_BACKENDS:
+        return [Error(
+            'SHARED_CACHE is set but the default cache is local to each process.',
+            hint='Set CACHE_REDIS_URL, or unset SHARED_CACHE to compute slot grids and routes per request.',
+            id='main.E001',
+        )]
+    return []
@@ -0,0 +1,58 @@
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from channels.layers import get_channel_layer
+from .models import Detailer
+
+
+def detailer_group(detailer_id):
+    return f'detailer_{detailer_id}'
+
+
+def notify_detailer(detailer_id, event, payload):
+    """
+    Push an event to every open websocket of a detailer, callable from views and celery tasks.
+
+    Args:
+        detailer_id: Detailer to notify
+        event: Event name the app switches on, e.g. "job.assigned"
+        payload: JSON serializable event data
+    """
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    async_to_sync(channel_layer.group_send)(detailer_group(detailer_id), {
+        'type': 'detailer.event',
+        'event': event,
+        'payload': payload,
+    })
+
+
+class DetailerConsumer(AsyncJsonWebsocketConsumer):
+    """ Websocket of a signed in detailer, receiving the events sent with notify_detailer """
+    async def connect(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close(code=4401)
+            return
+        detailer_id = await database_sync_to_async(
+            lambda: Detailer.objects.filter(user=user).values_list('id', flat=True).first()
+        )()
+        if detailer_id is None:
+            await self.close(code=4403)
+            return
+        self.group_name = detailer_group(detailer_id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        if getattr(self, 'group_name', None):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        # Clients keep the connection alive through proxies with {"type": "ping"}
+        if content.get('type') == 'ping':
+            await self.send_json({'type': 'pong'})
+
+    async def detailer_event(self, message):
+        await self.send_json({'type': message['event'], 'payload': message['payload']})
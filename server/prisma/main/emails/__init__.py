@@ -0,0 +1,3 @@
+from .messages import EMAIL_EVENTS, render_email
+from .sending import queue_email, queue_emails, send_queued_batch, send_queued_emails
+from .notices import queue_job_reminders, queue_payout_notices, queue_welcome_email
@@ -0,0 +1,36 @@
+from django.template.loader import render_to_string
+
+# Every email the platform sends: event -> subject (formatted with the context) and template name.
+# Each template has a plain text (.txt) and an HTML (.html) version under templates/emails/
+EMAIL_EVENTS = {
+    'welcome': {
+        'subject': "Welcome to Prisma, {first_name}",
+        'template': 'emails/welcome',
+    },
+    'payout_notice': {
+        'subject': "Your payout of £{total_amount} is on its way",
+        'template': 'emails/payout_notice',
+    },
+    'job_reminder': {
+        'subject': "Reminder: {service_type} at {appointment_time} tomorrow",
+        'template': 'emails/job_reminder',
+    },
+}
+
+
+def render_email(event, context):
+    """
+    Render the subject, plain text body and HTML body of an email.
+
+    Args:
+        event: Key of EMAIL_EVENTS
+        context: JSON serializable template context, as stored on the EmailLog
+
+    Returns:
+        tuple: (subject, text, html)
+    """
+    definition = EMAIL_EVENTS[event]
+    subject = definition['subject'].format(**context)
+    text = render_to_string(f"{definition['template']}.txt", context)
+    html = render_to_string(f"{definition['template']}.html", context)
+    return subject, text, html
@@ -0,0 +1,79 @@
+from datetime import timedelta
+from django.utils import timezone
+from ..catalog import service_name
+from ..models import Job, PayoutBatch
+from .sending import queue_email, queue_emails
+
+
+def queue_welcome_email(user):
+    """ Welcome a newly registered detailer, once per account """
+    return queue_email('welcome', user.email, {'first_name': user.first_name}, user=user)
+
+
+def queue_payout_notices(run):
+    """
+    Queue a payout notice for every batch of a completed payout run.
+
+    Keyed on the run id, so a re-run of the same week notifies nobody twice.
+
+    Returns:
+        int: Number of notices queued
+    """
+    batches = (
+        PayoutBatch.objects.filter(run=run, total_amount__gt=0)
+        .values_list('detailer__user_id', 'detailer__user__email', 'detailer__user__first_name', 'total_amount', 'earning_count')
+    )
+    return queue_emails(
+        {
+            'event': 'payout_notice',
+            'recipient': email,
+            'dedupe_key': run.run_id,
+            'user_id': user_id,
+            'context': {
+                'first_name': first_name,
+                'total_amount': f'{total_amount:.2f}',
+                'earning_count': earning_count,
+                'payout_date': run.payout_date.isoformat(),
+                'run_id': run.run_id,
+            },
+        }
+        for user_id, email, first_name, total_amount, earning_count in batches
+    )
+
+
+def queue_job_reminders(day=None):
+    """
+    Queue a reminder to the detailer of every accepted or pending job on the day (tomorrow by default).
+
+    Keyed on the job and its appointment time, so a rescheduled job is reminded again.
+
+    Returns:
+        int: Number of reminders queued
+    """
+    day = day or timezone.localdate() + timedelta(days=1)
+    jobs = (
+        Job.objects.filter(status__in=['pending', 'accepted'], detailer__isnull=False, appointment_start__isnull=False)
+        .on_day(day)
+        .values_list(
+            'pk', 'service_type_id', 'client_name', 'address', 'booking_reference', 'appointment_start',
+            'appointment_time', 'detailer__user_id', 'detailer__user__email', 'detailer__user__first_name',
+        )
+    )
+    return queue_emails(
+        {
+            'event': 'job_reminder',
+            'recipient': email,
+            'dedupe_key': f'job:{job_id}:{appointment_start.isoformat()}',
+            'user_id': user_id,
+            'context': {
+                'first_name': first_name,
+                'service_type': service_name(service_type_id),
+                'client_name': client_name,
+                'address': address,
+                'booking_reference': booking_reference,
+                'appointment_time': appointment_time.strftime('%H:%M'),
+            },
+        }
+        for (job_id, service_type_id, client_name, address, booking_reference, appointment_start,
+             appointment_time, user_id, email, first_name) in jobs
+    )
@@ -0,0 +1,179 @@
+import smtplib
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from ..models import EmailLog
+from .messages import EMAIL_EVENTS, render_email
+
+# Mail backend connection of this worker process, opened on the first batch and kept open between
+# batches so each email doesn't pay for a TCP + TLS handshake and an SMTP login
+_connection = None
+
+# Errors that mean the connection itself is gone, the email is retried once on a fresh one
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+
+def get_worker_connection():
+    global _connection
+    if _connection is None:
+        _connection = get_connection(fail_silently=False)
+        _connection.open()
+    return _connection
+
+
+def close_worker_connection():
+    global _connection
+    if _connection is not None:
+        try:
+            _connection.close()
+        except Exception:
+            pass
+        _connection = None
+
+
+def _schedule_send():
+    # Imported here, the task module imports this one
+    from ..task import send_queued_emails
+    # Often run inside the request that queued the email, like a signup: a broker outage fails at once
+    # rather than holding the request up with publish retries, the send-queued-emails sweep sends the rows
+    send_queued_emails.apply_async(countdown=settings.EMAIL_BATCH_DELAY, retry_policy={'max_retries': 0})
+
+
+def queue_emails(emails):
+    """
+    Queue emails to be sent by the celery worker, skipping the ones already queued or sent.
+
+    Args:
+        emails: Iterable of dicts with event, recipient, context and optionally dedupe_key and user_id.
+            The dedupe_key tells apart the emails of one event to one recipient, e.g. the payout
+            run id, leave it empty for one off emails like the welcome
+
+    Returns:
+        int: Number of emails queued, duplicates excluded
+    """
+    logs = []
+    for email in emails:
+        if email['event'] not in EMAIL_EVENTS:
+            raise ValueError(f"Unknown email event {email['event']!r}")
+        logs.append(EmailLog(
+            event=email['event'],
+            recipient=email['recipient'],
+            dedupe_key=email.get('dedupe_key', ''),
+            user_id=email.get('user_id'),
+            context=email['context'],
+        ))
+    if not logs:
+        return 0
+    keys = {(log.event, log.recipient, log.dedupe_key) for log in logs}
+    existing = set(
+        EmailLog.objects.filter(
+            event__in={key[0] for key in keys},
+            recipient__in={key[1] for key in keys},
+        ).values_list('event', 'recipient', 'dedupe_key')
+    )
+    new_logs = [log for log in logs if (log.event, log.recipient, log.dedupe_key) not in existing]
+    # ignore_conflicts covers the same email queued concurrently by another process
+    EmailLog.objects.bulk_create(new_logs, ignore_conflicts=True, batch_size=500)
+    if new_logs:
+        # Sent once the rows are committed, a broker outage leaves them to the periodic sweep
+        transaction.on_commit(_schedule_send, robust=True)
+    return len(new_logs)
+
+
+def queue_email(event, recipient, context, dedupe_key='', user=None):
+    """ Queue a single email, see queue_emails. Returns True when it was queued, False for a duplicate """
+    return bool(queue_emails([{
+        'event': event,
+        'recipient': recipient,
+        'context': context,
+        'dedupe_key': dedupe_key,
+        'user_id': user.pk if user else None,
+    }]))
+
+
+def claim_due_emails(batch_size):
+    """ Claim up to batch_size due emails for this worker, emails stuck in a crashed worker are claimed again """
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    claimable = (
+        Q(status='queued', next_attempt_at__lte=now)
+        | Q(status='sending', claimed_at__lt=now - timedelta(seconds=settings.EMAIL_CLAIM_TIMEOUT))
+    )
+    ids = list(EmailLog.objects.filter(claimable).order_by('next_attempt_at').values_list('pk', flat=True)[:batch_size])
+    if not ids:
+        return []
+    # Filtering on claimable again makes the claim atomic, ids another worker claimed first are skipped
+    EmailLog.objects.filter(claimable, pk__in=ids).update(status='sending', claim_token=token, claimed_at=now)
+    return list(EmailLog.objects.filter(claim_token=token, status='sending').order_by('pk'))
+
+
+def _message(log, connection):
+    subject, text, html = render_email(log.event, log.context)
+    message = EmailMultiAlternatives(subject, text, settings.DEFAULT_FROM_EMAIL, [log.recipient], connection=connection)
+    message.attach_alternative(html, 'text/html')
+    return message
+
+
+def _retry_delay(attempts):
+    """ Exponential backoff: EMAIL_RETRY_BACKOFF seconds after the first failure, doubling up to EMAIL_RETRY_BACKOFF_MAX """
+    return min(settings.EMAIL_RETRY_BACKOFF * 2 ** (attempts - 1), settings.EMAIL_RETRY_BACKOFF_MAX)
+
+
+def send_queued_batch(batch_size=None):
+    """
+    Send one batch of due emails over this worker's mail connection.
+
+    A failed email is rescheduled with exponential backoff and marked failed after EMAIL_MAX_ATTEMPTS,
+    without holding up the rest of the batch. A dropped connection is reopened once per email.
+
+    Returns:
+        tuple: (sent, failed) counts of the batch
+    """
+    logs = claim_due_emails(batch_size or settings.EMAIL_BATCH_SIZE)
+    sent = failed = 0
+    for log in logs:
+        error = None
+        for attempt in range(2):
+            try:
+                _message(log, get_worker_connection()).send()
+                error = None
+                break
+            except CONNECTION_ERRORS as e:
+                close_worker_connection()
+                error = e
+            except Exception as e:
+                error = e
+                break
+
+        # Recorded right away, a worker dying mid-batch must not leave a sent email to be claimed again
+        now = timezone.now()
+        if error is None:
+            EmailLog.objects.filter(pk=log.pk).update(status='sent', sent_at=now, claim_token='', last_error='')
+            sent += 1
+            continue
+        attempts = log.attempts + 1
+        EmailLog.objects.filter(pk=log.pk).update(
+            status='failed' if attempts >= settings.EMAIL_MAX_ATTEMPTS else 'queued',
+            attempts=attempts,
+            next_attempt_at=now + timedelta(seconds=_retry_delay(attempts)),
+            claim_token='',
+            last_error=f"{type(error).__name__}: {error}"[:1000],
+        )
+        failed += 1
+    return sent, failed
+
+
+def send_queued_emails(max_batches=20):
+    """ Send due emails batch after batch until none is left or max_batches were sent """
+    totals = [0, 0]
+    for _ in range(max_batches):
+        sent, failed = send_queued_batch()
+        totals[0] += sent
+        totals[1] += failed
+        if sent + failed < settings.EMAIL_BATCH_SIZE:
+            break
+    return tuple(totals)
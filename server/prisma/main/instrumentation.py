@@ -0,0 +1,89 @@
+import time
+from contextlib import ExitStack, contextmanager
+from django.db import connections
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper recording the queries run inside a block.
+
+    Usage:
+        recorder = QueryRecorder()
+        with recorder.record():
+            ...
+        recorder.count, recorder.duration
+    """
+    def __init__(self, capture_sql=False):
+        self.capture_sql = capture_sql
+        self.count = 0
+        self.duration = 0.0
+        self.queries = []
+        self.started = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.duration += elapsed
+            if self.capture_sql:
+                self.queries.append({
+                    'alias': context['connection'].alias,
+                    'sql': sql,
+                    'offset': start - self.started,
+                    'duration': elapsed,
+                })
+
+    @contextmanager
+    def record(self):
+        """ Wrap every configured database connection for the duration of the block """
+        self.started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+
+def resolve_action(request):
+    """
+    Find the view class and dispatched action of a request routed through an action_handler view.
+
+    Returns:
+        tuple: (view_class, action), either may be None when the request wasn't routed to one
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None, None
+    view_class = getattr(match.func, 'view_class', None)
+    action = match.kwargs.get('action')
+    if view_class is None or action not in getattr(view_class, 'action_handler', {}):
+        return view_class, None
+    return view_class, action
+
+
+def action_label(view_class, action):
+    """ Stable name of an action, e.g. "DashboardView.get_quick_stats" """
+    return f"{view_class.__name__}.{action}"
+
+
+def action_budget(view_class, action):
+    """ Query budget declared by the view for an action, None when it doesn't declare one """
+    return getattr(view_class, 'query_budgets', {}).get(action)
+
+
+def request_label(request):
+    """
+    Bounded name of what a request hit, used as the metrics action label.
+
+    Requests dispatched through an action_handler view are named after the action, other routed
+    requests after their url name, anything unrouted is grouped under "unmatched".
+    """
+    view_class, action = resolve_action(request)
+    if action:
+        return action_label(view_class, action)
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.url_name or match.view_name or 'unnamed'
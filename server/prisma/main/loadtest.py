@@ -0,0 +1,344 @@
+import asyncio
+import json
+import random
+import ssl
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+from urllib.parse import urlencode, urlsplit
+
+API_PREFIX = '/api/v1'
+
+# action: (method, path, relative weight)
+ACTIONS = {
+    'get_timeslots': ('GET', '/availability/get_timeslots/', 40),
+    'get_today_overview': ('GET', '/dashboard/get_today_overview/', 20),
+    'get_quick_stats': ('GET', '/dashboard/get_quick_stats/', 20),
+    'get_recent_jobs': ('GET', '/dashboard/get_recent_jobs/', 15),
+    'create_new_user': ('POST', '/onboard/create_new_user/', 5),
+}
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def parse_mix(spec):
+    """ Parse "get_timeslots:40,get_quick_stats:20" into {action: weight}, unknown actions raise ValueError """
+    mix = {}
+    for part in spec.split(','):
+        name, _, weight = part.partition(':')
+        name = name.strip()
+        if not name:
+            continue
+        if name not in ACTIONS:
+            raise ValueError(f"Unknown action {name!r}, expected one of {', '.join(ACTIONS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values, percent):
+    """ Nearest rank percentile of an already sorted list """
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * percent // 100))
+    return sorted_values[int(rank) - 1]
+
+
+class HTTPConnection:
+    """ Minimal keep-alive HTTP/1.1 client connection over asyncio streams """
+    def __init__(self, host, port, use_ssl, timeout):
+        self.host = host
+        self.port = port
+        self.ssl = ssl.create_default_context() if use_ssl else None
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except (ConnectionError, ssl.SSLError):
+                pass
+        self.reader = self.writer = None
+
+    async def request(self, method, path, headers=None, body=None):
+        """ Send one request, reconnecting once when a kept alive connection was closed by the server """
+        for attempt in range(2):
+            reused = self.writer is not None
+            try:
+                return await asyncio.wait_for(self._request(method, path, headers or {}, body), self.timeout)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                await self.close()
+                if not reused or attempt:
+                    raise
+            except BaseException:
+                await self.close()
+                raise
+
+    async def _request(self, method, path, headers, body):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl)
+
+        lines = [f'{method} {path} HTTP/1.1', f'Host: {self.host}:{self.port}', 'Connection: keep-alive']
+        lines += [f'{name}: {value}' for name, value in headers.items()]
+        lines.append(f'Content-Length: {len(body) if body else 0}')
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + (body or b''))
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Connection closed by the server")
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        if response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+            response_body = b''.join(chunks)
+        elif 'content-length' in response_headers:
+            response_body = await self.reader.readexactly(int(response_headers['content-length']))
+        else:
+            response_body = await self.reader.read()
+            await self.close()
+
+        if response_headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return status, response_body
+
+
+class LoadTest:
+    """
+    Log in a set of users, then drive a weighted mix of actions at a target request rate.
+
+    Only the standard library is used so it runs from any machine, against runserver, gunicorn
+    or an ASGI server. Requests follow an open loop: they are scheduled at the target rate whether
+    or not earlier ones finished, and latency is measured from the scheduled time, so a saturated
+    server shows up as growing latency rather than a quietly lower request rate.
+
+    Args:
+        url: Base url of the deployment, e.g. http://127.0.0.1:8000 (a path prefix is kept)
+        credentials: List of (email, password) used to log in, requests rotate across them
+        mix: {action: weight}, defaults to the weights in ACTIONS
+        rps: Target requests per second
+        duration: Seconds to generate load for
+        concurrency: Maximum number of open connections
+        timeout: Per request timeout in seconds
+        seed: Random seed picking the actions, users and parameters
+    """
+    def __init__(self, url, credentials, mix=None, rps=20, duration=30, concurrency=50, timeout=30, seed=0):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.use_ssl = parts.scheme == 'https'
+        self.port = parts.port or (443 if self.use_ssl else 80)
+        self.prefix = parts.path.rstrip('/') + API_PREFIX
+        self.credentials = credentials
+        self.mix = mix or {action: weight for action, (_, _, weight) in ACTIONS.items()}
+        self.rps = rps
+        self.duration = duration
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.rng = random.Random(seed)
+        self.sessions = []
+        self.results = defaultdict(list)  # action: [(latency, status)]
+        self.pool = None
+        self.run_id = uuid.uuid4().hex[:8]
+        self.onboarded = 0
+
+    def connection(self):
+        return HTTPConnection(self.host, self.port, self.use_ssl, self.timeout)
+
+    async def _send(self, connection, method, path, token=None, params=None, payload=None):
+        headers = {'Accept': 'application/json'}
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        body = None
+        if payload is not None:
+            body = json.dumps(payload).encode()
+            headers['Content-Type'] = 'application/json'
+        if params:
+            path = f'{path}?{urlencode(params)}'
+        return await connection.request(method, self.prefix + path, headers, body)
+
+    async def login(self):
+        """ Log every user in through authentication/login/ and keep their access token and location """
+        connection = self.connection()
+        try:
+            for email, password in self.credentials:
+                start = time.perf_counter()
+                status, body = await self._send(
+                    connection, 'POST', '/authentication/login/', payload={'email': email, 'password': password},
+                )
+                self.results['login'].append((time.perf_counter() - start, status))
+                if status != 200:
+                    raise RuntimeError(f"Login failed for {email} with status {status}: {body[:200]!r}")
+                data = json.loads(body)
+                self.sessions.append({
+                    'token': data['access'],
+                    'city': data['user'].get('city') or 'London',
+                    'country': data['user'].get('country') or 'UK',
+                })
+        finally:
+            await connection.close()
+
+    def build_request(self, action):
+        """ Method, path, query params and body of one request of an action """
+        method, path, _ = ACTIONS[action]
+        session = self.rng.choice(self.sessions)
+        if action == 'get_timeslots':
+            day = date.today() + timedelta(days=self.rng.randrange(14))
+            params = {
+                'date': day.isoformat(),
+                'service_duration': self.rng.choice([45, 60, 90, 120]),
+                'city': session['city'],
+                'country': session['country'],
+            }
+            return method, path, session['token'], params, None
+        if action == 'create_new_user':
+            self.onboarded += 1
+            number = self.onboarded
+            email = f'load-{self.run_id}-{number}@example.com'
+            credentials = {
+                'email': email,
+                'password': 'loadtest-pass-123',
+                'first_name': 'Load',
+                'last_name': f'Test{number}',
+                'phone': f'8{int(self.run_id, 16) % 10 ** 6:06d}{number:07d}',
+                'address': f'{number} Load Street',
+                'city': session['city'],
+                'postcode': 'LT1 1AA',
+                'country': session['country'],
+            }
+            return method, path, None, None, {'credentials': credentials}
+        return method, path, session['token'], None, None
+
+    async def fire(self, action, scheduled_at):
+        method, path, token, params, payload = self.build_request(action)
+        connection = await self.pool.get()
+        try:
+            status, _ = await self._send(connection, method, path, token, params, payload)
+        except asyncio.TimeoutError:
+            status = 'timeout'
+        except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+            status = type(e).__name__
+        finally:
+            self.pool.put_nowait(connection)
+        # Measured from the scheduled time so queueing behind a slow server counts as latency
+        self.results[action].append((time.perf_counter() - scheduled_at, status))
+
+    async def generate(self):
+        self.pool = asyncio.Queue()
+        for _ in range(self.concurrency):
+            self.pool.put_nowait(self.connection())
+
+        actions = list(self.mix)
+        weights = list(self.mix.values())
+        total = int(self.rps * self.duration)
+        tasks = []
+        started = time.perf_counter()
+        for number in range(total):
+            scheduled_at = started + number / self.rps
+            delay = scheduled_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            action = self.rng.choices(actions, weights=weights)[0]
+            tasks.append(asyncio.create_task(self.fire(action, scheduled_at)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+        while not self.pool.empty():
+            await self.pool.get_nowait().close()
+        return elapsed
+
+    async def run(self):
+        await self.login()
+        elapsed = await self.generate()
+        return self.report(elapsed)
+
+    def _summary(self, samples, elapsed):
+        latencies = sorted(latency for latency, _ in samples)
+        statuses = Counter(str(status) for _, status in samples)
+        errors = sum(count for status, count in statuses.items() if not (status.isdigit() and int(status) < 400))
+        summary = {
+            'requests': len(samples),
+            'throughput': round(len(samples) / elapsed, 2) if elapsed else None,
+            'errors': errors,
+            'error_rate': round(errors / len(samples), 4) if samples else 0,
+            'status_codes': dict(statuses),
+            'latency_ms': {
+                'mean': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else None,
+                'max': round(latencies[-1] * 1000, 2) if latencies else None,
+            },
+        }
+        for percent in PERCENTILES:
+            value = percentile(latencies, percent)
+            summary['latency_ms'][f'p{percent}'] = round(value * 1000, 2) if value is not None else None
+        return summary
+
+    def report(self, elapsed):
+        load_samples = [sample for action, samples in self.results.items() if action != 'login' for sample in samples]
+        return {
+            'url': f"{'https' if self.use_ssl else 'http'}://{self.host}:{self.port}{self.prefix}",
+            'target_rps': self.rps,
+            'duration': round(elapsed, 2),
+            'users': len(self.sessions),
+            'concurrency': self.concurrency,
+            'mix': self.mix,
+            'total': self._summary(load_samples, elapsed),
+            'actions': {
+                action: self._summary(samples, elapsed)
+                for action, samples in sorted(self.results.items()) if action != 'login'
+            },
+            'login': self._summary(self.results['login'], elapsed) if self.results['login'] else None,
+        }
+
+
+def compare_reports(baseline, current, tolerance=0.1):
+    """
+    Compare two load test reports action by action.
+
+    An action regresses when its p95 latency grows by more than tolerance (a fraction), or when
+    its error rate goes up.
+
+    Returns:
+        tuple: (rows, regressions) where rows are per action dicts of the baseline and current
+        p50/p95/throughput/error rate and regressions is the list of regressed action names
+    """
+    rows, regressions = [], []
+    names = ['total'] + sorted(set(baseline['actions']) | set(current['actions']))
+    for name in names:
+        before = baseline['total'] if name == 'total' else baseline['actions'].get(name)
+        after = current['total'] if name == 'total' else current['actions'].get(name)
+        if not before or not after:
+            continue
+        row = {'action': name}
+        for key, value_of in (
+            ('p50', lambda summary: summary['latency_ms']['p50']),
+            ('p95', lambda summary: summary['latency_ms']['p95']),
+            ('throughput', lambda summary: summary['throughput']),
+            ('error_rate', lambda summary: summary['error_rate']),
+        ):
+            row[key] = (value_of(before), value_of(after))
+        p95_before, p95_after = row['p95']
+        if (p95_before and p95_after and p95_after > p95_before * (1 + tolerance)) or after['error_rate'] > before['error_rate']:
+            regressions.append(name)
+        rows.append(row)
+    return rows, regressions
+
+
+def run_load_test(**options):
+    """ Run a LoadTest to completion and return its report """
+    return asyncio.run(LoadTest(**options).run())
@@ -0,0 +1,67 @@
+import copy
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.utils import load_backend
+
+
+def _strategies(settings_dict):
+    """ Connection settings to compare, derived from the configured default database """
+    base = copy.deepcopy(settings_dict)
+    base['OPTIONS'].pop('pool', None)
+    strategies = {
+        'new connection per request': {**base, 'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False},
+        'persistent + health checks': {**base, 'CONN_MAX_AGE': 600, 'CONN_HEALTH_CHECKS': True},
+    }
+    if base['ENGINE'] == 'django.db.backends.postgresql':
+        pool = settings_dict['OPTIONS'].get('pool')
+        strategies['psycopg pool'] = {
+            **base,
+            'CONN_MAX_AGE': 0,
+            'OPTIONS': {**base['OPTIONS'], 'pool': pool if isinstance(pool, dict) else {'min_size': 1, 'max_size': 4}},
+        }
+    return strategies
+
+
+def run_requests(wrapper, requests, query):
+    """ Run a request cycle per iteration: check the connection in, run the query, release it like request_finished does """
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        wrapper.close_if_unusable_or_obsolete()
+        with wrapper.cursor() as cursor:
+            cursor.execute(query)
+            cursor.fetchall()
+        wrapper.close_if_unusable_or_obsolete()
+        timings.append(time.perf_counter() - start)
+    wrapper.close()
+    if getattr(wrapper, 'pool', None) is not None:
+        wrapper.close_pool()
+    return sorted(timings)
+
+
+class Command(BaseCommand):
+    help = "Compare per request connections, persistent connections and the psycopg pool on the configured database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--query', default="SELECT 1", help="Query run by each simulated request")
+
+    def handle(self, *args, **options):
+        settings_dict = connections.settings[DEFAULT_DB_ALIAS]
+        if options['requests'] < 1:
+            raise CommandError("--requests must be at least 1")
+        if settings_dict['ENGINE'] != 'django.db.backends.postgresql':
+            self.stdout.write(self.style.WARNING("Not on PostgreSQL, set DATABASE_ENGINE=postgresql for meaningful numbers"))
+
+        backend = load_backend(settings_dict['ENGINE'])
+        baseline = None
+        for name, strategy_settings in _strategies(settings_dict).items():
+            wrapper = backend.DatabaseWrapper(strategy_settings, alias=f"bench_{name.split()[0]}")
+            timings = run_requests(wrapper, options['requests'], options['query'])
+            mean = sum(timings) / len(timings)
+            baseline = baseline or mean
+            self.stdout.write(
+                f"{name:<28} mean {mean * 1000:7.3f} ms   p50 {timings[len(timings) // 2] * 1000:7.3f} ms   "
+                f"p99 {timings[int(len(timings) * 0.99)] * 1000:7.3f} ms   x{baseline / mean:.1f}"
+            )
@@ -0,0 +1,66 @@
+import random
+import time
+from datetime import datetime, time as day_time, timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from main.services.dispatch import plan_assignments
+
+# City centres the synthetic fleet is spread around
+CITIES = {
+    'London': (51.5072, -0.1276),
+    'Manchester': (53.4808, -2.2426),
+    'Birmingham': (52.4862, -1.8904),
+    'Leeds': (53.8008, -1.5491),
+    'Glasgow': (55.8642, -4.2518),
+}
+
+
+def _near(centre, spread_km, rng):
+    return centre[0] + rng.uniform(-1, 1) * spread_km / 111, centre[1] + rng.uniform(-1, 1) * spread_km / 70
+
+
+def morning(jobs, detailers, booked_per_detailer, seed=0):
+    """ A morning's worth of pending jobs between 7 and 12 and the fleet they are dispatched to """
+    rng = random.Random(seed)
+    day = timezone.localdate() + timedelta(days=1)
+    names = list(CITIES)
+
+    def window(hour, minute, duration):
+        start = timezone.make_aware(datetime.combine(day, day_time(hour, minute)))
+        return start, start + timedelta(minutes=duration)
+
+    job_rows = []
+    for job_id in range(jobs):
+        city = names[job_id % len(names)]
+        start, end = window(rng.randint(7, 11), rng.choice((0, 30)), rng.choice((45, 60, 90)))
+        job_rows.append((job_id, city, *_near(CITIES[city], 10, rng), start, end))
+
+    detailer_rows, booked = [], []
+    for detailer_id in range(detailers):
+        city = names[detailer_id % len(names)]
+        detailer_rows.append((detailer_id, city, *_near(CITIES[city], 15, rng), rng.uniform(3, 5), rng.randint(0, 8)))
+        for _ in range(booked_per_detailer):
+            booked.append((detailer_id, *window(rng.randint(6, 19), 0, 60)))
+    return job_rows, detailer_rows, booked
+
+
+class Command(BaseCommand):
+    help = "Time the dispatch scoring and assignment of a morning's worth of jobs across a synthetic fleet"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', type=int, default=500)
+        parser.add_argument('--detailers', type=int, default=300)
+        parser.add_argument('--booked', type=int, default=3, help="Jobs already booked per detailer")
+        parser.add_argument('--repeat', type=int, default=5, help="Runs, the best one is reported")
+
+    def handle(self, *args, **options):
+        jobs, detailers, booked = morning(options['jobs'], options['detailers'], options['booked'])
+        timings = []
+        for _ in range(options['repeat']):
+            start = time.perf_counter()
+            assignments = plan_assignments(jobs, detailers, booked, [])
+            timings.append(time.perf_counter() - start)
+        self.stdout.write(
+            f"{len(jobs)} jobs x {len(detailers)} detailers ({len(booked)} booked jobs): "
+            f"{len(assignments)} assigned in {min(timings) * 1000:.1f} ms (best of {options['repeat']})"
+        )
@@ -0,0 +1,85 @@
+import io
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from main.renderers import FastJSONParser, FastJSONRenderer, orjson
+
+
+def timeslots_payload(rows):
+    """ Shaped like AvailabilityView.get_timeslots over many detailers and days """
+    start = datetime(2025, 1, 1, 6, 0)
+    slots = []
+    for number in range(rows):
+        slot_start = start + timedelta(minutes=30 * (number % 30))
+        slots.append({
+            'start_time': slot_start.strftime('%H:%M'),
+            'end_time': (slot_start + timedelta(minutes=60)).strftime('%H:%M'),
+            'is_available': number % 3 != 0,
+        })
+    return {'slots': slots, 'date': date(2025, 1, 1), 'total_slots': rows}
+
+
+def job_feed_payload(rows):
+    """ Shaped like DashboardView.get_recent_jobs and the job/earning serializers, Decimal amounts included """
+    now = timezone.now()
+    return [
+        {
+            'id': number,
+            'booking_reference': f'PRS-{number:08d}',
+            'client_name': 'Jane Client',
+            'service_type': 'Full Valet',
+            'vehicle': 'Volkswagen Golf White',
+            'address': f'{number} High Street, London',
+            'status': 'completed',
+            'appointment_date': now - timedelta(hours=number),
+            'appointment_time': dt_time(9 + number % 9, 30),
+            'payout_date': date(2025, 1, 1) + timedelta(days=number % 28),
+            'gross_amount': Decimal('85.00'),
+            'commission': Decimal('12.75'),
+            'net_amount': Decimal('72.25'),
+            'rating': Decimal('4.50') if number % 2 else None,
+        }
+        for number in range(rows)
+    ]
+
+
+def best_of(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+class Command(BaseCommand):
+    help = "Compare DRF's stock JSON renderer and parser with the orjson backed ones on endpoint shaped payloads"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000, help="Slots or jobs per payload")
+        parser.add_argument('--repeat', type=int, default=20, help="Runs per measurement, the best one is reported")
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stdout.write(self.style.WARNING("orjson isn't installed, FastJSONRenderer falls back to the stdlib encoder"))
+
+        payloads = {
+            'get_timeslots': timeslots_payload(options['rows']),
+            'job_feed': job_feed_payload(options['rows']),
+        }
+        for name, payload in payloads.items():
+            stock_body = JSONRenderer().render(payload)
+            fast_body = FastJSONRenderer().render(payload)
+            stock_render = best_of(lambda: JSONRenderer().render(payload), options['repeat'])
+            fast_render = best_of(lambda: FastJSONRenderer().render(payload), options['repeat'])
+            stock_parse = best_of(lambda: JSONParser().parse(io.BytesIO(stock_body)), options['repeat'])
+            fast_parse = best_of(lambda: FastJSONParser().parse(io.BytesIO(stock_body)), options['repeat'])
+
+            self.stdout.write(f"{name} ({options['rows']} rows, {len(stock_body) / 1024:.0f} KiB)")
+            self.stdout.write(f"  render  stock {stock_render * 1000:8.2f} ms   fast {fast_render * 1000:8.2f} ms   x{stock_render / fast_render:.1f}")
+            self.stdout.write(f"  parse   stock {stock_parse * 1000:8.2f} ms   fast {fast_parse * 1000:8.2f} ms   x{stock_parse / fast_parse:.1f}")
+            self.stdout.write(f"  identical output: {'yes' if stock_body == fast_body else 'no'}")
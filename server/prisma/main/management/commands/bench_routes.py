@@ -0,0 +1,65 @@
+import random
+import statistics
+import time
+from datetime import datetime, time as day_time, timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from main.services.routes import plan_route
+
+# Central London, the synthetic stops are spread around it
+CENTRE = (51.5072, -0.1276)
+
+
+def synthetic_day(stops, spread_km, service_minutes, rng):
+    """ Stops scattered around the centre, booked on the half hour between 8:00 and 18:00 """
+    day = timezone.localdate()
+    rows = []
+    for stop_id in range(stops):
+        start = timezone.make_aware(datetime.combine(day, day_time(8, 0)) + timedelta(minutes=30 * rng.randint(0, 20)))
+        rows.append((
+            stop_id,
+            CENTRE[0] + rng.uniform(-1, 1) * spread_km / 111,
+            CENTRE[1] + rng.uniform(-1, 1) * spread_km / 70,
+            start,
+            start + timedelta(minutes=service_minutes),
+        ))
+    return rows
+
+
+class Command(BaseCommand):
+    help = "Time the route planning of synthetic days and compare their length with the appointment order"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stops', type=int, default=30, help="Stops per day")
+        parser.add_argument('--days', type=int, default=50, help="Days to plan")
+        parser.add_argument('--spread', type=float, default=3, help="Distance of the stops from the centre, in km")
+        parser.add_argument('--service-minutes', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        timings, optimised, appointment_order, late, appointment_order_late = [], 0.0, 0.0, 0.0, 0.0
+        for _ in range(options['days']):
+            stops = synthetic_day(options['stops'], options['spread'], options['service_minutes'], rng)
+            start = time.perf_counter()
+            route = plan_route(stops, start=CENTRE)
+            timings.append(time.perf_counter() - start)
+            optimised += route['distance_km']
+            appointment_order += route['appointment_order_km']
+            late += route['late_minutes']
+            appointment_order_late += route['appointment_order_late_minutes']
+
+        days = options['days']
+        self.stdout.write(f"{days} days of {options['stops']} stops")
+        self.stdout.write(
+            f"  planning  mean {statistics.mean(timings) * 1000:.1f} ms   "
+            f"p95 {sorted(timings)[int(days * 0.95) - 1] * 1000:.1f} ms   max {max(timings) * 1000:.1f} ms"
+        )
+        self.stdout.write(
+            f"  distance  {optimised / days:.1f} km a day, {appointment_order / days:.1f} km in appointment order "
+            f"({(1 - optimised / appointment_order) * 100:.0f}% less)"
+        )
+        self.stdout.write(
+            f"  late      {late / days:.1f} minutes a day past the arrival windows, "
+            f"{appointment_order_late / days:.1f} in appointment order"
+        )
@@ -0,0 +1,105 @@
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Python's sqlite3 defaults, what DATABASES used before the tuning: rollback journal, full sync, deferred transactions
+STOCK_CONFIG = {'timeout': 5, 'transaction_mode': 'DEFERRED', 'init_command': 'PRAGMA journal_mode=DELETE'}
+
+
+def _configured():
+    options = settings.DATABASES['default'].get('OPTIONS', {})
+    return {
+        'timeout': options.get('timeout', 5),
+        'transaction_mode': options.get('transaction_mode') or 'DEFERRED',
+        'init_command': options.get('init_command', ''),
+    }
+
+
+def _connect(path, config):
+    connection = sqlite3.connect(path, timeout=config['timeout'], isolation_level=None)
+    for command in config['init_command'].split(';'):
+        if command.strip():
+            connection.execute(command)
+    return connection
+
+
+def _writer(path, config, duration, results):
+    """ Book jobs like the web server and celery worker do: read the detailer's load, insert, bump a total """
+    connection = _connect(path, config)
+    commits, locked, latencies = 0, 0, []
+    deadline = time.perf_counter() + duration
+    detailer_id = os.getpid() % 50
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            connection.execute(f"BEGIN {config['transaction_mode']}")
+            connection.execute("SELECT COUNT(*) FROM job WHERE detailer_id = ?", (detailer_id,)).fetchone()
+            connection.execute("INSERT INTO job (detailer_id, amount) VALUES (?, ?)", (detailer_id, 25))
+            connection.execute("UPDATE detailer SET total = total + 25 WHERE id = ?", (detailer_id,))
+            connection.execute("COMMIT")
+            commits += 1
+            latencies.append(time.perf_counter() - start)
+        except sqlite3.OperationalError as e:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            if 'locked' not in str(e) and 'busy' not in str(e):
+                raise
+            locked += 1
+    connection.close()
+    results.put((commits, locked, latencies))
+
+
+def run_benchmark(config, writers, duration):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.sqlite3')
+        setup = _connect(path, config)
+        setup.execute("CREATE TABLE detailer (id INTEGER PRIMARY KEY, total INTEGER NOT NULL DEFAULT 0)")
+        setup.execute("CREATE TABLE job (id INTEGER PRIMARY KEY, detailer_id INTEGER NOT NULL, amount INTEGER NOT NULL)")
+        setup.execute("CREATE INDEX job_detailer_idx ON job (detailer_id)")
+        setup.executemany("INSERT INTO detailer (id) VALUES (?)", [(number,) for number in range(50)])
+        setup.close()
+
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=_writer, args=(path, config, duration, results))
+            for _ in range(writers)
+        ]
+        for process in processes:
+            process.start()
+        outcomes = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+    commits = sum(outcome[0] for outcome in outcomes)
+    locked = sum(outcome[1] for outcome in outcomes)
+    latencies = sorted(latency for outcome in outcomes for latency in outcome[2])
+    return {
+        'commits_per_second': commits / duration,
+        'locked_errors': locked,
+        'p50_ms': latencies[len(latencies) // 2] * 1000 if latencies else None,
+        'p99_ms': latencies[int(len(latencies) * 0.99)] * 1000 if latencies else None,
+    }
+
+
+class Command(BaseCommand):
+    help = "Compare concurrent SQLite write throughput with the stock and the configured connection settings"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=4, help="Concurrent writer processes, e.g. web server + 3 celery workers")
+        parser.add_argument('--duration', type=float, default=5, help="Seconds per run")
+
+    def handle(self, *args, **options):
+        runs = [('stock', STOCK_CONFIG), ('configured', _configured())]
+        for name, config in runs:
+            result = run_benchmark(config, options['writers'], options['duration'])
+            self.stdout.write(
+                f"{name:<11} {result['commits_per_second']:9.0f} commits/s   "
+                f"{result['locked_errors']:6d} locked errors   "
+                f"p50 {result['p50_ms'] or 0:7.2f} ms   p99 {result['p99_ms'] or 0:7.2f} ms"
+            )
+        if not settings.DATABASES['default'].get('OPTIONS'):
+            self.stdout.write(self.style.WARNING("SQLITE_TUNING is off, both runs use the stock settings"))
@@ -0,0 +1,28 @@
+import time
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from main.services.dispatch import dispatch_pending_jobs
+
+
+class Command(BaseCommand):
+    help = "Assign the upcoming pending jobs without a detailer to the best scoring free detailer"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--day', help="Only dispatch the jobs of a day, in YYYY-MM-DD format")
+        parser.add_argument('--batch-size', type=int, help="Jobs per transaction, defaults to DISPATCH_BATCH_SIZE")
+
+    def handle(self, *args, **options):
+        day = None
+        if options['day']:
+            try:
+                day = datetime.strptime(options['day'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError("Invalid day format. Use YYYY-MM-DD")
+
+        start = time.perf_counter()
+        totals = dispatch_pending_jobs(day=day, batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Assigned {totals['assigned']} jobs in {totals['batches']} batches, "
+            f"{totals['unassigned']} without an eligible detailer ({elapsed * 1000:.0f} ms)"
+        ))
@@ -0,0 +1,74 @@
+import sys
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from main.models import Earning
+from main.routers import replica_reads
+from main.services.exports import (
+    DEFAULT_CHUNK_SIZE, earnings_export_queryset, iter_export_rows, iter_record_batches, stream_arrow, stream_csv,
+)
+
+
+class Command(BaseCommand):
+    help = "Export earnings joined with their job and detailer as CSV, Arrow IPC or Parquet"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=['csv', 'arrow', 'parquet'], default='csv')
+        parser.add_argument('--output', help="Output file, defaults to stdout (required for parquet)")
+        parser.add_argument('--start-date', help="First day of the creation date range, YYYY-MM-DD")
+        parser.add_argument('--end-date', help="Last day of the creation date range, YYYY-MM-DD")
+        parser.add_argument('--status', choices=[key for key, _ in Earning.PAYMENT_STATUS])
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def _parse_date(self, value):
+        if not value:
+            return None
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError("Invalid date format. Use YYYY-MM-DD")
+
+    def handle(self, *args, **options):
+        queryset = earnings_export_queryset(
+            self._parse_date(options['start_date']),
+            self._parse_date(options['end_date']),
+            options['status'],
+        )
+        with replica_reads() as alias:
+            rows = iter_export_rows(queryset.using(alias), options['chunk_size'])
+        file_format = options['format']
+
+        try:
+            if file_format == 'parquet':
+                if not options['output']:
+                    raise CommandError("--output is required for the parquet format")
+                self._write_parquet(rows, options['output'], options['chunk_size'])
+            elif file_format == 'arrow':
+                self._write(stream_arrow(rows, options['chunk_size']), options['output'], binary=True)
+            else:
+                self._write(stream_csv(rows), options['output'], binary=False)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+    def _write(self, chunks, output, binary):
+        if output:
+            with open(output, 'wb' if binary else 'w', newline=None if binary else '') as handle:
+                for chunk in chunks:
+                    handle.write(chunk)
+        else:
+            stream = sys.stdout.buffer if binary else sys.stdout
+            for chunk in chunks:
+                stream.write(chunk)
+            stream.flush()
+
+    def _write_parquet(self, rows, output, chunk_size):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise CommandError("The parquet format requires pyarrow to be installed")
+        writer = None
+        for batch in iter_record_batches(rows, chunk_size):
+            if writer is None:
+                writer = pq.ParquetWriter(output, batch.schema)
+            writer.write_batch(batch)
+        if writer is not None:
+            writer.close()
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from main.services.earnings import generate_missing_earnings
+
+
+class Command(BaseCommand):
+    help = "Create the earning record of every completed job that does not have one yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--limit', type=int, help="Maximum number of earnings to create in this run")
+
+    def handle(self, *args, **options):
+        created = generate_missing_earnings(batch_size=options['batch_size'], limit=options['limit'])
+        self.stdout.write(self.style.SUCCESS(f"Created {created} earnings for completed jobs"))
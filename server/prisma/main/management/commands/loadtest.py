@@ -0,0 +1,75 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from main.loadtest import ACTIONS, compare_reports, parse_mix, run_load_test
+from main.services.seed import SEED_PASSWORD
+
+
+class Command(BaseCommand):
+    help = "Drive a weighted mix of API actions at a target request rate and report latency percentiles as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help="Base url of the deployment under test")
+        parser.add_argument('--user', action='append', default=[], help="email:password to log in with, repeatable")
+        parser.add_argument('--seed-users', type=int, default=0, help="Log in as the first N users created by seed_data")
+        parser.add_argument('--seed', type=int, default=42, help="Seed used by seed_data and for the request mix")
+        parser.add_argument(
+            '--mix',
+            default=','.join(f'{action}:{weight}' for action, (_, _, weight) in ACTIONS.items()),
+            help="Weighted actions, e.g. get_timeslots:40,get_quick_stats:20",
+        )
+        parser.add_argument('--rps', type=float, default=20)
+        parser.add_argument('--duration', type=float, default=30, help="Seconds of load")
+        parser.add_argument('--concurrency', type=int, default=50, help="Maximum open connections")
+        parser.add_argument('--timeout', type=float, default=30, help="Per request timeout in seconds")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout")
+        parser.add_argument('--compare', help="Baseline report to compare against, exits with status 1 on a regression")
+        parser.add_argument('--tolerance', type=float, default=0.1, help="Allowed p95 growth over the baseline, as a fraction")
+
+    def handle(self, *args, **options):
+        credentials = []
+        for user in options['user']:
+            email, _, password = user.partition(':')
+            credentials.append((email, password))
+        credentials += [
+            (f"seed{options['seed']}.detailer{number}@example.com", SEED_PASSWORD)
+            for number in range(options['seed_users'])
+        ]
+        if not credentials:
+            raise CommandError("Pass --user email:password or --seed-users N to log in")
+        try:
+            mix = parse_mix(options['mix'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        try:
+            report = run_load_test(
+                url=options['url'],
+                credentials=credentials,
+                mix=mix,
+                rps=options['rps'],
+                duration=options['duration'],
+                concurrency=options['concurrency'],
+                timeout=options['timeout'],
+                seed=options['seed'],
+            )
+        except (OSError, RuntimeError) as e:
+            raise CommandError(f"Load test failed: {e}")
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                handle.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+        if options['compare']:
+            with open(options['compare']) as handle:
+                baseline = json.load(handle)
+            rows, regressions = compare_reports(baseline, report, options['tolerance'])
+            self.stderr.write(f"{'action':<22}{'p50 ms':>22}{'p95 ms':>22}{'rps':>18}{'errors':>18}")
+            for row in rows:
+                cells = [f"{before} -> {after}" for before, after in (row['p50'], row['p95'], row['throughput'], row['error_rate'])]
+                self.stderr.write(f"{row['action']:<22}{cells[0]:>22}{cells[1]:>22}{cells[2]:>18}{cells[3]:>18}")
+            if regressions:
+                raise CommandError(f"Regressed: {', '.join(regressions)}")
+            self.stderr.write(self.style.SUCCESS("No regression against the baseline"))
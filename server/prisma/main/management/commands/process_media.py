@@ -0,0 +1,28 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from main.services.media import IMAGE_FIELDS, pending_image_fields, process_image_field
+from main.task import process_uploaded_image
+
+
+class Command(BaseCommand):
+    help = "Generate the variants of the images uploaded before the processing pipeline, or whose task was lost"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queue', action='store_true', help="Queue celery tasks instead of processing in this process")
+
+    def handle(self, *args, **options):
+        processed = 0
+        for model_label, field_names in IMAGE_FIELDS.items():
+            model = apps.get_model(model_label)
+            has_image = Q()
+            for field_name in field_names:
+                has_image |= ~Q(**{field_name: ''}) & Q(**{f'{field_name}__isnull': False})
+            for instance in model.objects.filter(has_image).only('pk', 'media_variants', *field_names).iterator():
+                for field_name in pending_image_fields(instance):
+                    if options['queue']:
+                        process_uploaded_image.delay(model_label, instance.pk, field_name)
+                    else:
+                        process_image_field(model_label, instance.pk, field_name)
+                    processed += 1
+        self.stdout.write(f"{'Queued' if options['queue'] else 'Processed'} {processed} images")
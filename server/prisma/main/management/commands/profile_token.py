@@ -0,0 +1,11 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from main.profiling import PROFILE_HEADER, make_profile_token
+
+
+class Command(BaseCommand):
+    help = "Print a signed header that profiles the requests sending it"
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{PROFILE_HEADER}: {make_profile_token()}")
+        self.stdout.write(f"Valid for {settings.PROFILE_TOKEN_MAX_AGE} seconds, profiles are listed on /admin/profiles/")
@@ -0,0 +1,31 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from main.services.payouts import run_payouts, weekly_run_id
+
+
+class Command(BaseCommand):
+    help = "Settle pending earnings into one payout batch per detailer"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--run-id', help="Idempotency key for the run, defaults to manual-weekly-<ISO week>, apart from the scheduled run's")
+        parser.add_argument('--payout-date', help="Payout date in YYYY-MM-DD format, defaults to today")
+        parser.add_argument('--detailer', type=int, action='append', dest='detailer_ids', help="Restrict the run to a detailer id (repeatable)")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        payout_date = None
+        if options['payout_date']:
+            try:
+                payout_date = datetime.strptime(options['payout_date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError("Invalid payout date format. Use YYYY-MM-DD")
+
+        run = run_payouts(
+            options['run_id'] or weekly_run_id(source='manual'),
+            payout_date=payout_date,
+            detailer_ids=options['detailer_ids'],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Payout run {run.run_id}: {run.batch_count} batches, {run.earning_count} earnings, {run.total_amount} total"
+        ))
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+from main.services.seed import DEFAULT_CITY_WEIGHTS, SEED_PASSWORD, parse_city_weights, seed_data
+
+
+class Command(BaseCommand):
+    help = "Seed a production sized data set of detailers, jobs, earnings, reviews and availability"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--detailers', type=int, default=1000)
+        parser.add_argument('--jobs-per-detailer', type=int, default=200, help="Average jobs per detailer")
+        parser.add_argument('--days-back', type=int, default=365)
+        parser.add_argument('--days-ahead', type=int, default=30)
+        parser.add_argument('--availability-days', type=int, default=14)
+        parser.add_argument(
+            '--cities',
+            default=','.join(f'{city}:{weight}' for city, weight in DEFAULT_CITY_WEIGHTS.items()),
+            help="Weighted city distribution, e.g. London:40,Dublin:10",
+        )
+        parser.add_argument('--activity-skew', type=float, default=1.5, help="Pareto shape of the jobs per detailer")
+        parser.add_argument('--review-rate', type=float, default=0.4)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        city_weights = parse_city_weights(options['cities'])
+        if not city_weights:
+            raise CommandError("--cities needs at least one city")
+
+        def progress(counts):
+            self.stdout.write(f"{counts['jobs']} jobs, {counts['earnings']} earnings, {counts['reviews']} reviews")
+
+        counts = seed_data(
+            detailers=options['detailers'],
+            jobs_per_detailer=options['jobs_per_detailer'],
+            days_back=options['days_back'],
+            days_ahead=options['days_ahead'],
+            availability_days=options['availability_days'],
+            city_weights=city_weights,
+            activity_skew=options['activity_skew'],
+            review_rate=options['review_rate'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {counts['detailers']} detailers, {counts['jobs']} jobs, {counts['earnings']} earnings, "
+            f"{counts['reviews']} reviews and {counts['availability']} availability rows in {counts['seconds']}s. "
+            f"Every seeded user logs in with the password {SEED_PASSWORD!r}"
+        ))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from main.services.balances import find_balance_drift
+
+
+class Command(BaseCommand):
+    help = "Recompute every detailer's running earning totals and report any drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help="Overwrite drifted totals with the recomputed values")
+
+    def handle(self, *args, **options):
+        drift = find_balance_drift(fix=options['fix'])
+        for detailer_id, field, stored, expected in drift:
+            self.stdout.write(f"Detailer {detailer_id}: {field} is {stored}, expected {expected}")
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("All detailer balances match their earnings"))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f"Fixed {len(drift)} drifted totals"))
+        else:
+            self.stdout.write(self.style.WARNING(f"Found {len(drift)} drifted totals, run with --fix to repair them"))
@@ -0,0 +1,166 @@
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name: (type, help)
+METRICS = {
+    'prisma_action_requests_total': ('counter', 'Requests handled per action and status code class'),
+    'prisma_action_latency_seconds': ('histogram', 'Request latency per action'),
+    'prisma_action_db_seconds': ('histogram', 'Time spent in database queries per action'),
+    'prisma_action_queries': ('summary', 'Database queries per request per action'),
+    'prisma_action_response_bytes': ('summary', 'Response body size per action (streamed responses excluded)'),
+}
+
+REDIS_KEY = 'prisma:metrics'
+
+
+class MetricsRegistry:
+    """
+    In process store of metric samples.
+
+    Samples are keyed by (sample name, labels) and only ever incremented. When a redis url is
+    configured the increments since the last flush are pushed to a shared redis hash every
+    METRICS_FLUSH_INTERVAL seconds, which sums the samples of every worker process.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = defaultdict(float)
+        self.pending = defaultdict(float)
+        self.last_flush = time.monotonic()
+        self._redis = None
+
+    def _inc(self, name, labels, amount=1.0):
+        key = (name, labels)
+        self.totals[key] += amount
+        self.pending[key] += amount
+
+    def _observe_histogram(self, name, labels, value):
+        index = bisect_left(LATENCY_BUCKETS, value)
+        # Buckets are cumulative, every bound at or above the value is incremented
+        for bound in LATENCY_BUCKETS[index:]:
+            self._inc(f'{name}_bucket', labels + (('le', repr(bound)),))
+        self._inc(f'{name}_bucket', labels + (('le', '+Inf'),))
+        self._inc(f'{name}_sum', labels, value)
+        self._inc(f'{name}_count', labels)
+
+    def _observe_summary(self, name, labels, value):
+        self._inc(f'{name}_sum', labels, value)
+        self._inc(f'{name}_count', labels)
+
+    def observe_request(self, action, status_code, latency, db_time, queries, response_bytes=None):
+        """ Record one request of an action """
+        labels = (('action', action),)
+        with self.lock:
+            self._inc('prisma_action_requests_total', labels + (('status', f'{status_code // 100}xx'),))
+            self._observe_histogram('prisma_action_latency_seconds', labels, latency)
+            self._observe_histogram('prisma_action_db_seconds', labels, db_time)
+            self._observe_summary('prisma_action_queries', labels, queries)
+            if response_bytes is not None:
+                self._observe_summary('prisma_action_response_bytes', labels, response_bytes)
+        self.maybe_flush()
+
+    # -------------------------------
+    # Redis aggregation
+    # -------------------------------
+    def get_redis(self):
+        url = getattr(settings, 'METRICS_REDIS_URL', None)
+        if not url:
+            return None
+        if self._redis is None:
+            import redis
+            self._redis = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        return self._redis
+
+    def maybe_flush(self):
+        interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 10)
+        if time.monotonic() - self.last_flush >= interval:
+            self.flush()
+
+    def flush(self):
+        """ Push the increments since the last flush to redis, they are kept for the next flush on failure """
+        client = self.get_redis()
+        with self.lock:
+            self.last_flush = time.monotonic()
+            if client is None or not self.pending:
+                return
+            pending, self.pending = self.pending, defaultdict(float)
+        try:
+            pipeline = client.pipeline(transaction=False)
+            for (name, labels), amount in pending.items():
+                pipeline.hincrbyfloat(REDIS_KEY, json.dumps([name, labels]), amount)
+            pipeline.execute()
+        except Exception as e:
+            logger.warning("Could not flush metrics to redis: %s", e)
+            with self.lock:
+                for key, amount in pending.items():
+                    self.pending[key] += amount
+
+    def collect(self):
+        """ Samples of every worker when redis is configured, otherwise of this process only """
+        client = self.get_redis()
+        if client is not None:
+            self.flush()
+            try:
+                samples = {}
+                for field, value in client.hgetall(REDIS_KEY).items():
+                    name, labels = json.loads(field)
+                    samples[(name, tuple(tuple(pair) for pair in labels))] = float(value)
+                return samples
+            except Exception as e:
+                logger.warning("Could not read metrics from redis, serving this process only: %s", e)
+        with self.lock:
+            return {key: value for key, value in self.totals.items()}
+
+
+registry = MetricsRegistry()
+
+
+def _base_name(sample_name):
+    for suffix in ('_bucket', '_sum', '_count'):
+        if sample_name.endswith(suffix) and sample_name[:-len(suffix)] in METRICS:
+            return sample_name[:-len(suffix)]
+    return sample_name
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        f'{key}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for key, value in labels
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def render_prometheus(samples):
+    """ Render samples in the Prometheus text exposition format (version 0.0.4) """
+    grouped = defaultdict(list)
+    for (name, labels), value in samples.items():
+        grouped[_base_name(name)].append((name, labels, value))
+
+    lines = []
+    for base_name in sorted(grouped):
+        metric_type, help_text = METRICS.get(base_name, ('untyped', ''))
+        lines.append(f'# HELP {base_name} {help_text}')
+        lines.append(f'# TYPE {base_name} {metric_type}')
+
+        def sort_key(sample):
+            name, labels, _ = sample
+            # Keep histogram buckets in ascending order with +Inf last
+            le = dict(labels).get('le')
+            bound = float('inf') if le == '+Inf' else float(le) if le else 0
+            return (tuple(pair for pair in labels if pair[0] != 'le'), name, bound)
+
+        for name, labels, value in sorted(grouped[base_name], key=sort_key):
+            formatted = repr(value) if value != int(value) else str(int(value))
+            lines.append(f'{name}{_format_labels(labels)} {formatted}')
+    return '\n'.join(lines) + '\n'
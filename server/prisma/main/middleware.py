@@ -0,0 +1,118 @@
+import logging
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.handlers.asgi import ASGIRequest
+from .instrumentation import QueryRecorder, action_budget, action_label, request_label, resolve_action
+from .metrics import registry
+from .routers import mark_sticky, track_writes
+
+logger = logging.getLogger(__name__)
+
+
+async def _chunks_in_thread(chunks):
+    """ Iterate a sync iterator from async code, one chunk per sync_to_async call """
+    # Thread sensitive, the chunks come from the thread that ran the view and holds its database connection
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    chunks = iter(chunks)
+    while (chunk := await next_chunk(chunks, None)) is not None:
+        yield chunk
+
+
+class AsyncStreamingMiddleware:
+    """
+    Keep streaming responses streaming when served over ASGI.
+
+    Django's ASGI handler reads a sync streaming_content with sync_to_async(list), holding a whole
+    export or file in memory before the first byte is sent. The iterator of StreamingHttpResponse and
+    FileResponse is given to the handler as an async one instead, fetching a chunk at a time. Under
+    WSGI (runserver, the test client) the response is left as it is.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if isinstance(request, ASGIRequest) and response.streaming and not response.is_async:
+            response.streaming_content = _chunks_in_thread(response.streaming_content)
+        return response
+
+
+class QueryBudgetMiddleware:
+    """
+    Debug only middleware counting the queries of every request.
+
+    The count is returned in the X-Query-Count header, and a warning is logged when an action
+    routed through an action_handler view runs more queries than its declared query budget.
+    """
+    def __init__(self, get_response):
+        if not settings.DEBUG:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with recorder.record():
+            response = self.get_response(request)
+
+        response['X-Query-Count'] = str(recorder.count)
+        view_class, action = resolve_action(request)
+        if action:
+            budget = action_budget(view_class, action)
+            response['X-Query-Budget'] = str(budget)
+            if budget is not None and recorder.count > budget:
+                logger.warning(
+                    "%s ran %d queries, over its budget of %d",
+                    action_label(view_class, action), recorder.count, budget,
+                )
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Record the latency, database time, query count and response size of every request, labelled
+    with the dispatched action, and feed them to the metrics registry served on /metrics.
+    """
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with recorder.record():
+            response = self.get_response(request)
+        latency = time.perf_counter() - start
+
+        registry.observe_request(
+            request_label(request),
+            response.status_code,
+            latency,
+            recorder.duration,
+            recorder.count,
+            None if response.streaming else len(response.content),
+        )
+        return response
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Make a user's replica reads stick to the primary for a short while after they wrote, so a
+    detailer never reads a dashboard that is missing the change they just made.
+
+    Runs around the view, so request.user is the user DRF authenticated from the JWT.
+    """
+    def __init__(self, get_response):
+        if not getattr(settings, 'DATABASE_REPLICAS', []):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with track_writes() as state:
+            response = self.get_response(request)
+        user = getattr(request, 'user', None)
+        if state['wrote'] and user is not None and user.is_authenticated:
+            mark_sticky(user)
+        return response
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:01
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def remove_duplicate_earnings(apps, schema_editor):
+    """
+    Keep one earning per job before the constraint is added, the old Job.create_earning could run twice.
+
+    The paid earning is kept over unpaid ones, the oldest among equals. Two paid earnings of a job mean
+    the detailer was paid twice, which needs a person to look at rather than a deletion.
+    """
+    Earning = apps.get_model('main', 'Earning')
+    duplicated = Earning.objects.values('job_id').annotate(count=Count('id')).filter(count__gt=1).values_list('job_id', flat=True)
+    paid_twice = list(
+        Earning.objects.filter(job_id__in=duplicated, payment_status='paid')
+        .values('job_id').annotate(count=Count('id')).filter(count__gt=1)
+        .order_by('job_id').values_list('job_id', flat=True)
+    )
+    if paid_twice:
+        raise RuntimeError(
+            'Jobs with more than one paid earning, resolve them by hand before migrating: '
+            + ', '.join(str(job_id) for job_id in paid_twice)
+        )
+
+    keep = {}
+    for earning_id, job_id, payment_status in (
+        Earning.objects.filter(job_id__in=duplicated).order_by('job_id', 'id').values_list('id', 'job_id', 'payment_status')
+    ):
+        if job_id not in keep or payment_status == 'paid':
+            keep[job_id] = earning_id
+    Earning.objects.filter(job_id__in=duplicated).exclude(pk__in=keep.values()).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0005_payouts'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_earnings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='earning',
+            constraint=models.UniqueConstraint(fields=('job',), name='unique_earning_per_job'),
+        ),
+    ]
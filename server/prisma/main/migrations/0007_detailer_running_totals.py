@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:03
+
+from django.db import migrations, models
+from django.db.models import Q, Sum
+
+
+def backfill_running_totals(apps, schema_editor):
+    Detailer = apps.get_model('main', 'Detailer')
+    Earning = apps.get_model('main', 'Earning')
+    totals = Earning.objects.values('detailer_id').annotate(
+        lifetime=Sum('net_amount'),
+        unpaid=Sum('net_amount', filter=Q(payment_status='pending')),
+        paid=Sum('net_amount', filter=Q(payment_status='paid')),
+    ).order_by()
+    detailers = []
+    for row in totals:
+        detailers.append(Detailer(
+            pk=row['detailer_id'],
+            lifetime_net_total=row['lifetime'] or 0,
+            unpaid_net_total=row['unpaid'] or 0,
+            paid_net_total=row['paid'] or 0,
+        ))
+    Detailer.objects.bulk_update(detailers, ['lifetime_net_total', 'unpaid_net_total', 'paid_net_total'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0006_earning_unique_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detailer',
+            name='lifetime_net_total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='detailer',
+            name='paid_net_total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='detailer',
+            name='unpaid_net_total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.RunPython(backfill_running_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,98 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:07
+#
+# Job indexes derived from the hot queries:
+#   - DashboardView._get_today_overview / _get_recent_jobs: detailer = ? AND appointment_date range
+#     -> job_detailer_appt_idx
+#   - DashboardView._get_quick_stats: detailer = ? AND status = 'completed' AND appointment_date range,
+#     detailer = ? AND status IN (...) -> job_detailer_status_appt_idx
+#   - AvailabilityView.get_timeslots: detailer IN (...) AND status IN (...) AND appointment_date range
+#     -> job_detailer_appt_idx, overlap checks -> job_detailer_window_idx (migration 0008)
+#   - JobAdmin change list sorted by appointment date -> job_appt_date_idx
+#   - Jobs still in flight and unassigned pending jobs -> partial indexes
+#
+# On PostgreSQL the indexes are built with CREATE INDEX CONCURRENTLY so the job table stays writable,
+# which is why the migration is not atomic. The new indexes are created before the old one is dropped.
+
+from django.db import migrations, models
+
+
+class AddIndexConcurrently(migrations.AddIndex):
+    """ AddIndex that uses CREATE INDEX CONCURRENTLY on PostgreSQL and a plain CREATE INDEX elsewhere """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        if schema_editor.connection.vendor == 'postgresql':
+            schema_editor.add_index(model, self.index, concurrently=True)
+        else:
+            schema_editor.add_index(model, self.index)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        if schema_editor.connection.vendor == 'postgresql':
+            schema_editor.remove_index(model, self.index, concurrently=True)
+        else:
+            schema_editor.remove_index(model, self.index)
+
+
+class RemoveIndexConcurrently(migrations.RemoveIndex):
+    """ RemoveIndex that uses DROP INDEX CONCURRENTLY on PostgreSQL and a plain DROP INDEX elsewhere """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        index = from_state.models[app_label, self.model_name_lower].get_index_by_name(self.name)
+        if schema_editor.connection.vendor == 'postgresql':
+            schema_editor.remove_index(model, index, concurrently=True)
+        else:
+            schema_editor.remove_index(model, index)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        index = to_state.models[app_label, self.model_name_lower].get_index_by_name(self.name)
+        if schema_editor.connection.vendor == 'postgresql':
+            schema_editor.add_index(model, index, concurrently=True)
+        else:
+            schema_editor.add_index(model, index)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('main', '0008_job_appointment_window'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='job',
+            index=models.Index(fields=['detailer', 'appointment_date'], name='job_detailer_appt_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='job',
+            index=models.Index(fields=['detailer', 'status', 'appointment_date'], name='job_detailer_status_appt_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='job',
+            index=models.Index(fields=['-appointment_date'], name='job_appt_date_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='job',
+            index=models.Index(condition=models.Q(('status__in', ['pending', 'accepted', 'in_progress'])), fields=['detailer', 'appointment_date'], name='job_active_detailer_appt_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='job',
+            index=models.Index(condition=models.Q(('detailer__isnull', True), ('status', 'pending')), fields=['appointment_date'], name='job_unassigned_appt_idx'),
+        ),
+        RemoveIndexConcurrently(
+            model_name='job',
+            name='main_job_detaile_12dc2f_idx',
+        ),
+    ]
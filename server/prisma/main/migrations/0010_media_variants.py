@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_rework_job_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='media_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='media_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:47
+#
+# Media requests are authorized by looking the job up by photo name (main/views/media.py), indexed so
+# the lookup doesn't scan the job table. Built concurrently on PostgreSQL, like migration 0009.
+
+from importlib import import_module
+from django.db import migrations, models
+
+AddIndexConcurrently = import_module('main.migrations.0009_rework_job_indexes').AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('main', '0011_photo_upload'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='job',
+            index=models.Index(fields=['before_photo'], name='job_before_photo_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='job',
+            index=models.Index(fields=['after_photo'], name='job_after_photo_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:12
+#
+# Dispatch selects the upcoming unassigned jobs by their stored appointment_start: appointment_date only
+# holds the day, so a job later today stored at midnight looked past. The partial index follows the
+# query, built concurrently on PostgreSQL like migration 0009, before the old one is dropped.
+
+from importlib import import_module
+from django.db import migrations, models
+
+rework = import_module('main.migrations.0009_rework_job_indexes')
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('main', '0013_email_log'),
+    ]
+
+    operations = [
+        rework.AddIndexConcurrently(
+            model_name='job',
+            index=models.Index(condition=models.Q(('detailer__isnull', True), ('status', 'pending')), fields=['appointment_start'], name='job_unassigned_start_idx'),
+        ),
+        rework.RemoveIndexConcurrently(
+            model_name='job',
+            name='job_unassigned_appt_idx',
+        ),
+    ]
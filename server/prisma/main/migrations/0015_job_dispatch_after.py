@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_job_unassigned_start_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='dispatch_after',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
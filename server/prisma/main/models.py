@@ -1,7 +1,14 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser, BaseUserManager
+from django.core.exceptions import ValidationError
+from django.utils import timezone
 import math
-from django.db.models import Sum
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+from django.db.models import Case, DecimalField, F, Sum, Value, When
+from .catalog import service_duration, service_price
+from .utils import appointment_window, day_range, day_start, days_range, month_range, split_earning, week_range
 
 
 # -------------------------------
@@ -36,6 +43,8 @@ class User(AbstractUser):
     last_name = models.CharField(max_length=30)
     phone = models.CharField(max_length=15, unique=True)
     image = models.ImageField(upload_to="profile_images/", null=True, blank=True)
+    # Dimensions and resized variants of the image fields, filled in after upload by services.media
+    media_variants = models.JSONField(default=dict, blank=True, editable=False)
     is_detailer = models.BooleanField(default=False)
     is_admin = models.BooleanField(default=False)
 
@@ -57,10 +66,96 @@ class User(AbstractUser):
         return f"{self.first_name} {self.last_name}"
 
 
+# -------------------------------
+# Cache invalidation tracking
+# -------------------------------
+class TrackedStateMixin:
+    """
+    Remembers what a row contributes to cached results (slot grids, routes) as it was loaded, so the
+    signals only invalidate the entries a save actually changes. Each name of TRACKED_STATES has a
+    <name>_state() method reading __dict__, deferred fields are never loaded for it.
+    """
+    TRACKED_STATES = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_states = {name: getattr(instance, f'{name}_state')() for name in cls.TRACKED_STATES}
+        return instance
+
+    def state_changes(self, name, deleted=False):
+        """ Entries of <name>_state() added or removed since the row was loaded or last saved """
+        state = frozenset() if deleted else getattr(self, f'{name}_state')()
+        loaded = self.__dict__.setdefault('_loaded_states', {})
+        changes = state ^ loaded.get(name, frozenset())
+        loaded[name] = state
+        return changes
+
+
 # -------------------------------
 # Detailer
 # -------------------------------
-class Detailer(models.Model):
+BALANCE_FIELDS = ("lifetime_net_total", "unpaid_net_total", "paid_net_total")
+
+# Running total each earning payment status counts towards, on top of lifetime_net_total
+BALANCE_BUCKETS = {
+    "pending": "unpaid_net_total",
+    "paid": "paid_net_total",
+}
+
+
+def add_balance_delta(deltas, detailer_id, payment_status, net_amount, sign=1):
+    """ Accumulate the running total change caused by an earning into deltas[detailer_id] """
+    amount = Decimal(str(net_amount or 0)) * sign
+    deltas[detailer_id]["lifetime_net_total"] += amount
+    bucket = BALANCE_BUCKETS.get(payment_status)
+    if bucket:
+        deltas[detailer_id][bucket] += amount
+    return deltas
+
+
+def balance_deltas():
+    """ Empty accumulator for add_balance_delta """
+    return defaultdict(lambda: defaultdict(Decimal))
+
+
+class DetailerManager(models.Manager):
+    def apply_balance_deltas(self, deltas):
+        """
+        Apply running total changes to many detailers in a single UPDATE.
+
+        Every column is incremented with an F() expression, so concurrent writers never
+        overwrite each other's changes.
+
+        Args:
+            deltas: {detailer_id: {field: Decimal}} as built by add_balance_delta
+
+        Returns:
+            int: Number of detailers updated
+        """
+        deltas = {
+            detailer_id: {field: amount for field, amount in changes.items() if amount}
+            for detailer_id, changes in deltas.items() if detailer_id
+        }
+        deltas = {detailer_id: changes for detailer_id, changes in deltas.items() if changes}
+        if not deltas:
+            return 0
+
+        updates = {}
+        for field in BALANCE_FIELDS:
+            whens = [When(pk=detailer_id, then=Value(changes[field])) for detailer_id, changes in deltas.items() if field in changes]
+            if whens:
+                updates[field] = F(field) + Case(
+                    *whens,
+                    default=Value(Decimal("0")),
+                    output_field=DecimalField(max_digits=12, decimal_places=2),
+                )
+        return self.filter(pk__in=deltas.keys()).update(**updates)
+
+
+class Detailer(TrackedStateMixin, models.Model):
+    TRACKED_STATES = ('slot',)
+
     user = models.ForeignKey(User, on_delete=models.CASCADE )
     rating = models.FloatField(default=0, blank=True, null=True)
     address = models.CharField(max_length=120, blank=True, null=True)
@@ -72,18 +167,48 @@ class Detailer(models.Model):
     longitude = models.FloatField(blank=True, null=True)
     is_active = models.BooleanField(default=True)
     is_verified = models.BooleanField(default=False)
+
+    # Running totals of the detailer's earnings (net amounts), maintained by Earning.save, the Earning
+    # post_delete signal and the bulk earning services. Check them with the verify_detailer_balances command.
+    lifetime_net_total = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    unpaid_net_total = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    paid_net_total = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = DetailerManager()
+
     def __str__(self):
         return f'{self.user.get_full_name()} - {self.user.email}'
 
-    # Aggregation helpers
+    def save(self, *args, **kwargs):
+        # The running totals are only written by apply_balance_deltas and find_balance_drift, a detailer
+        # loaded before an earning changed must not write its stale totals back
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in BALANCE_FIELDS and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+    def slot_state(self):
+        """ An active detailer makes its city bookable """
+        values = self.__dict__
+        if values.get('is_active') and values.get('city'):
+            return frozenset({values['city'].lower()})
+        return frozenset()
+
+    # Balance helpers, read from the running totals
     def total_earnings(self):
-        return self.earnings.aggregate(total=Sum("net_amount"))["total"] or 0
+        return self.lifetime_net_total
 
     def unpaid_earnings(self):
-        return self.earnings.filter(payment_status="pending").aggregate(total=Sum("net_amount"))["total"] or 0
+        return self.unpaid_net_total
+
+    def paid_earnings(self):
+        return self.paid_net_total
     
 
 
@@ -129,7 +254,36 @@ class TimeSlot(models.Model):
 # -------------------------------
 # Job
 # -------------------------------
-class Job(models.Model):
+class JobQuerySet(models.QuerySet):
+    """ Appointment filters expressed as half-open datetime ranges, which keep appointment_date indexable """
+
+    def appointments_between(self, start, end):
+        return self.filter(appointment_date__gte=start, appointment_date__lt=end)
+
+    def on_day(self, day):
+        return self.appointments_between(*day_range(day))
+
+    def between_days(self, first_day, last_day):
+        return self.appointments_between(*days_range(first_day, last_day))
+
+    def in_week(self, day):
+        return self.appointments_between(*week_range(day))
+
+    def in_month(self, day):
+        return self.appointments_between(*month_range(day))
+
+    def since_day(self, day):
+        return self.filter(appointment_date__gte=day_start(day))
+
+    def booked(self):
+        return self.filter(status__in=Job.BOOKED_STATUSES)
+
+    def overlapping(self, start, end):
+        """ Jobs whose stored appointment window intersects the half-open range [start, end) """
+        return self.filter(appointment_start__lt=end, appointment_end__gt=start)
+
+
+class Job(TrackedStateMixin, models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
         ('accepted', 'Accepted'),
@@ -138,6 +292,13 @@ class Job(models.Model):
         ('cancelled', 'Cancelled'),
     ]
 
+    # Statuses that hold the detailer's time, a detailer can't be booked twice across them
+    BOOKED_STATUSES = ['pending', 'accepted', 'in_progress', 'completed']
+    # Statuses that take the time off the customer slot grid, pending jobs aren't confirmed yet
+    SLOT_STATUSES = ['accepted', 'in_progress', 'completed']
+
+    TRACKED_STATES = ('slot', 'route')
+
     
     service_type = models.ForeignKey(ServiceType, on_delete=models.CASCADE)
 
@@ -166,35 +327,125 @@ class Job(models.Model):
     appointment_date = models.DateTimeField()
     appointment_time = models.TimeField()
 
+    # Appointment window derived from appointment_date, appointment_time and the service duration.
+    # Kept in sync on save so overlap checks run as a single indexed query.
+    appointment_start = models.DateTimeField(blank=True, null=True, editable=False)
+    appointment_end = models.DateTimeField(blank=True, null=True, editable=False)
+    # Dispatch found no detailer for the job, it isn't scored again before then, see services.dispatch
+    dispatch_after = models.DateTimeField(blank=True, null=True, editable=False)
+
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
 
     detailer = models.ForeignKey(Detailer, on_delete=models.CASCADE, related_name="jobs", blank=True, null=True)
     
     before_photo = models.ImageField(upload_to="jobs/before/", blank=True, null=True)
     after_photo = models.ImageField(upload_to="jobs/after/", blank=True, null=True)
+    # Dimensions and resized variants of the photos, filled in after upload by services.media
+    media_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = JobQuerySet.as_manager()
+
     class Meta:
+        # Indexes follow the hot queries, see migration 0009 for the access patterns behind each one.
+        # booking_reference needs none, its unique constraint is already an index.
         indexes = [
-            models.Index(fields=['detailer', 'status', 'appointment_date', 'appointment_time', 'booking_reference']),
+            # Detailer's jobs by date regardless of status: today's overview, recent jobs, slot conflicts
+            models.Index(fields=['detailer', 'appointment_date'], name='job_detailer_appt_idx'),
+            # Detailer's jobs of one status over a date range: completed this week/month
+            models.Index(fields=['detailer', 'status', 'appointment_date'], name='job_detailer_status_appt_idx'),
+            # Overlap checks against the stored appointment window
+            models.Index(fields=['detailer', 'appointment_start', 'appointment_end'], name='job_detailer_window_idx'),
+            # Admin change list, newest appointments first
+            models.Index(fields=['-appointment_date'], name='job_appt_date_idx'),
+            # Partial indexes over the small set of jobs still in flight
+            models.Index(
+                fields=['detailer', 'appointment_date'],
+                name='job_active_detailer_appt_idx',
+                condition=models.Q(status__in=['pending', 'accepted', 'in_progress']),
+            ),
+            # Upcoming unassigned jobs by their stored start, for dispatch, see migration 0014
+            models.Index(
+                fields=['appointment_start'],
+                name='job_unassigned_start_idx',
+                condition=models.Q(status='pending', detailer__isnull=True),
+            ),
+            # Authorization of media requests, which look the job up by photo name
+            models.Index(fields=['before_photo'], name='job_before_photo_idx'),
+            models.Index(fields=['after_photo'], name='job_after_photo_idx'),
         ]
+        # PostgreSQL also carries the job_no_double_booking exclusion constraint, see migration 0008
+
+    def set_appointment_window(self, duration=None):
+        """ Recompute appointment_start/appointment_end, the duration defaults to the service type's from the catalog cache """
+        if self.appointment_date and self.appointment_time:
+            if duration is None:
+                duration = service_duration(self.service_type_id)
+            if duration is None:
+                duration = self.service_type.duration
+            self.appointment_start, self.appointment_end = appointment_window(
+                self.appointment_date, self.appointment_time, duration
+            )
+
+    def slot_state(self):
+        """ The appointment window a confirmed job blocks on its detailer's slot grid """
+        values = self.__dict__
+        if values.get('status') in self.SLOT_STATUSES and values.get('detailer_id') and values.get('appointment_start'):
+            return frozenset({(values['detailer_id'], values['appointment_start'], values.get('appointment_end'))})
+        return frozenset()
+
+    def route_state(self):
+        """ The stop a booked job adds to its detailer's route of the day """
+        values = self.__dict__
+        if values.get('status') in self.BOOKED_STATUSES and values.get('detailer_id') and values.get('appointment_start'):
+            return frozenset({(
+                values['detailer_id'], values['appointment_start'], values.get('appointment_end'),
+                values.get('latitude'), values.get('longitude'),
+            )})
+        return frozenset()
+
+    def conflicting_jobs(self):
+        """ Booked jobs of the same detailer whose window overlaps this job """
+        return Job.objects.booked().filter(detailer_id=self.detailer_id).exclude(pk=self.pk).overlapping(
+            self.appointment_start, self.appointment_end
+        )
+
+    def clean(self):
+        super().clean()
+        if self.detailer_id and self.status in self.BOOKED_STATUSES and self.service_type_id:
+            self.set_appointment_window()
+            if self.conflicting_jobs().exists():
+                raise ValidationError("The detailer already has a job booked at this time.")
 
-    # Create an earning record for every completed job
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            self.set_appointment_window()
+        elif {'appointment_date', 'appointment_time', 'service_type'} & set(update_fields):
+            self.set_appointment_window()
+            kwargs['update_fields'] = set(update_fields) | {'appointment_start', 'appointment_end'}
+        super().save(*args, **kwargs)
+
+    # Create an earning record for every completed job. Use services.earnings.generate_missing_earnings
+    # to create them in bulk.
     def create_earning(self):
         if self.status == "completed":
+            gross_amount, commission, net_amount = split_earning(service_price(self.service_type_id), self.detailer.commission_rate)
             Earning.objects.create(
                 detailer=self.detailer,
                 job=self,
-                gross_amount=self.service_type.price,
+                gross_amount=gross_amount,
+                commission=commission,
+                net_amount=net_amount,
             )
     
     def __str__(self):
         return f'Job {self.id} - {self.detailer.user.get_full_name()}'
 
     def get_total_earnings(self):
-        return self.service_type.price * (1 - self.detailer.commission_rate)
+        return service_price(self.service_type_id) * (1 - self.detailer.commission_rate)
 
 
 # -------------------------------
@@ -225,20 +476,49 @@ class Earning(models.Model):
     tip_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0, blank=True, null=True)
     payout_date = models.DateField(blank=True, null=True)
     payment_status = models.CharField(max_length=10, choices=PAYMENT_STATUS, default="pending")
+    payout_batch = models.ForeignKey("PayoutBatch", on_delete=models.SET_NULL, related_name="earnings", blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     objects = EarningManager()
 
+    class Meta:
+        constraints = [
+            # One earning per job, which lets the batch generation run concurrently without duplicates
+            models.UniqueConstraint(fields=['job'], name='unique_earning_per_job'),
+        ]
+
     def __str__(self):
         return f"Earning for {self.detailer.user.get_full_name()} - Job {self.job.id}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._balance_snapshot = instance._get_balance_snapshot()
+        return instance
+
+    def _get_balance_snapshot(self):
+        # Deferred fields are skipped, only fully loaded rows can be diffed
+        if {"detailer_id", "payment_status", "net_amount"} & self.get_deferred_fields():
+            return None
+        return (self.detailer_id, self.payment_status, self.net_amount)
+
     def save(self, *args, **kwargs):
         if not self.gross_amount:
-            self.gross_amount = self.job.service_type.price
+            self.gross_amount = service_price(self.job.service_type_id)
         if not self.commission:
-            self.commission = self.gross_amount * self.detailer.commission_rate
-        self.net_amount = self.gross_amount - self.commission
-        super().save(*args, **kwargs)
+            _, self.commission, _ = split_earning(self.gross_amount, self.detailer.commission_rate)
+        self.net_amount = Decimal(str(self.gross_amount)) - Decimal(str(self.commission))
+
+        # Move the net amount between the detailer's running totals in the same transaction
+        deltas = balance_deltas()
+        snapshot = getattr(self, "_balance_snapshot", None)
+        if snapshot:
+            add_balance_delta(deltas, *snapshot, sign=-1)
+        add_balance_delta(deltas, self.detailer_id, self.payment_status, self.net_amount)
+        with transaction.atomic(using=kwargs.get("using")):
+            super().save(*args, **kwargs)
+            Detailer.objects.apply_balance_deltas(deltas)
+        self._balance_snapshot = self._get_balance_snapshot()
 
     def mark_as_paid(self, payout_date=None):
         self.payment_status = "paid"
@@ -259,6 +539,49 @@ class BankAccount(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+
+# -------------------------------
+# Payouts
+# -------------------------------
+""" A payout run settles every pending earning in one pass. The run_id makes the run idempotent,
+    re-running a completed run returns it untouched instead of paying twice.
+"""
+class PayoutRun(models.Model):
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("completed", "Completed"),
+    ]
+
+    run_id = models.CharField(max_length=64, unique=True)
+    payout_date = models.DateField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
+    batch_count = models.PositiveIntegerField(default=0)
+    earning_count = models.PositiveIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"Payout run {self.run_id} ({self.status})"
+
+
+""" One batch per detailer per run, holding the totals that will be transferred to the detailer """
+class PayoutBatch(models.Model):
+    run = models.ForeignKey(PayoutRun, on_delete=models.CASCADE, related_name="batches")
+    detailer = models.ForeignKey(Detailer, on_delete=models.CASCADE, related_name="payout_batches")
+    bank_account = models.ForeignKey(BankAccount, on_delete=models.SET_NULL, blank=True, null=True)
+    earning_count = models.PositiveIntegerField(default=0)
+    net_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    tip_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('run', 'detailer')
+
+    def __str__(self):
+        return f"Payout {self.run.run_id} - {self.detailer.user.get_full_name()}"
+
 # -------------------------------
 # Review
 # -------------------------------
@@ -273,7 +596,9 @@ class Review(models.Model):
         return f'Review for {self.detailer.user.get_full_name()} - Job {self.job.id}'
     
 
-class Availability(models.Model):
+class Availability(TrackedStateMixin, models.Model):
+    TRACKED_STATES = ('slot',)
+
     detailer = models.ForeignKey(Detailer, on_delete=models.CASCADE, related_name="availability")
     date = models.DateField()
     start_time = models.TimeField()
@@ -281,6 +606,13 @@ class Availability(models.Model):
     is_available = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    def slot_state(self):
+        """ The window the detailer opens on the slot grid of the day """
+        values = self.__dict__
+        if values.get('is_available') and values.get('detailer_id') and values.get('date'):
+            return frozenset({(values['detailer_id'], values['date'], values.get('start_time'), values.get('end_time'))})
+        return frozenset()
+
 
 # -------------------------------
 # Training Records
@@ -293,4 +625,88 @@ class TrainingRecord(models.Model):
 
     def __str__(self):
         return f'Training: {self.title} - {self.detailer.user.get_full_name()}'
-  
\ No newline at end of file
+  
+
+
+# -------------------------------
+# Photo uploads
+# -------------------------------
+""" A resumable upload of a job photo. The client creates it with the total size, sends the bytes in
+    chunks at increasing offsets and finalizes it once offset == size, see views/uploads.py.
+"""
+class PhotoUpload(models.Model):
+    FIELD_CHOICES = [
+        ("before_photo", "Before photo"),
+        ("after_photo", "After photo"),
+    ]
+    STATUS_CHOICES = [
+        ("uploading", "Uploading"),
+        ("complete", "Complete"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    job = models.ForeignKey(Job, on_delete=models.CASCADE, related_name="photo_uploads")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="photo_uploads")
+    field = models.CharField(max_length=20, choices=FIELD_CHOICES)
+    filename = models.CharField(max_length=120)
+    size = models.PositiveIntegerField()
+    offset = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="uploading")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Abandoned uploads swept by the cleanup task
+            models.Index(fields=['status', 'updated_at'], name='photo_upload_status_idx'),
+        ]
+
+    @property
+    def partial_name(self):
+        """ Storage name of the bytes received so far """
+        return f"uploads/partial/{self.id}.part"
+
+    def __str__(self):
+        return f"Upload {self.id} - Job {self.job_id} {self.field} ({self.offset}/{self.size})"
+
+
+# -------------------------------
+# Emails
+# -------------------------------
+""" One email to send, see main/emails. The unique (event, recipient, dedupe_key) makes queueing
+    idempotent: a payout notice or reminder queued twice is sent once.
+"""
+class EmailLog(models.Model):
+    STATUS_CHOICES = [
+        ("queued", "Queued"),
+        ("sending", "Sending"),
+        ("sent", "Sent"),
+        ("failed", "Failed"),
+    ]
+
+    event = models.CharField(max_length=40)
+    recipient = models.EmailField()
+    dedupe_key = models.CharField(max_length=120, blank=True, default="")
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, related_name="emails", blank=True, null=True)
+    context = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="queued")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    # Set by the worker that claimed the email, so two workers never send it both
+    claim_token = models.CharField(max_length=32, blank=True, default="")
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['event', 'recipient', 'dedupe_key'], name='unique_email_per_event'),
+        ]
+        indexes = [
+            # Emails due to be sent, read by every batch
+            models.Index(fields=['status', 'next_attempt_at'], name='email_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.event} to {self.recipient} ({self.status})"
@@ -0,0 +1,206 @@
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils import timezone
+from .instrumentation import QueryRecorder, request_label
+
+PROFILE_HEADER = 'X-Prisma-Profile'
+PROFILE_QUERY_PARAM = '__profile'
+SIGNING_SALT = 'main.profiling'
+
+# Files written per profile: metadata with the SQL timeline, and the profile itself
+PROFILE_EXTENSIONS = {
+    'meta': '.json',
+    'collapsed': '.collapsed',
+    'pstats': '.prof',
+}
+
+
+def make_profile_token():
+    """ Signed value for the X-Prisma-Profile header, valid for PROFILE_TOKEN_MAX_AGE seconds """
+    return signing.TimestampSigner(salt=SIGNING_SALT).sign('profile')
+
+
+def _valid_token(value):
+    try:
+        signing.TimestampSigner(salt=SIGNING_SALT).unsign(value, max_age=settings.PROFILE_TOKEN_MAX_AGE)
+        return True
+    except signing.BadSignature:
+        return False
+
+
+def profiling_requested(request):
+    """ A request is profiled when it carries a valid signed header, or a staff user asks with ?__profile=1 """
+    header = request.headers.get(PROFILE_HEADER)
+    if header:
+        return _valid_token(header)
+    if request.GET.get(PROFILE_QUERY_PARAM):
+        user = getattr(request, 'user', None)
+        return bool(user and user.is_authenticated and user.is_staff)
+    return False
+
+
+# -------------------------------
+# Profilers
+# -------------------------------
+class SamplingProfiler:
+    """
+    Sample the call stack of one thread from a background thread.
+
+    The samples are written in the collapsed stack format ("frame;frame;frame count"), which
+    flamegraph.pl, speedscope and most flamegraph viewers read directly.
+    """
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self._thread_id = None
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def __enter__(self):
+        self._thread_id = threading.get_ident()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._sampler.join()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def dump(self, path):
+        with open(path, 'w') as handle:
+            for stack, count in self.stacks.most_common():
+                handle.write(f'{stack} {count}\n')
+
+
+class DeterministicProfiler:
+    """ cProfile wrapper, the .prof output opens in snakeviz or converts with flameprof """
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def __enter__(self):
+        self.profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profile.disable()
+
+    def dump(self, path):
+        self.profile.dump_stats(path)
+
+
+# -------------------------------
+# On disk store
+# -------------------------------
+def store_dir():
+    path = settings.PROFILE_STORE_DIR
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def profile_file(profile_id, kind):
+    """ Path of one file of a stored profile, None when the id isn't a stored profile id """
+    if not profile_id or os.path.basename(profile_id) != profile_id or kind not in PROFILE_EXTENSIONS:
+        return None
+    return os.path.join(store_dir(), profile_id + PROFILE_EXTENSIONS[kind])
+
+
+def list_profiles():
+    """ Metadata of the stored profiles, newest first """
+    profiles = []
+    for name in os.listdir(store_dir()):
+        if not name.endswith(PROFILE_EXTENSIONS['meta']):
+            continue
+        try:
+            with open(os.path.join(store_dir(), name)) as handle:
+                profiles.append(json.load(handle))
+        except (OSError, ValueError):
+            continue
+    return sorted(profiles, key=lambda profile: profile['created_at'], reverse=True)
+
+
+def prune_profiles():
+    """ Keep the store bounded to the PROFILE_STORE_MAX_PROFILES most recent profiles """
+    profiles = list_profiles()
+    for profile in profiles[settings.PROFILE_STORE_MAX_PROFILES:]:
+        for kind in PROFILE_EXTENSIONS:
+            path = profile_file(profile['id'], kind)
+            if path and os.path.exists(path):
+                os.remove(path)
+
+
+def save_profile(meta, profiler, kind):
+    profile_id = meta['id']
+    profiler.dump(profile_file(profile_id, kind))
+    with open(profile_file(profile_id, 'meta'), 'w') as handle:
+        json.dump(meta, handle, indent=2, default=str)
+    prune_profiles()
+
+
+class ProfilingMiddleware:
+    """
+    Opt-in request profiler.
+
+    Requests without the signed header or staff query parameter go straight through, so the
+    cost when the hook isn't triggered is a header and query string lookup. Triggered requests
+    run under the sampling profiler (or cProfile with PROFILE_MODE = 'cprofile'), their SQL
+    timeline is captured, and both are written to PROFILE_STORE_DIR where the admin lists them.
+    """
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not profiling_requested(request):
+            return self.get_response(request)
+
+        if settings.PROFILE_MODE == 'cprofile':
+            profiler, kind = DeterministicProfiler(), 'pstats'
+        else:
+            profiler, kind = SamplingProfiler(settings.PROFILE_SAMPLE_INTERVAL), 'collapsed'
+        recorder = QueryRecorder(capture_sql=True)
+
+        started_at = timezone.now()
+        start = time.perf_counter()
+        with recorder.record(), profiler:
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        profile_id = f"{started_at:%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}"
+        user = getattr(request, 'user', None)
+        save_profile({
+            'id': profile_id,
+            'created_at': started_at.isoformat(),
+            'method': request.method,
+            'path': request.path,
+            'action': request_label(request),
+            'user': user.pk if user is not None and user.is_authenticated else None,
+            'status': response.status_code,
+            'duration': duration,
+            'query_count': recorder.count,
+            'query_time': recorder.duration,
+            'kind': kind,
+            'queries': recorder.queries,
+        }, profiler, kind)
+        response['X-Profile-Id'] = profile_id
+        return response
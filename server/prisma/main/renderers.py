@@ -0,0 +1,87 @@
+import datetime
+import decimal
+from django.conf import settings
+from django.db.models.query import QuerySet
+from django.utils.functional import Promise
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# UTC datetimes end in "Z" like DRF's encoder, dict keys that aren't strings are converted like json.dumps does
+ORJSON_OPTIONS = (orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY) if orjson else 0
+
+# Leading UTF-8 bytes of U+2028 and U+2029, checked before escaping them
+LINE_SEPARATORS_PREFIX = b'\xe2\x80'
+
+
+def orjson_default(obj):
+    """
+    Encode the types orjson doesn't handle natively, the same way DRF's JSONEncoder does.
+
+    datetime, date, time, UUID and numpy arrays are encoded by orjson itself.
+    """
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, Promise):
+        return str(obj)
+    if isinstance(obj, datetime.timedelta):
+        return str(obj.total_seconds())
+    if isinstance(obj, QuerySet):
+        return tuple(obj)
+    if isinstance(obj, bytes):
+        return obj.decode()
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    if hasattr(obj, '__getitem__'):
+        try:
+            return dict(obj)
+        except (TypeError, ValueError):
+            pass
+    if hasattr(obj, '__iter__'):
+        return tuple(item for item in obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSON renderer encoding with orjson, producing the same compact output as DRF's JSONRenderer.
+
+    Decimal values become floats, datetimes are ISO 8601 with microseconds and "Z" for UTC, dates
+    and times ISO 8601, and U+2028/U+2029 are escaped so the output stays a JavaScript subset. One
+    difference: NaN and Infinity render as null where DRF's strict encoder raises ValueError.
+    Requests asking for indented output, payloads orjson refuses (e.g. integers over 64 bits) and
+    deployments without orjson installed go through the stock stdlib renderer.
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=orjson_default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Like DRF, the line and paragraph separators are escaped. Their UTF-8 bytes only occur inside strings
+        if LINE_SEPARATORS_PREFIX in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    """ JSON parser decoding with orjson, falling back to DRF's JSONParser for non UTF-8 bodies or without orjson """
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
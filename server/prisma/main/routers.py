@@ -0,0 +1,92 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+# Replica alias the reads of the current block go to, set by replica_reads()
+_replica_alias = ContextVar('replica_alias', default=None)
+# Per request state, {'wrote': bool}, set by ReplicaStickinessMiddleware
+_request_state = ContextVar('replica_request_state', default=None)
+
+
+def _sticky_key(user_id):
+    return f'replica:sticky:{user_id}'
+
+
+def mark_sticky(user):
+    """ Send the user's replica reads to the primary for REPLICA_STICKY_SECONDS, so they read their own writes """
+    cache.set(_sticky_key(user.pk), True, settings.REPLICA_STICKY_SECONDS)
+
+
+def is_sticky(user):
+    return bool(cache.get(_sticky_key(user.pk)))
+
+
+@contextmanager
+def replica_reads(user=None):
+    """
+    Route the reads of the block to a read replica.
+
+    Reads stay on the primary when no replica is configured, when the user wrote within the
+    last REPLICA_STICKY_SECONDS, or once anything was written in the block.
+
+    Usage:
+        with replica_reads(request.user) as alias:
+            ...
+
+    Yields:
+        str: Alias the block reads from, usable with QuerySet.using() for lazily consumed querysets
+    """
+    replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+    if not replicas or (user is not None and user.is_authenticated and is_sticky(user)):
+        yield DEFAULT_DB_ALIAS
+        return
+    token = _replica_alias.set(random.choice(replicas))
+    try:
+        yield _replica_alias.get()
+    finally:
+        _replica_alias.reset(token)
+
+
+@contextmanager
+def track_writes():
+    """ Record whether anything was written to the primary inside the block """
+    state = {'wrote': False}
+    token = _request_state.set(state)
+    try:
+        yield state
+    finally:
+        _request_state.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Send writes to the primary, and the reads of replica_reads() blocks to a replica.
+
+    Replicas are filled by database replication, so migrations only run on the primary.
+    """
+    def db_for_read(self, model, **hints):
+        alias = _replica_alias.get()
+        state = _request_state.get()
+        if alias and not (state and state['wrote']):
+            return alias
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state['wrote'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *getattr(settings, 'DATABASE_REPLICAS', [])}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in getattr(settings, 'DATABASE_REPLICAS', []):
+            return False
+        return None
@@ -0,0 +1,6 @@
+from django.urls import path
+from .consumers import DetailerConsumer
+
+websocket_urlpatterns = [
+    path('ws/detailer/', DetailerConsumer.as_asgi()),
+]
@@ -61,7 +61,7 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
                 'city': detailer.city if detailer else None,
                 'post_code': detailer.post_code if detailer else None,
                 'country': detailer.country if detailer else None,
-                'image': get_full_media_url(user.image.url) if getattr(user, 'image', None) else None,
+                'image': get_full_media_url(user.image, variant='medium'),
             }
         })
         return data
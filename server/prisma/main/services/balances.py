@@ -0,0 +1,74 @@
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Q, Sum
+from ..models import BALANCE_FIELDS, Detailer, Earning
+
+
+def computed_balances(detailer_ids=None):
+    """ Recompute the running totals of every detailer, or of some, from the earnings table in one grouped query """
+    earnings = Earning.objects.all() if detailer_ids is None else Earning.objects.filter(detailer_id__in=detailer_ids)
+    rows = earnings.values('detailer_id').annotate(
+        lifetime_net_total=Sum('net_amount'),
+        unpaid_net_total=Sum('net_amount', filter=Q(payment_status='pending')),
+        paid_net_total=Sum('net_amount', filter=Q(payment_status='paid')),
+    ).order_by()
+    return {
+        row['detailer_id']: {field: row[field] or Decimal('0') for field in BALANCE_FIELDS}
+        for row in rows
+    }
+
+
+def _drift(detailers, expected_balances):
+    """ (detailer, [(field, stored, expected)]) of every detailer whose stored totals drifted """
+    zero = {field: Decimal('0') for field in BALANCE_FIELDS}
+    for detailer in detailers:
+        expected = expected_balances.get(detailer.pk, zero)
+        fields = [
+            (field, getattr(detailer, field), expected[field])
+            for field in BALANCE_FIELDS
+            if getattr(detailer, field) != expected[field]
+        ]
+        if fields:
+            yield detailer, fields
+
+
+def _fix_drift(detailer_ids):
+    """
+    Overwrite the drifted totals of some detailers with values recomputed under a row lock.
+
+    An earning saved meanwhile applies its delta with an UPDATE of the detailer row, which waits for the
+    lock, so it is either counted by the recompute or added on top of the fixed totals, never lost.
+    """
+    with transaction.atomic():
+        detailers = list(Detailer.objects.select_for_update().only('id', *BALANCE_FIELDS).filter(pk__in=detailer_ids).order_by('pk'))
+        drift, to_fix = [], []
+        for detailer, fields in _drift(detailers, computed_balances(detailer_ids)):
+            for field, stored, expected in fields:
+                drift.append((detailer.pk, field, stored, expected))
+                setattr(detailer, field, expected)
+            to_fix.append(detailer)
+        Detailer.objects.bulk_update(to_fix, BALANCE_FIELDS)
+    return drift
+
+
+def find_balance_drift(fix=False, batch_size=1000):
+    """
+    Compare the stored running totals of every detailer with the earnings table.
+
+    Args:
+        fix: Overwrite the drifted totals with the recomputed values, batch by batch with the
+            detailers locked and their totals recomputed again
+        batch_size: Chunk size used when reading and fixing detailers
+
+    Returns:
+        List of (detailer_id, field, stored, expected) tuples, one per drifted total
+    """
+    detailers = Detailer.objects.only('id', *BALANCE_FIELDS).order_by('pk').iterator(chunk_size=batch_size)
+    drifted = {detailer.pk: fields for detailer, fields in _drift(detailers, computed_balances())}
+    if fix:
+        ids = list(drifted)
+        drift = []
+        for start in range(0, len(ids), batch_size):
+            drift += _fix_drift(ids[start:start + batch_size])
+        return drift
+    return [(detailer_id, field, stored, expected) for detailer_id, fields in drifted.items() for field, stored, expected in fields]
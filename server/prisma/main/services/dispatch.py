@@ -0,0 +1,292 @@
+from datetime import timedelta
+from functools import partial, reduce
+from operator import or_
+import numpy as np
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from ..consumers import notify_detailer
+from ..models import Availability, Detailer, Job
+from .geo import coordinates, haversine_matrix
+from .routes import invalidate_route
+from .slots import BUSINESS_END, BUSINESS_START, TRAVEL_INTERVAL
+
+# Jobs a detailer still has to do, their count is the detailer's current load
+OPEN_STATUSES = ['pending', 'accepted', 'in_progress']
+
+
+def _minute_of_day(value):
+    local = timezone.localtime(value)
+    return local.hour * 60 + local.minute
+
+
+def _time_minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def _one_hot(indices, size):
+    """ (len(indices), size) matrix with a 1 in each row's column, to reduce pair masks per detailer by matmul """
+    matrix = np.zeros((len(indices), size), dtype=np.float32)
+    matrix[np.arange(len(indices)), indices] = 1
+    return matrix
+
+
+def plan_assignments(jobs, detailers, booked, availability, weights=None, max_distance_km=None):
+    """
+    Pick a detailer for every job that has an eligible one, scoring every job x detailer pair at once.
+
+    A detailer is eligible when they work in the job's city, are within max_distance_km of it (when both
+    positions are known), have the job's window inside their availability of the day (business hours
+    without any) and no booked job overlapping it, travel interval included. Eligible pairs are scored
+    with the weighted sum of:
+      - distance: 1 next door down to 0 at max_distance_km, 0.5 when a position is unknown
+      - capacity: share of the detailer's day still free once the job is taken
+      - rating: rating out of 5
+      - load: 1 / (1 + open jobs)
+    The most constrained jobs are assigned first, each to its best scoring detailer, whose column is
+    then rescored before the next job.
+
+    Args:
+        jobs: (job_id, city, latitude, longitude, appointment_start, appointment_end) of the jobs to assign
+        detailers: (detailer_id, city, latitude, longitude, rating, open_jobs) of the candidates
+        booked: (detailer_id, appointment_start, appointment_end) of the candidates' booked jobs on those days
+        availability: (detailer_id, date, start_time, end_time) of the candidates' availability on those days
+        weights: {'distance', 'capacity', 'rating', 'load'}, defaults to DISPATCH_WEIGHTS
+        max_distance_km: Defaults to DISPATCH_MAX_DISTANCE_KM
+
+    Returns:
+        dict: {job_id: detailer_id} of the jobs assigned
+    """
+    weights = weights or settings.DISPATCH_WEIGHTS
+    max_distance_km = max_distance_km or settings.DISPATCH_MAX_DISTANCE_KM
+    if not jobs or not detailers:
+        return {}
+    detailer_count = len(detailers)
+    detailer_index = {row[0]: index for index, row in enumerate(detailers)}
+    travel = TRAVEL_INTERVAL * 60
+
+    # Jobs: windows in epoch seconds, local day and minutes of the day
+    job_start = np.array([row[4].timestamp() for row in jobs])
+    job_end = np.array([row[5].timestamp() for row in jobs])
+    job_minutes = (job_end - job_start) / 60
+    day_index = {}
+    job_day = np.array([day_index.setdefault(timezone.localdate(row[4]), len(day_index)) for row in jobs])
+    job_start_minute = np.array([_minute_of_day(row[4]) for row in jobs])
+    job_end_minute = job_start_minute + job_minutes
+
+    cities = {}
+    job_city = np.array([cities.setdefault((row[1] or '').lower(), len(cities)) for row in jobs])
+    detailer_city = np.array([cities.setdefault((row[1] or '').lower(), len(cities)) for row in detailers])
+
+    # Booked jobs: pairs overlapping a job make the detailer busy, their minutes fill the detailer's day
+    booked = [(detailer_index[row[0]], row[1], row[2]) for row in booked if row[0] in detailer_index]
+    booked_detailer = np.array([row[0] for row in booked], dtype=int)
+    booked_start = np.array([row[1].timestamp() for row in booked], dtype=float)
+    booked_end = np.array([row[2].timestamp() for row in booked], dtype=float)
+    overlap = (booked_start[None, :] < job_end[:, None] + travel) & (booked_end[None, :] + travel > job_start[:, None])
+    busy = (overlap.astype(np.float32) @ _one_hot(booked_detailer, detailer_count)) > 0
+    booked_day = np.array([day_index.get(timezone.localdate(row[1]), -1) for row in booked], dtype=int)
+    booked_minutes = np.zeros((len(day_index), detailer_count))
+    on_days = booked_day >= 0
+    np.add.at(booked_minutes, (booked_day[on_days], booked_detailer[on_days]), ((booked_end - booked_start) / 60)[on_days])
+
+    # Availability: the job must fit one window of the day, the windows' total is the detailer's day
+    windows = np.array([
+        (detailer_index[row[0]], day_index[row[1]], _time_minutes(row[2]), _time_minutes(row[3]))
+        for row in availability if row[0] in detailer_index and row[1] in day_index
+    ], dtype=float).reshape(-1, 4)
+    window_detailer, window_day = windows[:, 0].astype(int), windows[:, 1].astype(int)
+    has_availability = np.zeros((len(day_index), detailer_count), dtype=bool)
+    has_availability[window_day, window_detailer] = True
+    set_minutes = np.zeros((len(day_index), detailer_count))
+    np.add.at(set_minutes, (window_day, window_detailer), windows[:, 3] - windows[:, 2])
+    business_start, business_end = _time_minutes(BUSINESS_START), _time_minutes(BUSINESS_END)
+    available_minutes = np.maximum(np.where(has_availability, set_minutes, business_end - business_start), 1)
+    inside = (
+        (window_day[None, :] == job_day[:, None])
+        & (windows[:, 2][None, :] <= job_start_minute[:, None])
+        & (windows[:, 3][None, :] >= job_end_minute[:, None])
+    )
+    within_availability = (inside.astype(np.float32) @ _one_hot(window_detailer, detailer_count)) > 0
+    within_business_hours = (job_start_minute >= business_start) & (job_end_minute <= business_end)
+    within = np.where(has_availability[job_day], within_availability, within_business_hours[:, None])
+
+    distance = haversine_matrix(
+        coordinates(row[2] for row in jobs), coordinates(row[3] for row in jobs),
+        coordinates(row[2] for row in detailers), coordinates(row[3] for row in detailers),
+    )
+    known = ~np.isnan(distance)
+    distance = np.where(known, distance, 0)
+    distance_score = np.where(known, np.clip(1 - distance / max_distance_km, 0, 1), 0.5)
+    rating = np.clip(np.nan_to_num(coordinates(row[4] for row in detailers)) / 5, 0, 1)
+    load = np.array([row[5] for row in detailers], dtype=float)
+
+    capacity = 1 - (booked_minutes[job_day] + job_minutes[:, None]) / available_minutes[job_day]
+    eligible = (
+        (job_city[:, None] == detailer_city[None, :]) & ~busy & within
+        & ~(known & (distance > max_distance_km)) & (capacity >= 0)
+    )
+    static = weights['distance'] * distance_score + weights['rating'] * rating[None, :]
+    score = np.where(eligible, static + weights['capacity'] * capacity + weights['load'] / (1 + load)[None, :], -np.inf)
+
+    # Jobs clashing with each other once travel is added, a detailer given one can't take the others
+    clash = (job_start[None, :] < job_end[:, None] + travel) & (job_end[None, :] + travel > job_start[:, None])
+
+    assignments = {}
+    for job in np.lexsort((job_start, eligible.sum(axis=1))):
+        detailer = int(np.argmax(score[job]))
+        if score[job, detailer] == -np.inf:
+            continue
+        assignments[jobs[job][0]] = detailers[detailer][0]
+        booked_minutes[job_day[job], detailer] += job_minutes[job]
+        load[detailer] += 1
+        column_capacity = 1 - (booked_minutes[job_day, detailer] + job_minutes) / available_minutes[job_day, detailer]
+        eligible[:, detailer] &= ~clash[job] & (column_capacity >= 0)
+        score[:, detailer] = np.where(
+            eligible[:, detailer],
+            static[:, detailer] + weights['capacity'] * column_capacity + weights['load'] / (1 + load[detailer]),
+            -np.inf,
+        )
+    return assignments
+
+
+def _notify_assigned(jobs):
+    by_detailer = {}
+    for job in jobs:
+        by_detailer.setdefault(job.detailer_id, []).append({
+            'id': job.pk,
+            'bookingReference': job.booking_reference,
+            'appointmentDate': job.appointment_date.isoformat(),
+            'address': job.address,
+        })
+    for detailer_id, payload in by_detailer.items():
+        notify_detailer(detailer_id, 'job.assigned', {'jobs': payload})
+
+
+def _write_assignments(assigned):
+    """
+    Save the assignments, all at once unless one breaks a constraint: a detailer booked by another
+    transaction since (job_no_double_booking on PostgreSQL). Each job is then written in its own savepoint
+    and the conflicting ones are left unassigned, for the next run. Returns the jobs assigned.
+    """
+    try:
+        with transaction.atomic():
+            Job.objects.bulk_update(assigned, ['detailer', 'updated_at'])
+        return assigned
+    except IntegrityError:
+        pass
+    written = []
+    for job in assigned:
+        try:
+            with transaction.atomic():
+                Job.objects.filter(pk=job.pk).update(detailer_id=job.detailer_id, updated_at=job.updated_at)
+        except IntegrityError:
+            job.detailer_id = None
+            continue
+        written.append(job)
+    return written
+
+
+def _dispatch_batch(jobs):
+    """ Assign a batch of locked jobs, with the candidate detailers locked for the rest of the transaction """
+    cities = {job.city.lower() for job in jobs if job.city}
+    if not cities:
+        return []
+    # Locked in id order so two dispatchers wait on each other instead of deadlocking
+    detailers = list(
+        Detailer.objects.select_for_update()
+        .filter(reduce(or_, (Q(city__iexact=city) for city in cities)), is_active=True)
+        .order_by('pk')
+        .values_list('id', 'city', 'latitude', 'longitude', 'rating')
+    )
+    if not detailers:
+        return []
+    detailer_ids = [row[0] for row in detailers]
+    open_jobs = dict(
+        Job.objects.filter(detailer_id__in=detailer_ids, status__in=OPEN_STATUSES)
+        .values('detailer_id').annotate(count=Count('id')).values_list('detailer_id', 'count')
+    )
+    days = [timezone.localdate(job.appointment_start) for job in jobs]
+    booked = Job.objects.booked().filter(detailer_id__in=detailer_ids, appointment_start__isnull=False).between_days(
+        min(days), max(days)
+    ).values_list('detailer_id', 'appointment_start', 'appointment_end')
+    availability = Availability.objects.filter(
+        detailer_id__in=detailer_ids, date__gte=min(days), date__lte=max(days), is_available=True
+    ).values_list('detailer_id', 'date', 'start_time', 'end_time')
+
+    assignments = plan_assignments(
+        [(job.pk, job.city, job.latitude, job.longitude, job.appointment_start, job.appointment_end) for job in jobs],
+        [row + (open_jobs.get(row[0], 0),) for row in detailers],
+        list(booked),
+        list(availability),
+    )
+    now = timezone.now()
+    assigned = []
+    for job in jobs:
+        if job.pk in assignments:
+            job.detailer_id = assignments[job.pk]
+            job.updated_at = now
+            assigned.append(job)
+    assigned = _write_assignments(assigned)
+    # bulk_update sends no signals, the routes the jobs join are invalidated here
+    for detailer_id, day in {(job.detailer_id, timezone.localdate(job.appointment_start)) for job in assigned}:
+        invalidate_route(detailer_id, day)
+        transaction.on_commit(partial(invalidate_route, detailer_id, day))
+    if assigned:
+        transaction.on_commit(lambda: _notify_assigned(assigned), robust=True)
+    return assigned
+
+
+def dispatch_pending_jobs(day=None, batch_size=None):
+    """
+    Assign the upcoming pending jobs nobody took to the best scoring free detailer, see plan_assignments.
+
+    Jobs are handled in appointment order, in batches of batch_size, one transaction each. A batch's jobs
+    are locked with SKIP LOCKED, so concurrent dispatchers and detailers accepting jobs never wait on each
+    other, and the candidate detailers are locked until the assignments are written with a single
+    bulk_update. Assigned detailers are told over their websocket once the batch commits. Jobs left
+    unassigned are not scored again for DISPATCH_RETRY_DELAY, so a job nobody can take doesn't cost
+    every run.
+
+    Args:
+        day: Only dispatch the jobs of that day
+        batch_size: Defaults to DISPATCH_BATCH_SIZE
+
+    Returns:
+        dict: Counts of assigned and unassigned jobs, and of batches
+    """
+    batch_size = batch_size or settings.DISPATCH_BATCH_SIZE
+    # Served by the job_unassigned_start_idx partial index. appointment_date only holds the day, a job
+    # later today may be stored at midnight: the stored window tells which jobs are still upcoming
+    now = timezone.now()
+    pending = Job.objects.filter(status='pending', detailer__isnull=True, appointment_start__gte=now).filter(
+        Q(dispatch_after__isnull=True) | Q(dispatch_after__lte=now)
+    )
+    if day is not None:
+        pending = pending.on_day(day)
+
+    totals = {'assigned': 0, 'unassigned': 0, 'batches': 0}
+    cursor = None
+    while True:
+        batch = pending
+        if cursor is not None:
+            batch = batch.filter(Q(appointment_start__gt=cursor[0]) | Q(appointment_start=cursor[0], pk__gt=cursor[1]))
+        with transaction.atomic():
+            jobs = list(batch.select_for_update(skip_locked=True).order_by('appointment_start', 'pk')[:batch_size])
+            if not jobs:
+                break
+            assigned = _dispatch_batch(jobs)
+            assigned_ids = {job.pk for job in assigned}
+            unassigned = [job.pk for job in jobs if job.pk not in assigned_ids]
+            if unassigned:
+                Job.objects.filter(pk__in=unassigned).update(
+                    dispatch_after=timezone.now() + timedelta(seconds=settings.DISPATCH_RETRY_DELAY)
+                )
+        totals['assigned'] += len(assigned)
+        totals['unassigned'] += len(jobs) - len(assigned)
+        totals['batches'] += 1
+        if len(jobs) < batch_size:
+            break
+        cursor = (jobs[-1].appointment_start, jobs[-1].pk)
+    return totals
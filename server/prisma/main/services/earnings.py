@@ -0,0 +1,82 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef
+from ..models import Detailer, Earning, Job, add_balance_delta, balance_deltas
+from ..catalog import service_price
+from ..utils import split_earning
+
+
+def jobs_missing_earnings():
+    """ Completed and assigned jobs without an earning record, expressed as an anti-join (NOT EXISTS) """
+    return Job.objects.filter(
+        status='completed',
+        detailer__isnull=False,
+    ).filter(
+        ~Exists(Earning.objects.filter(job_id=OuterRef('pk')))
+    )
+
+
+def generate_missing_earnings(batch_size=500, limit=None):
+    """
+    Create the earning record of every completed job that does not have one yet.
+
+    Jobs are processed in primary key order, one chunk per transaction. A chunk reads the price
+    and commission rate through a single joined query, computes the amounts in memory, inserts
+    them with bulk_create and adds them to the detailers' running totals in one UPDATE. Each
+    committed chunk is durable, so an interrupted run simply resumes from the anti-join on the
+    next call.
+
+    Concurrent runs are safe: on PostgreSQL the candidate jobs are locked with SKIP LOCKED so
+    workers take disjoint chunks, and the unique constraint on Earning.job rejects any duplicate
+    that slips through, in which case the chunk is rolled back and read again.
+
+    Args:
+        batch_size: Number of jobs handled per chunk
+        limit: Optional maximum number of earnings to create
+
+    Returns:
+        int: Number of earnings created
+    """
+    created = 0
+    last_id = 0
+    retries = 0
+
+    while limit is None or created < limit:
+        size = batch_size if limit is None else min(batch_size, limit - created)
+        try:
+            with transaction.atomic():
+                rows = list(
+                    jobs_missing_earnings()
+                    .filter(pk__gt=last_id)
+                    .select_for_update(skip_locked=True, of=('self',))
+                    .order_by('pk')
+                    .values_list('pk', 'detailer_id', 'service_type_id', 'detailer__commission_rate')[:size]
+                )
+                if not rows:
+                    break
+
+                earnings = []
+                deltas = balance_deltas()
+                for job_id, detailer_id, service_type_id, commission_rate in rows:
+                    gross_amount, commission, net_amount = split_earning(service_price(service_type_id), commission_rate)
+                    add_balance_delta(deltas, detailer_id, 'pending', net_amount)
+                    earnings.append(Earning(
+                        job_id=job_id,
+                        detailer_id=detailer_id,
+                        gross_amount=gross_amount,
+                        commission=commission,
+                        net_amount=net_amount,
+                    ))
+                Earning.objects.bulk_create(earnings, batch_size=batch_size)
+                Detailer.objects.apply_balance_deltas(deltas)
+        except IntegrityError:
+            # Another worker inserted one of these earnings first, read the chunk again
+            retries += 1
+            if retries > 3:
+                raise
+            continue
+
+        retries = 0
+        created += len(earnings)
+        last_id = rows[-1][0]
+
+    return created
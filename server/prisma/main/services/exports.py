@@ -0,0 +1,156 @@
+import csv
+from datetime import datetime, time, timedelta
+from django.utils import timezone
+from ..models import Earning
+
+""" Columns of the earnings export as (header, lookup) pairs. The lookups are read with values_list so
+    the export never instantiates model objects or follows a foreign key lazily.
+"""
+EARNING_EXPORT_COLUMNS = [
+    ('earning_id', 'id'),
+    ('created_at', 'created_at'),
+    ('payment_status', 'payment_status'),
+    ('payout_date', 'payout_date'),
+    ('gross_amount', 'gross_amount'),
+    ('commission', 'commission'),
+    ('net_amount', 'net_amount'),
+    ('tip_amount', 'tip_amount'),
+    ('booking_reference', 'job__booking_reference'),
+    ('appointment_date', 'job__appointment_date'),
+    ('service_type', 'job__service_type__name'),
+    ('job_city', 'job__city'),
+    ('detailer_id', 'detailer_id'),
+    ('detailer_first_name', 'detailer__user__first_name'),
+    ('detailer_last_name', 'detailer__user__last_name'),
+    ('detailer_email', 'detailer__user__email'),
+]
+
+EXPORT_FORMATS = ('csv', 'arrow')
+DEFAULT_CHUNK_SIZE = 2000
+
+
+def earnings_export_queryset(start_date=None, end_date=None, payment_status=None):
+    """
+    Build the export queryset of earnings joined with their job and detailer.
+
+    Args:
+        start_date: Optional first day (inclusive) of the creation date range
+        end_date: Optional last day (inclusive) of the creation date range
+        payment_status: Optional payment status to filter on
+
+    Returns:
+        A values_list queryset ordered by primary key
+    """
+    tz = timezone.get_current_timezone()
+    queryset = Earning.objects.all()
+    if start_date:
+        queryset = queryset.filter(created_at__gte=datetime.combine(start_date, time.min, tzinfo=tz))
+    if end_date:
+        queryset = queryset.filter(created_at__lt=datetime.combine(end_date + timedelta(days=1), time.min, tzinfo=tz))
+    if payment_status:
+        queryset = queryset.filter(payment_status=payment_status)
+    return queryset.order_by('pk').values_list(*[lookup for _, lookup in EARNING_EXPORT_COLUMNS])
+
+
+def iter_export_rows(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """ Read the rows through a server side cursor (on PostgreSQL) so memory stays flat """
+    return queryset.iterator(chunk_size=chunk_size)
+
+
+class _Echo:
+    """ File-like object whose write returns the value instead of buffering it """
+    def write(self, value):
+        return value
+
+
+class _ChunkSink:
+    """ File-like sink collecting whatever pyarrow writes, drained after every record batch """
+    def __init__(self):
+        self.chunks = []
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_csv(rows):
+    """ Yield the export as CSV lines, one row at a time """
+    writer = csv.writer(_Echo())
+    yield writer.writerow([header for header, _ in EARNING_EXPORT_COLUMNS])
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def _arrow_schema(pa):
+    money = pa.decimal128(12, 2)
+    timestamp = pa.timestamp('us', tz='UTC')
+    types = {
+        'earning_id': pa.int64(),
+        'created_at': timestamp,
+        'payout_date': pa.date32(),
+        'gross_amount': money,
+        'commission': money,
+        'net_amount': money,
+        'tip_amount': money,
+        'appointment_date': timestamp,
+        'detailer_id': pa.int64(),
+    }
+    return pa.schema([(header, types.get(header, pa.string())) for header, _ in EARNING_EXPORT_COLUMNS])
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+    except ImportError:
+        raise ValueError("The arrow export format requires pyarrow to be installed")
+    return pyarrow
+
+
+def iter_record_batches(rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    """ Group the rows into pyarrow record batches of chunk_size rows """
+    pa = _import_pyarrow()
+    schema = _arrow_schema(pa)
+    columns = [[] for _ in EARNING_EXPORT_COLUMNS]
+
+    def build_batch():
+        arrays = [pa.array(values, type=field.type) for values, field in zip(columns, schema)]
+        for values in columns:
+            values.clear()
+        return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    count = 0
+    for row in rows:
+        for values, value in zip(columns, row):
+            values.append(value)
+        count += 1
+        if count == chunk_size:
+            yield build_batch()
+            count = 0
+    if count:
+        yield build_batch()
+
+
+def stream_arrow(rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    """ Yield the export in the Arrow IPC streaming format, one record batch at a time """
+    pa = _import_pyarrow()
+    sink = _ChunkSink()
+    writer = pa.ipc.new_stream(sink, _arrow_schema(pa))
+    yield sink.drain()
+    for batch in iter_record_batches(rows, chunk_size):
+        writer.write_batch(batch)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
@@ -0,0 +1,29 @@
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def coordinates(values):
+    """ Float array of latitudes or longitudes, NaN where a value is missing """
+    return np.array([np.nan if value is None else value for value in values], dtype=float)
+
+
+def haversine_matrix(latitudes, longitudes, other_latitudes=None, other_longitudes=None):
+    """
+    Great circle distances in km between every point of a first and every point of a second set.
+
+    Args:
+        latitudes, longitudes: Degrees of the first set, NaN for unknown positions
+        other_latitudes, other_longitudes: Degrees of the second set, the first set again when omitted
+
+    Returns:
+        ndarray: (len(first), len(second)) distances, NaN where either position is unknown
+    """
+    if other_latitudes is None:
+        other_latitudes, other_longitudes = latitudes, longitudes
+    lat1 = np.radians(np.asarray(latitudes, dtype=float))[:, None]
+    lon1 = np.radians(np.asarray(longitudes, dtype=float))[:, None]
+    lat2 = np.radians(np.asarray(other_latitudes, dtype=float))[None, :]
+    lon2 = np.radians(np.asarray(other_longitudes, dtype=float))[None, :]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
@@ -0,0 +1,167 @@
+import io
+import os
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageOps
+
+# Resized copies generated for every uploaded image, bounding box in pixels. The thumbnail is what list
+# screens load (a few KB), medium is for detail screens, the original stays for zooming in
+IMAGE_VARIANTS = {
+    'thumbnail': (240, 240),
+    'medium': (1080, 1080),
+}
+
+# Encoder settings of each variant format, WebP is served by default and JPEG to clients that can't decode it
+IMAGE_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# Image fields processed after upload, by model label
+IMAGE_FIELDS = {
+    'main.user': ('image',),
+    'main.job': ('before_photo', 'after_photo'),
+}
+
+
+def variant_name(name, variant, image_format):
+    """ Storage name of a variant, next to the original: jobs/before/car.jpg -> jobs/before/variants/car.jpg.thumbnail.webp """
+    directory, filename = os.path.split(name)
+    return os.path.join(directory, 'variants', f'{filename}.{variant}.{image_format}')
+
+
+def source_name(name):
+    """ Storage name of the original a variant was generated from, the name itself for originals """
+    directory, filename = os.path.split(name)
+    if os.path.basename(directory) != 'variants':
+        return name
+    stem, variant, image_format = filename.rsplit('.', 2) if filename.count('.') >= 2 else (filename, '', '')
+    if variant not in IMAGE_VARIANTS or image_format not in IMAGE_FORMATS:
+        return name
+    return os.path.join(os.path.dirname(directory), stem)
+
+
+def pending_image_fields(instance, update_fields=None):
+    """ Image fields of the instance holding a file that hasn't been processed yet """
+    pending = []
+    for field_name in IMAGE_FIELDS.get(instance._meta.label_lower, ()):
+        if update_fields is not None and field_name not in update_fields:
+            continue
+        field_file = getattr(instance, field_name)
+        processed = (instance.media_variants or {}).get(field_name) or {}
+        if field_file and processed.get('source') != field_file.name:
+            pending.append(field_name)
+    return pending
+
+
+def _flatten(image):
+    """ RGB copy of the image, transparent areas on white since JPEG has no alpha channel """
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def _encode(image, image_format):
+    pil_format, options = IMAGE_FORMATS[image_format]
+    buffer = io.BytesIO()
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def _replace(storage, name, content):
+    """ Write content under exactly this name, storages pick a new name rather than overwrite """
+    if storage.exists(name):
+        storage.delete(name)
+    return storage.save(name, ContentFile(content))
+
+
+def process_image(field_file):
+    """
+    Strip the EXIF data of an uploaded image and generate its resized variants.
+
+    The orientation tag is applied to the pixels first so photos taken sideways stay upright, then the
+    original is re-encoded without metadata (GPS position, device) when it carried any.
+
+    Args:
+        field_file: FieldFile of the uploaded image
+
+    Returns:
+        dict: media_variants entry of the field: source name, width, height and per variant the
+        width, height and storage name of each format
+    """
+    storage = field_file.storage
+    with storage.open(field_file.name, 'rb') as source:
+        image = Image.open(source)
+        image.load()
+    original_format = image.format or 'JPEG'
+    has_metadata = bool(image.getexif()) or any(key in image.info for key in ('exif', 'xmp', 'XML:com.adobe.xmp'))
+    image = ImageOps.exif_transpose(image)
+
+    if has_metadata:
+        # Saving without exif= drops the metadata, the colour profile is kept
+        options = {'icc_profile': image.info['icc_profile']} if image.info.get('icc_profile') else {}
+        if original_format == 'JPEG':
+            options['quality'] = 92
+            stripped = image if image.mode in ('RGB', 'L') else image.convert('RGB')
+        else:
+            stripped = image
+        buffer = io.BytesIO()
+        stripped.save(buffer, original_format, **options)
+        _replace(storage, field_file.name, buffer.getvalue())
+
+    flat = _flatten(image)
+    variants = {}
+    for variant, size in IMAGE_VARIANTS.items():
+        resized = flat.copy()
+        resized.thumbnail(size, Image.Resampling.LANCZOS)
+        variants[variant] = {'width': resized.width, 'height': resized.height}
+        for image_format in IMAGE_FORMATS:
+            variants[variant][image_format] = _replace(
+                storage, variant_name(field_file.name, variant, image_format), _encode(resized, image_format)
+            )
+
+    return {
+        'source': field_file.name,
+        'width': image.width,
+        'height': image.height,
+        'variants': variants,
+    }
+
+
+def process_image_field(model_label, pk, field_name):
+    """
+    Process one image field of a saved instance and record the result in its media_variants.
+
+    Safe to run twice or late: nothing happens when the image was already processed, or was replaced
+    or removed since the task was queued (the task queued for the new file handles it).
+
+    Returns:
+        dict: The recorded media_variants entry, None when there was nothing to do
+    """
+    model = apps.get_model(model_label)
+    instance = model.objects.filter(pk=pk).only(field_name, 'media_variants').first()
+    if instance is None or field_name not in pending_image_fields(instance):
+        return None
+    field_file = getattr(instance, field_name)
+    entry = process_image(field_file)
+
+    with transaction.atomic():
+        current = model.objects.select_for_update().filter(pk=pk).only(field_name, 'media_variants').first()
+        if current is None or getattr(current, field_name).name != field_file.name:
+            return None
+        media_variants = dict(current.media_variants or {})
+        previous = media_variants.get(field_name)
+        media_variants[field_name] = entry
+        model.objects.filter(pk=pk).update(media_variants=media_variants)
+
+    # Variants of the image this one replaced
+    if previous and previous.get('source') != entry['source']:
+        for variant in previous.get('variants', {}).values():
+            for image_format in IMAGE_FORMATS:
+                if variant.get(image_format):
+                    field_file.storage.delete(variant[image_format])
+    return entry
@@ -0,0 +1,108 @@
+from collections import defaultdict
+from decimal import Decimal
+from django.db import transaction
+from django.utils import timezone
+from ..models import BankAccount, Detailer, Earning, PayoutBatch, PayoutRun
+
+
+def weekly_run_id(day=None, source='beat'):
+    """ Build the run id of a weekly payout, e.g. "beat-weekly-2025-W34" for the scheduled one.
+        Two runs of a source in the same ISO week share the id, which is what makes the schedule idempotent.
+        Manual runs use their own source, so one of them never stands in for the week's scheduled run.
+    """
+    day = day or timezone.localdate()
+    year, week, _ = day.isocalendar()
+    return f"{source}-weekly-{year}-W{week:02d}"
+
+
+def run_payouts(run_id, payout_date=None, detailer_ids=None, batch_size=1000):
+    """
+    Settle every pending earning, grouped into one payout batch per detailer.
+
+    The whole run happens inside a single transaction: the pending earnings are locked,
+    summed per detailer in memory, the batches are inserted with bulk_create and the
+    earnings are stamped with bulk_update. The detailers' running totals are moved from unpaid
+    to paid in one more UPDATE. The query count is constant in the number of earnings apart
+    from the bulk_update chunks.
+
+    Args:
+        run_id: Idempotency key. A run that already completed is returned untouched.
+        payout_date: Date stamped on the paid earnings, defaults to today.
+        detailer_ids: Optional list of detailer ids to restrict the run to.
+        batch_size: Chunk size for bulk_create and bulk_update.
+
+    Returns:
+        The PayoutRun
+    """
+    payout_date = payout_date or timezone.localdate()
+
+    with transaction.atomic():
+        run, _ = PayoutRun.objects.select_for_update().get_or_create(
+            run_id=run_id,
+            defaults={'payout_date': payout_date},
+        )
+        if run.status == 'completed':
+            return run
+
+        pending = Earning.objects.select_for_update().filter(
+            payment_status='pending',
+            payout_batch__isnull=True,
+        )
+        if detailer_ids:
+            pending = pending.filter(detailer_id__in=detailer_ids)
+        earnings = list(
+            pending.only('id', 'detailer_id', 'net_amount', 'tip_amount').order_by('detailer_id', 'id')
+        )
+
+        # Group and total the earnings per detailer
+        grouped = defaultdict(list)
+        for earning in earnings:
+            grouped[earning.detailer_id].append(earning)
+
+        primary_accounts = dict(
+            BankAccount.objects.filter(detailer_id__in=grouped.keys(), is_primary=True)
+            .values_list('detailer_id', 'id')
+        )
+
+        batches = []
+        for detailer_id, detailer_earnings in grouped.items():
+            net_amount = sum((e.net_amount or Decimal('0') for e in detailer_earnings), Decimal('0'))
+            tip_amount = sum((e.tip_amount or Decimal('0') for e in detailer_earnings), Decimal('0'))
+            batches.append(PayoutBatch(
+                run=run,
+                detailer_id=detailer_id,
+                bank_account_id=primary_accounts.get(detailer_id),
+                earning_count=len(detailer_earnings),
+                net_amount=net_amount,
+                tip_amount=tip_amount,
+                total_amount=net_amount + tip_amount,
+            ))
+        PayoutBatch.objects.bulk_create(batches, batch_size=batch_size)
+
+        # Stamp every earning with its batch in a handful of UPDATE statements
+        for batch in batches:
+            for earning in grouped[batch.detailer_id]:
+                earning.payment_status = 'paid'
+                earning.payout_date = payout_date
+                earning.payout_batch = batch
+        Earning.objects.bulk_update(
+            earnings,
+            ['payment_status', 'payout_date', 'payout_batch'],
+            batch_size=batch_size,
+        )
+
+        # Move the paid amounts from the unpaid to the paid running totals
+        Detailer.objects.apply_balance_deltas({
+            batch.detailer_id: {'unpaid_net_total': -batch.net_amount, 'paid_net_total': batch.net_amount}
+            for batch in batches
+        })
+
+        run.payout_date = payout_date
+        run.status = 'completed'
+        run.batch_count = len(batches)
+        run.earning_count = len(earnings)
+        run.total_amount = sum((b.total_amount for b in batches), Decimal('0'))
+        run.completed_at = timezone.now()
+        run.save()
+
+    return run
@@ -0,0 +1,249 @@
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+from ..cache_versions import bump, current_version
+from ..catalog import service_name
+from ..models import Job
+from .geo import coordinates, haversine_matrix
+
+
+""" A detailer's day as a route through the stops of their booked jobs. Appointments are fixed, a stop
+    may be started from its appointment time until ROUTE_ARRIVAL_WINDOW minutes later, so the order
+    only changes where windows overlap or a detour can be saved without running late. On a SHARED_CACHE
+    routes are cached per detailer-day under a version the Job signals bump (see signals.py).
+"""
+
+
+def _minute_of_day(value):
+    local = timezone.localtime(value)
+    return local.hour * 60 + local.minute
+
+
+def _schedule(order, travel, ready, due, service):
+    """
+    Walk the stops in order from the start node 0, waiting when early.
+
+    Returns:
+        tuple: (begin minute of every stop, total minutes late)
+    """
+    begins = []
+    late = 0.0
+    now = None
+    previous = 0
+    for stop in order:
+        # The detailer leaves in time for the first stop, travel only counts after it
+        arrival = ready[stop] if now is None else now + travel[previous, stop]
+        begin = max(arrival, ready[stop])
+        late += max(0.0, begin - due[stop])
+        begins.append(begin)
+        now = begin + service[stop]
+        previous = stop
+    return begins, late
+
+
+def _nearest_neighbour(travel, ready, due, service):
+    """
+    From the start, go to the stop that can be begun soonest without missing its window, the nearest
+    of those begun at the same time, or the most urgent stop when none can make it
+    """
+    unvisited = set(range(1, len(ready)))
+    order = []
+    now, previous = None, 0
+    while unvisited:
+        candidates = np.array(sorted(unvisited))
+        legs = travel[previous, candidates]
+        begin = ready[candidates] if now is None else np.maximum(now + legs, ready[candidates])
+        feasible = begin <= due[candidates]
+        if feasible.any():
+            stop = candidates[feasible][np.lexsort((legs[feasible], begin[feasible]))[0]]
+        else:
+            stop = candidates[np.argmin(due[candidates])]
+        stop = int(stop)
+        now = (ready[stop] if now is None else max(now + travel[previous, stop], ready[stop])) + service[stop]
+        previous = stop
+        order.append(stop)
+        unvisited.remove(stop)
+    return order
+
+
+def _two_opt(order, distance, travel, ready, due, service, max_passes=50):
+    """
+    Reverse the segment that shortens the route most without making it later, until none does.
+
+    The length change of every segment reversal is computed at once: with a zero cost end node
+    appended, reversing path[i..k] swaps edges (i-1, i) and (k, k+1) for (i-1, k) and (i, k+1).
+    """
+    end = len(distance)
+    padded = np.zeros((end + 1, end + 1))
+    padded[:end, :end] = distance
+    _, late = _schedule(order, travel, ready, due, service)
+    for _ in range(max_passes):
+        path = np.array([0] + order + [end])
+        i, k = np.triu_indices(len(order), k=1)
+        i, k = i + 1, k + 1
+        delta = (
+            padded[path[i - 1], path[k]] + padded[path[i], path[k + 1]]
+            - padded[path[i - 1], path[i]] - padded[path[k], path[k + 1]]
+        )
+        improved = False
+        for move in np.argsort(delta):
+            if delta[move] >= -1e-9:
+                break
+            first, last = i[move] - 1, k[move] - 1
+            candidate = order[:first] + order[first:last + 1][::-1] + order[last + 1:]
+            _, candidate_late = _schedule(candidate, travel, ready, due, service)
+            if candidate_late <= late + 1e-9:
+                order, late, improved = candidate, candidate_late, True
+                break
+        if not improved:
+            break
+    return order
+
+
+def plan_route(stops, start=None, speed_kmh=None, detour_factor=None, arrival_window=None):
+    """
+    Order a day's stops to minimise driving while keeping to the appointment times.
+
+    Args:
+        stops: (stop_id, latitude, longitude, appointment_start, appointment_end) of the day's jobs,
+            with known coordinates
+        start: (latitude, longitude) the detailer sets off from, the first stop when None
+        speed_kmh: Average driving speed, defaults to ROUTE_SPEED_KMH
+        detour_factor: Road distance over straight line distance, defaults to ROUTE_DETOUR_FACTOR
+        arrival_window: Minutes after the appointment time a stop may still be begun, defaults to ROUTE_ARRIVAL_WINDOW
+
+    Returns:
+        dict: order (stop ids), stops (id, begin minute of the day, leg km and minutes, late),
+            distance_km, travel_minutes, late_minutes, and the appointment_order_km and
+            appointment_order_late_minutes of the stops in appointment order
+    """
+    speed_kmh = speed_kmh or settings.ROUTE_SPEED_KMH
+    detour_factor = detour_factor or settings.ROUTE_DETOUR_FACTOR
+    arrival_window = settings.ROUTE_ARRIVAL_WINDOW if arrival_window is None else arrival_window
+    if not stops:
+        return {
+            'order': [], 'stops': [], 'distance_km': 0.0, 'travel_minutes': 0.0, 'late_minutes': 0.0,
+            'appointment_order_km': 0.0, 'appointment_order_late_minutes': 0.0,
+        }
+
+    # Node 0 is the start, stops are nodes 1..n. Without a start its distances are all zero
+    latitudes = coordinates([start[0] if start else None] + [stop[1] for stop in stops])
+    longitudes = coordinates([start[1] if start else None] + [stop[2] for stop in stops])
+    distance = np.nan_to_num(haversine_matrix(latitudes, longitudes)) * detour_factor
+    travel = distance / speed_kmh * 60
+    ready = np.array([0.0] + [_minute_of_day(stop[3]) for stop in stops])
+    due = ready + arrival_window
+    service = np.array([0.0] + [(stop[4] - stop[3]).total_seconds() / 60 for stop in stops])
+
+    # Nearest neighbour drives less, the appointment order runs late less often where windows are tight:
+    # both are improved with 2-opt and the route with the fewest minutes late, then the shortest, wins
+    appointment_order = sorted(range(1, len(stops) + 1), key=lambda node: (ready[node], node))
+
+    def ranking(order):
+        return round(_schedule(order, travel, ready, due, service)[1], 6), distance[[0] + order[:-1], order].sum()
+
+    order = min(
+        (_two_opt(seed, distance, travel, ready, due, service) for seed in (_nearest_neighbour(travel, ready, due, service), appointment_order)),
+        key=ranking,
+    )
+    begins, late = _schedule(order, travel, ready, due, service)
+    legs = distance[[0] + order[:-1], order]
+    return {
+        'order': [stops[node - 1][0] for node in order],
+        'stops': [
+            {
+                'id': stops[node - 1][0],
+                'begin_minute': int(round(begin)),
+                'leg_km': round(float(leg), 2),
+                'leg_minutes': round(float(leg) / speed_kmh * 60, 1),
+                'late': bool(begin > due[node] + 1e-9),
+            }
+            for node, begin, leg in zip(order, begins, legs)
+        ],
+        'distance_km': round(float(legs.sum()), 2),
+        'travel_minutes': round(float(legs.sum()) / speed_kmh * 60, 1),
+        'late_minutes': round(float(late), 1),
+        'appointment_order_km': round(float(distance[[0] + appointment_order[:-1], appointment_order].sum()), 2),
+        'appointment_order_late_minutes': round(float(_schedule(appointment_order, travel, ready, due, service)[1]), 1),
+    }
+
+
+def _version_key(detailer_id, day):
+    return f'routes:version:{detailer_id}:{day.isoformat()}'
+
+
+def invalidate_route(detailer_id, day):
+    """ Make the cached route of a detailer-day unreachable """
+    bump(_version_key(detailer_id, day))
+
+
+def _route_key(detailer, day):
+    version = current_version(_version_key(detailer.pk, day))
+    # The start position is part of the key, a detailer moving gets a new route without any invalidation
+    return f'routes:{detailer.pk}:{day.isoformat()}:{detailer.latitude}:{detailer.longitude}:{version}'
+
+
+def _format_minute(minute):
+    return f"{minute // 60 % 24:02d}:{minute % 60:02d}"
+
+
+def detailer_route(detailer, day):
+    """
+    The optimised route of a detailer's booked jobs on a day, from the cache, planned on a miss or
+    without a SHARED_CACHE.
+
+    Jobs without coordinates can't be placed and are listed apart, in appointment order. A route that
+    gets cached is planned from the primary even inside replica_reads(): planned from a lagging replica
+    after the version was bumped, it would be cached under the new version with the old jobs.
+
+    Returns:
+        dict: Response payload of DashboardView.get_route
+    """
+    # Without a SHARED_CACHE the other workers would never see a job change bump the version
+    key = _route_key(detailer, day) if settings.SHARED_CACHE else None
+    route = cache.get(key) if key else None
+    if route is not None:
+        return route
+
+    booked = Job.objects.filter(detailer=detailer, status__in=Job.BOOKED_STATUSES, appointment_start__isnull=False)
+    if key:
+        booked = booked.using(DEFAULT_DB_ALIAS)
+    jobs = {
+        job['id']: job
+        for job in booked.on_day(day).order_by('appointment_start').values(
+            'id', 'client_name', 'address', 'service_type_id', 'latitude', 'longitude', 'appointment_start', 'appointment_end',
+        )
+    }
+    located = [job for job in jobs.values() if job['latitude'] is not None and job['longitude'] is not None]
+    unrouted = [str(job_id) for job_id, job in jobs.items() if job['latitude'] is None or job['longitude'] is None]
+    start = (detailer.latitude, detailer.longitude) if detailer.latitude is not None and detailer.longitude is not None else None
+    plan = plan_route(
+        [(job['id'], job['latitude'], job['longitude'], job['appointment_start'], job['appointment_end']) for job in located],
+        start=start,
+    )
+    route = {
+        "date": day.isoformat(),
+        "stops": [
+            {
+                "jobId": str(stop['id']),
+                "clientName": jobs[stop['id']]['client_name'],
+                "serviceType": service_name(jobs[stop['id']]['service_type_id']),
+                "address": jobs[stop['id']]['address'],
+                "appointmentTime": timezone.localtime(jobs[stop['id']]['appointment_start']).strftime("%H:%M"),
+                "startTime": _format_minute(stop['begin_minute']),
+                "legDistanceKm": stop['leg_km'],
+                "legMinutes": stop['leg_minutes'],
+                "late": stop['late'],
+            }
+            for stop in plan['stops']
+        ],
+        "totalDistanceKm": plan['distance_km'],
+        "totalTravelMinutes": plan['travel_minutes'],
+        "appointmentOrderDistanceKm": plan['appointment_order_km'],
+        "unrouted": unrouted,
+    }
+    if key:
+        cache.set(key, route, settings.ROUTE_CACHE_TIMEOUT)
+    return route
@@ -0,0 +1,287 @@
+import random
+import time
+from datetime import datetime, time as dt_time, timedelta
+from decimal import Decimal
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+from ..catalog import invalidate_catalog
+from ..models import (
+    Availability, Detailer, Earning, Job, Review, ServiceType, User, add_balance_delta, balance_deltas,
+)
+from ..utils import appointment_window, split_earning
+
+SEED_PASSWORD = 'seedpass123'
+
+# name: (country, latitude, longitude)
+CITIES = {
+    'London': ('UK', 51.5072, -0.1276),
+    'Manchester': ('UK', 53.4808, -2.2426),
+    'Birmingham': ('UK', 52.4862, -1.8904),
+    'Leeds': ('UK', 53.8008, -1.5491),
+    'Glasgow': ('UK', 55.8642, -4.2518),
+    'Bristol': ('UK', 51.4545, -2.5879),
+    'Dublin': ('Ireland', 53.3498, -6.2603),
+    'Cork': ('Ireland', 51.8985, -8.4756),
+}
+
+DEFAULT_CITY_WEIGHTS = {
+    'London': 40, 'Manchester': 12, 'Birmingham': 12, 'Leeds': 8,
+    'Glasgow': 8, 'Bristol': 6, 'Dublin': 10, 'Cork': 4,
+}
+
+DEFAULT_SERVICE_TYPES = [
+    ('Basic Wash', 'traditional', 45, 25.0),
+    ('Waterless Exterior', 'waterless', 60, 35.0),
+    ('Full Interior Clean', 'steam', 90, 60.0),
+    ('Full Valet', 'traditional', 120, 85.0),
+    ('Steam Deep Clean', 'steam', 180, 140.0),
+]
+
+FIRST_NAMES = ['James', 'Olivia', 'Liam', 'Amelia', 'Noah', 'Isla', 'Jack', 'Ava', 'Conor', 'Aoife', 'Mohammed', 'Priya']
+LAST_NAMES = ['Smith', 'Jones', 'Murphy', 'Kelly', 'Brown', 'Taylor', 'Wilson', 'Walsh', 'Khan', 'Patel', 'Byrne', 'Evans']
+VEHICLES = [
+    ('Toyota', 'Corolla'), ('Ford', 'Focus'), ('Volkswagen', 'Golf'), ('BMW', '3 Series'),
+    ('Audi', 'A4'), ('Tesla', 'Model 3'), ('Nissan', 'Qashqai'), ('Kia', 'Sportage'),
+]
+COLORS = ['White', 'Black', 'Silver', 'Grey', 'Blue', 'Red']
+COMMENTS = [None, 'Great job, car looks new', 'On time and friendly', 'Good wash, missed a spot', 'Excellent interior clean']
+
+WORKDAY_START = 8  # first slot of a working day, hour
+SLOTS_PER_DAY = 5
+
+
+def parse_city_weights(spec):
+    """ Parse "London:40,Dublin:10" into {'London': 40.0, 'Dublin': 10.0} """
+    weights = {}
+    for part in spec.split(','):
+        name, _, weight = part.partition(':')
+        if name.strip():
+            weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+def ensure_service_types():
+    """ Use the existing catalogue, or create a small default one on an empty database """
+    service_types = list(ServiceType.objects.all())
+    if not service_types:
+        service_types = ServiceType.objects.bulk_create(
+            ServiceType(name=name, wash_type=wash_type, duration=duration, price=price)
+            for name, wash_type, duration, price in DEFAULT_SERVICE_TYPES
+        )
+        # bulk_create sends no post_save, drop the cached catalog by hand
+        invalidate_catalog()
+    return service_types
+
+
+class _Buffer:
+    """ Pending rows of one seeding run, flushed with bulk_create once batch_size jobs are queued """
+    def __init__(self, batch_size, review_rate, rng, progress=None):
+        self.batch_size = batch_size
+        self.review_rate = review_rate
+        self.rng = rng
+        self.progress = progress
+        self.jobs = []
+        self.availability = []
+        self.counts = {'jobs': 0, 'earnings': 0, 'reviews': 0, 'availability': 0}
+
+    def maybe_flush(self):
+        if len(self.jobs) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        with transaction.atomic():
+            jobs = Job.objects.bulk_create(self.jobs, batch_size=self.batch_size)
+            earnings, reviews = [], []
+            deltas = balance_deltas()
+            # Earnings settle a week after the job, older ones have been paid out
+            paid_before = timezone.now() - timedelta(days=7)
+            for job in jobs:
+                if job.status != 'completed':
+                    continue
+                gross_amount, commission, net_amount = split_earning(
+                    job._seed_price, job._seed_commission_rate,
+                )
+                paid = job.appointment_start < paid_before
+                payment_status = 'paid' if paid else 'pending'
+                earnings.append(Earning(
+                    detailer_id=job.detailer_id,
+                    job_id=job.pk,
+                    gross_amount=gross_amount,
+                    commission=commission,
+                    net_amount=net_amount,
+                    tip_amount=Decimal(self.rng.choice([0, 0, 0, 2, 5, 10])),
+                    payment_status=payment_status,
+                    payout_date=(job.appointment_start + timedelta(days=7)).date() if paid else None,
+                ))
+                add_balance_delta(deltas, job.detailer_id, payment_status, net_amount)
+                if self.rng.random() < self.review_rate:
+                    reviews.append(Review(
+                        job_id=job.pk,
+                        detailer_id=job.detailer_id,
+                        rating=Decimal(self.rng.choice(['3.00', '4.00', '4.50', '5.00', '5.00'])),
+                        comment=self.rng.choice(COMMENTS),
+                    ))
+            Earning.objects.bulk_create(earnings, batch_size=self.batch_size)
+            Review.objects.bulk_create(reviews, batch_size=self.batch_size)
+            Availability.objects.bulk_create(self.availability, batch_size=self.batch_size)
+            Detailer.objects.apply_balance_deltas(deltas)
+
+        self.counts['jobs'] += len(jobs)
+        self.counts['earnings'] += len(earnings)
+        self.counts['reviews'] += len(reviews)
+        self.counts['availability'] += len(self.availability)
+        self.jobs, self.availability = [], []
+        if self.progress:
+            self.progress(self.counts)
+
+
+def seed_data(
+    detailers=1000,
+    jobs_per_detailer=200,
+    days_back=365,
+    days_ahead=30,
+    availability_days=14,
+    city_weights=None,
+    activity_skew=1.5,
+    review_rate=0.4,
+    seed=42,
+    batch_size=5000,
+    progress=None,
+):
+    """
+    Generate a production sized data set: detailers with their users, jobs, earnings, reviews
+    and availability calendars.
+
+    Every row is inserted with bulk_create in chunks of batch_size, one transaction per chunk.
+    The users share a single password hash computed once, the running totals of the detailers
+    are kept correct with one apply_balance_deltas UPDATE per chunk, and the same seed always
+    produces the same data.
+
+    Args:
+        detailers: Number of detailers to create
+        jobs_per_detailer: Average number of jobs per detailer
+        days_back: Jobs are spread from this many days ago...
+        days_ahead: ...to this many days ahead, past jobs are mostly completed, future ones pending or accepted
+        availability_days: Days of availability calendar created per detailer from today
+        city_weights: {city: weight} distribution of detailers and jobs, defaults to DEFAULT_CITY_WEIGHTS
+        activity_skew: Pareto shape of the jobs per detailer, lower values concentrate the jobs on fewer busy detailers
+        review_rate: Share of completed jobs that get a review
+        seed: Random seed, also part of the generated emails, phones and booking references
+        batch_size: Rows per bulk_create chunk
+        progress: Optional callable receiving the counts after every chunk
+
+    Returns:
+        dict: Number of rows created per model and the elapsed seconds
+    """
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    city_weights = city_weights or DEFAULT_CITY_WEIGHTS
+    city_names = list(city_weights)
+    city_weight_values = list(city_weights.values())
+    service_types = ensure_service_types()
+    # Slots are long enough for the longest service so seeded jobs never double book a detailer
+    slot_minutes = max(60, -(-max(service.duration for service in service_types) // 30) * 30)
+    slots_per_day = min(SLOTS_PER_DAY, (24 - WORKDAY_START) * 60 // slot_minutes)
+    password = make_password(SEED_PASSWORD)
+
+    # Users and detailers, created first so the jobs can reference their ids
+    users, detailer_rows = [], []
+    for n in range(detailers):
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        email = f'seed{seed}.detailer{n}@example.com'
+        users.append(User(
+            email=email,
+            username=email,
+            first_name=first_name,
+            last_name=last_name,
+            phone=f'9{seed % 1000:03d}{n:08d}',
+            password=password,
+            is_detailer=True,
+        ))
+    with transaction.atomic():
+        users = User.objects.bulk_create(users, batch_size=batch_size)
+        for user in users:
+            city = rng.choices(city_names, weights=city_weight_values)[0]
+            country, latitude, longitude = CITIES.get(city, ('UK', None, None))
+            detailer_rows.append(Detailer(
+                user_id=user.pk,
+                city=city,
+                country=country,
+                latitude=latitude + rng.uniform(-0.1, 0.1) if latitude is not None else None,
+                longitude=longitude + rng.uniform(-0.1, 0.1) if longitude is not None else None,
+                rating=round(rng.uniform(3.5, 5.0), 2),
+                commission_rate=rng.choice([0.1, 0.15, 0.15, 0.2]),
+                is_verified=rng.random() < 0.8,
+            ))
+        detailer_rows = Detailer.objects.bulk_create(detailer_rows, batch_size=batch_size)
+
+    # Busy detailers follow a Pareto distribution, normalised to the requested average
+    activity = [rng.paretovariate(activity_skew) for _ in detailer_rows]
+    scale = jobs_per_detailer / (sum(activity) / len(activity)) if activity else 0
+
+    today = timezone.localdate()
+    now = timezone.now()
+    total_days = days_back + days_ahead + 1
+    buffer = _Buffer(batch_size, review_rate, rng, progress)
+    job_number = 0
+
+    for detailer, detailer_activity in zip(detailer_rows, activity):
+        job_count = min(int(detailer_activity * scale), total_days * slots_per_day)
+        for slot in sorted(rng.sample(range(total_days * slots_per_day), job_count)):
+            day = today + timedelta(days=slot // slots_per_day - days_back)
+            minutes = WORKDAY_START * 60 + (slot % slots_per_day) * slot_minutes
+            appointment_time = dt_time(minutes // 60, minutes % 60)
+            appointment_date = timezone.make_aware(datetime.combine(day, appointment_time))
+            service = rng.choice(service_types)
+            start, end = appointment_window(appointment_date, appointment_time, service.duration)
+            if end <= now:
+                status = rng.choices(['completed', 'cancelled'], weights=[9, 1])[0]
+            elif start <= now:
+                status = 'in_progress'
+            else:
+                status = rng.choices(['pending', 'accepted', 'cancelled'], weights=[3, 6, 1])[0]
+            make, model = rng.choice(VEHICLES)
+            job = Job(
+                detailer_id=detailer.pk,
+                service_type_id=service.pk,
+                booking_reference=f'SEED{seed}-{job_number:09d}',
+                client_name=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                client_phone=f'07{rng.randrange(10 ** 9):09d}',
+                vehicle_registration=f'{rng.choice("ABCDEFGHJK")}{rng.randrange(10, 99)} {rng.randrange(100, 999)}',
+                vehicle_make=make,
+                vehicle_model=model,
+                vehicle_color=rng.choice(COLORS),
+                vehicle_year=rng.randrange(2008, today.year + 1),
+                address=f'{rng.randrange(1, 300)} High Street',
+                city=detailer.city,
+                post_code=f'{rng.choice("ENSW")}{rng.randrange(1, 20)} {rng.randrange(1, 9)}AB',
+                country=detailer.country,
+                latitude=detailer.latitude + rng.uniform(-0.05, 0.05) if detailer.latitude is not None else None,
+                longitude=detailer.longitude + rng.uniform(-0.05, 0.05) if detailer.longitude is not None else None,
+                appointment_date=appointment_date,
+                appointment_time=appointment_time,
+                appointment_start=start,
+                appointment_end=end,
+                status=status,
+            )
+            job._seed_price = service.price
+            job._seed_commission_rate = detailer.commission_rate
+            buffer.jobs.append(job)
+            job_number += 1
+            buffer.maybe_flush()
+
+        for offset in range(availability_days):
+            day = today + timedelta(days=offset)
+            if day.weekday() < 6:
+                buffer.availability.append(Availability(
+                    detailer_id=detailer.pk,
+                    date=day,
+                    start_time=dt_time(WORKDAY_START),
+                    end_time=dt_time(18),
+                ))
+
+    buffer.flush()
+    counts = {'users': len(users), 'detailers': len(detailer_rows), **buffer.counts}
+    counts['seconds'] = round(time.perf_counter() - started, 2)
+    return counts
@@ -0,0 +1,262 @@
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import time, timedelta
+from urllib.parse import quote
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from ..cache_versions import bump, current_versions
+from ..catalog import service_types
+from ..models import Availability, Detailer, Job
+
+# Bookable hours of a day without any availability set: 6 AM to 9 PM
+BUSINESS_START = time(6, 0)
+BUSINESS_END = time(21, 0)
+
+# Travel time between two jobs, in minutes
+TRAVEL_INTERVAL = 30
+
+# Duration get_timeslots falls back to, always precomputed along the catalog durations
+DEFAULT_SERVICE_DURATION = 60
+
+
+""" Slot grids are cached per city, day and service duration, under two version numbers: the city's,
+    bumped when a detailer of the city joins, leaves or moves, and the city-day's, bumped when a job or
+    an availability of that day changes (see signals.py). A change only makes the grids it touches
+    unreachable, the beat schedule fills the next SLOT_PRECOMPUTE_DAYS days every night and changed
+    days are refreshed in the background, so customers never compute a grid themselves. Without a
+    SHARED_CACHE a change would only reach the process that made it, grids are computed per request.
+"""
+
+
+def _city(city):
+    """ Detailers are matched on city__iexact, grids on the lowercased city """
+    return city.lower()
+
+
+def _city_version_key(city):
+    return f'slots:version:{quote(city)}'
+
+
+def _day_version_key(city, day):
+    return f'slots:version:{quote(city)}:{day.isoformat()}'
+
+
+def _grid_key(city, day, duration, versions):
+    city_version = versions[_city_version_key(city)]
+    day_version = versions[_day_version_key(city, day)]
+    return f'slots:{quote(city)}:{day.isoformat()}:{duration}:{city_version}.{day_version}'
+
+
+def _versions(city_days):
+    """ Current version of every city and city-day """
+    keys = set()
+    for city, day in city_days:
+        keys.add(_city_version_key(city))
+        keys.add(_day_version_key(city, day))
+    return current_versions(keys)
+
+
+def invalidate_slots(city, day=None):
+    """ Make the cached grids of a city-day, or of every day of the city without a day, unreachable """
+    city = _city(city)
+    bump(_day_version_key(city, day) if day else _city_version_key(city))
+
+
+def common_durations():
+    """ Service durations worth precomputing: every duration of the catalog and the default """
+    return sorted({entry['duration'] for entry in service_types()} | {DEFAULT_SERVICE_DURATION})
+
+
+def generate_time_slots(start_time, end_time, service_duration, travel_interval=TRAVEL_INTERVAL):
+    """
+    Generate all possible time slots between two times of a day
+
+    Args:
+        start_time: Start of the window (time object)
+        end_time: End of the window (time object)
+        service_duration: Service duration in minutes
+        travel_interval: Travel time interval in minutes
+
+    Returns:
+        List of time slot dictionaries
+    """
+    slots = []
+    current_minutes = start_time.hour * 60 + start_time.minute
+    window_end = end_time.hour * 60 + end_time.minute
+
+    while current_minutes < window_end:
+        end_minutes = current_minutes + service_duration
+        # Stop once a slot would extend beyond the window
+        if end_minutes > window_end:
+            break
+        slots.append({
+            "start_time": f"{current_minutes // 60:02d}:{current_minutes % 60:02d}",
+            "end_time": f"{end_minutes // 60:02d}:{end_minutes % 60:02d}",
+            "is_available": True
+        })
+        # Move to next slot (service duration + travel interval)
+        current_minutes = end_minutes + travel_interval
+    return slots
+
+
+def merge_blocked(windows, travel_interval=TRAVEL_INTERVAL):
+    """
+    Merge appointment windows, with the travel interval added after each job, into sorted blocked
+    ranges in minutes of the day
+
+    Args:
+        windows: (appointment_start, appointment_end) pairs of aware datetimes, sorted by start
+    """
+    blocked = []
+    for job_start, job_end in windows:
+        local = timezone.localtime(job_start)
+        start_minutes = local.hour * 60 + local.minute
+        end_minutes = start_minutes + int((job_end - job_start).total_seconds() // 60) + travel_interval
+        if blocked and start_minutes <= blocked[-1][1]:
+            blocked[-1][1] = max(blocked[-1][1], end_minutes)
+        else:
+            blocked.append([start_minutes, end_minutes])
+    return blocked
+
+
+def slot_grid(availability_windows, blocked, service_duration, travel_interval=TRAVEL_INTERVAL):
+    """
+    Free slots of a day in a city
+
+    Args:
+        availability_windows: (start_time, end_time) of the detailers' availability that day, business
+            hours apply when there is none
+        blocked: Blocked ranges from merge_blocked
+        service_duration: Service duration in minutes
+
+    Returns:
+        List of available time slots, sorted by start time
+    """
+    if availability_windows:
+        # Slots of every detailer's window, once per start and end time
+        all_slots = {}
+        for start_time, end_time in availability_windows:
+            for slot in generate_time_slots(start_time, end_time, service_duration, travel_interval):
+                all_slots.setdefault((slot['start_time'], slot['end_time']), slot)
+        all_slots = [all_slots[key] for key in sorted(all_slots)]
+    else:
+        all_slots = generate_time_slots(BUSINESS_START, BUSINESS_END, service_duration, travel_interval)
+
+    blocked_ends = [end for _, end in blocked]
+    available_slots = []
+    for slot in all_slots:
+        slot_start_minutes = int(slot['start_time'][:2]) * 60 + int(slot['start_time'][3:])
+        slot_end_minutes = int(slot['end_time'][:2]) * 60 + int(slot['end_time'][3:])
+        # The slot conflicts when it starts before the first blocked range that ends after the
+        # slot start (job end + travel time) is over, and ends after that range begins
+        index = bisect_right(blocked_ends, slot_start_minutes)
+        if not (index < len(blocked) and slot_end_minutes > blocked[index][0]):
+            available_slots.append(slot)
+    return available_slots
+
+
+def build_grids(first_day, last_day, durations, city=None):
+    """
+    Compute the slot grids of every city with active detailers, or of one city, over a range of days.
+
+    Three queries whatever the number of cities, days and durations. Versions are read before the
+    rows, so a grid computed from rows a concurrent change has since replaced is stored under the
+    version that change retired.
+
+    Returns:
+        dict: {cache key: {'slots': [...] or None when the city has no active detailer}}
+    """
+    detailers = Detailer.objects.filter(is_active=True, city__isnull=False)
+    if city is not None:
+        detailers = detailers.filter(city__iexact=city)
+    cities = {_city(name) for name in detailers.values_list('city', flat=True).distinct()}
+    if city is not None and not cities:
+        cities = {_city(city)}
+        detailers = None
+
+    days = [first_day + timedelta(days=offset) for offset in range((last_day - first_day).days + 1)]
+    versions = _versions([(name, day) for name in cities for day in days])
+
+    availability = defaultdict(list)
+    blocked_windows = defaultdict(list)
+    if detailers is not None:
+        for name, day, start_time, end_time in Availability.objects.filter(
+            detailer__in=detailers, date__gte=first_day, date__lte=last_day, is_available=True
+        ).values_list('detailer__city', 'date', 'start_time', 'end_time'):
+            availability[(_city(name), day)].append((start_time, end_time))
+        for name, job_start, job_end in Job.objects.filter(
+            detailer__in=detailers, status__in=Job.SLOT_STATUSES, appointment_start__isnull=False
+        ).between_days(first_day, last_day).order_by('appointment_start').values_list(
+            'detailer__city', 'appointment_start', 'appointment_end'
+        ):
+            blocked_windows[(_city(name), timezone.localdate(job_start))].append((job_start, job_end))
+
+    grids = {}
+    for name in cities:
+        for day in days:
+            blocked = merge_blocked(blocked_windows[(name, day)])
+            for duration in durations:
+                slots = None if detailers is None else slot_grid(availability[(name, day)], blocked, duration)
+                grids[_grid_key(name, day, duration, versions)] = {'slots': slots}
+    return grids
+
+
+def get_slots(city, day, service_duration):
+    """
+    Free slots of a day in a city, from the cache, computed and cached on a miss
+
+    Returns:
+        list: Available slots, None when the city has no active detailer
+    """
+    if not settings.SHARED_CACHE:
+        return next(iter(build_grids(day, day, [service_duration], city=city).values()))['slots']
+    city = _city(city)
+    versions = _versions([(city, day)])
+    key = _grid_key(city, day, service_duration, versions)
+    entry = cache.get(key)
+    if entry is None:
+        grids = build_grids(day, day, [service_duration], city=city)
+        cache.set_many(grids, settings.SLOT_CACHE_TIMEOUT)
+        entry = grids.get(key) or next(iter(grids.values()))
+    return entry['slots']
+
+
+def precompute_slot_grids(days=None, durations=None):
+    """
+    Cache the slot grids of every active city for the next days, for every common duration
+
+    Returns:
+        int: Number of grids cached, none without a SHARED_CACHE
+    """
+    if not settings.SHARED_CACHE:
+        return 0
+    first_day = timezone.localdate()
+    last_day = first_day + timedelta(days=(days or settings.SLOT_PRECOMPUTE_DAYS) - 1)
+    grids = build_grids(first_day, last_day, durations or common_durations())
+    cache.set_many(grids, settings.SLOT_CACHE_TIMEOUT)
+    return len(grids)
+
+
+def in_precompute_window(day):
+    """ Whether the day is one of the next SLOT_PRECOMPUTE_DAYS days, kept warm by the beat schedule """
+    today = timezone.localdate()
+    return today <= day < today + timedelta(days=settings.SLOT_PRECOMPUTE_DAYS)
+
+
+def refresh_slot_grids(city, day=None):
+    """ Recompute the grids of a city-day after a change, or of every precomputed day of the city, for every common duration """
+    if not settings.SHARED_CACHE:
+        return 0
+    first_day = last_day = day
+    if day is None:
+        first_day = timezone.localdate()
+        last_day = first_day + timedelta(days=settings.SLOT_PRECOMPUTE_DAYS - 1)
+    grids = build_grids(first_day, last_day, common_durations(), city=city)
+    cache.set_many(grids, settings.SLOT_CACHE_TIMEOUT)
+    return len(grids)
+
+
+def detailer_cities(detailer_ids):
+    """ {detailer id: city} of the detailers """
+    return dict(Detailer.objects.filter(pk__in=detailer_ids).values_list('pk', 'city'))
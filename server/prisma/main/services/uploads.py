@@ -0,0 +1,178 @@
+import fcntl
+import os
+from datetime import timedelta
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, UnidentifiedImageError
+from ..models import Job, PhotoUpload
+
+# Bytes read from the request and written to disk at a time, a chunk is never held in memory whole
+COPY_BUFFER_SIZE = 64 * 1024
+
+ALLOWED_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+
+class UploadConflict(Exception):
+    """ The chunk doesn't start at the upload's current offset, or another request is writing to it """
+    def __init__(self, message, offset=None):
+        super().__init__(message)
+        self.offset = offset
+
+
+def _partial_path(upload):
+    path = default_storage.path(upload.partial_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def create_upload(user, job, field, filename, size):
+    """
+    Start a resumable upload of a job photo.
+
+    Raises:
+        ValueError: Unknown field, unsupported file type or size out of bounds
+    """
+    if field not in dict(PhotoUpload.FIELD_CHOICES):
+        raise ValueError(f"Invalid field. Use one of: {', '.join(dict(PhotoUpload.FIELD_CHOICES))}")
+    filename = os.path.basename(filename or '')
+    if not filename.lower().endswith(ALLOWED_EXTENSIONS):
+        raise ValueError(f"Unsupported file type. Use one of: {', '.join(ALLOWED_EXTENSIONS)}")
+    if not 0 < size <= settings.PHOTO_UPLOAD_MAX_SIZE:
+        raise ValueError(f"Size must be between 1 and {settings.PHOTO_UPLOAD_MAX_SIZE} bytes")
+    upload = PhotoUpload.objects.create(job=job, user=user, field=field, filename=filename[-120:], size=size)
+    # The partial file exists from the start so an empty upload can be resumed like any other
+    open(_partial_path(upload), 'wb').close()
+    return upload
+
+
+def append_chunk(upload, offset, stream, length):
+    """
+    Write a chunk of the upload at offset, copying from the stream in COPY_BUFFER_SIZE blocks.
+
+    A chunk cut short by a dropped connection keeps the bytes that arrived, the returned offset tells
+    the client where to resume. Bytes past the recorded offset, left by an earlier interrupted write,
+    are truncated first.
+
+    Args:
+        upload: PhotoUpload being written
+        offset: Offset the client says the chunk starts at
+        stream: File like object to read the chunk from, e.g. the request
+        length: Length of the chunk in bytes
+
+    Returns:
+        int: The upload's new offset
+
+    Raises:
+        UploadConflict: The offset doesn't match, the upload is complete, or is being written by another request
+        ValueError: The chunk would go past the declared size
+    """
+    if offset + length > upload.size:
+        raise ValueError("The chunk goes past the upload size")
+
+    fd = os.open(_partial_path(upload), os.O_RDWR | os.O_CREAT, 0o644)
+    with os.fdopen(fd, 'r+b') as partial:
+        try:
+            fcntl.flock(partial, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadConflict("Another request is writing to this upload")
+
+        # Read under the lock, the offset can have moved since the upload was loaded
+        current_offset, current_status = PhotoUpload.objects.filter(pk=upload.pk).values_list('offset', 'status').get()
+        if current_status != 'uploading':
+            raise UploadConflict("The upload is already complete", current_offset)
+        if offset != current_offset:
+            raise UploadConflict("The chunk doesn't start at the upload offset", current_offset)
+
+        partial.seek(offset)
+        partial.truncate()
+        written = 0
+        while written < length:
+            try:
+                block = stream.read(min(COPY_BUFFER_SIZE, length - written))
+            except OSError:
+                break
+            if not block:
+                break
+            partial.write(block)
+            written += len(block)
+        partial.flush()
+        os.fsync(partial.fileno())
+
+        upload.offset = offset + written
+        PhotoUpload.objects.filter(pk=upload.pk, offset=offset).update(offset=upload.offset, updated_at=timezone.now())
+    return upload.offset
+
+
+def finalize_upload(upload):
+    """
+    Move a fully received upload into place as the job's photo.
+
+    The file is hard linked under the photo's final name, which never replaces an existing file, and the
+    job is saved in the same transaction, so the photo appears complete or not at all. Saving the job
+    queues the variants, see services/media.py.
+
+    Returns:
+        Job: The job, with the new photo set
+
+    Raises:
+        UploadConflict: The upload isn't fully received, or was already finalized
+        ValueError: The file isn't an image
+    """
+    path = _partial_path(upload)
+    with transaction.atomic():
+        upload = PhotoUpload.objects.select_for_update().get(pk=upload.pk)
+        if upload.status != 'uploading':
+            raise UploadConflict("The upload is already complete", upload.offset)
+        if upload.offset != upload.size:
+            raise UploadConflict("The upload is not fully received", upload.offset)
+        try:
+            with Image.open(path) as image:
+                image.verify()
+        except (UnidentifiedImageError, OSError, SyntaxError):
+            raise ValueError("The uploaded file is not a valid image")
+
+        job = Job.objects.select_for_update().get(pk=upload.job_id)
+        field = job._meta.get_field(upload.field)
+        storage = field.storage
+        name = field.generate_filename(job, upload.filename)
+        while True:
+            name = storage.get_available_name(name, max_length=field.max_length)
+            target = storage.path(name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            try:
+                os.link(path, target)
+                break
+            except FileExistsError:
+                continue
+
+        try:
+            setattr(job, upload.field, name)
+            job.save(update_fields=[upload.field, 'updated_at'])
+            upload.status = 'complete'
+            upload.save(update_fields=['status', 'updated_at'])
+        except Exception:
+            os.unlink(target)
+            raise
+        transaction.on_commit(lambda: default_storage.delete(upload.partial_name))
+    return job
+
+
+def cleanup_abandoned_uploads(expiry=None):
+    """
+    Delete the uploads that haven't received a chunk for PHOTO_UPLOAD_EXPIRY_HOURS, with their
+    partial files, and the records of completed uploads as old.
+
+    Returns:
+        int: Number of uploads deleted
+    """
+    expiry = expiry or timedelta(hours=settings.PHOTO_UPLOAD_EXPIRY_HOURS)
+    stale = PhotoUpload.objects.filter(updated_at__lt=timezone.now() - expiry)
+    deleted = 0
+    for upload in stale.iterator():
+        # A chunk that arrived since the upload was read keeps it alive
+        if PhotoUpload.objects.filter(pk=upload.pk, updated_at=upload.updated_at).delete()[0]:
+            default_storage.delete(upload.partial_name)
+            deleted += 1
+    return deleted
@@ -0,0 +1,104 @@
+from functools import partial
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from .catalog import invalidate_catalog
+from .models import Availability, Detailer, Earning, Job, ServiceType, User, add_balance_delta, balance_deltas
+from .services.media import pending_image_fields
+from .services.routes import invalidate_route
+from .services.slots import detailer_cities, in_precompute_window, invalidate_slots
+from .task import process_uploaded_image, refresh_slot_grids
+
+
+def _task_callback(task, *args):
+    # on_commit(robust=True) logs a failure with the callback's __qualname__, which a partial lacks
+    callback = partial(task.delay, *args)
+    callback.__qualname__ = task.name
+    return callback
+
+
+@receiver(post_save, sender=ServiceType)
+@receiver(post_delete, sender=ServiceType)
+def service_type_changed(sender, **kwargs):
+    # Invalidate right away for this process, and again once committed so no other process keeps a
+    # catalog it rebuilt from the old rows while the transaction was open
+    invalidate_catalog()
+    transaction.on_commit(invalidate_catalog, using=kwargs.get('using'))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Job)
+def queue_image_processing(sender, instance, update_fields=None, **kwargs):
+    # Saves that don't touch the image fields (last_login, status changes) skip the check entirely.
+    # A broker outage is logged rather than failing the save, python manage.py process_media catches up
+    for field_name in pending_image_fields(instance, update_fields):
+        transaction.on_commit(
+            _task_callback(process_uploaded_image, instance._meta.label_lower, instance.pk, field_name),
+            using=kwargs.get('using'),
+            robust=True,
+        )
+
+
+@receiver(post_delete, sender=Earning)
+def earning_deleted(sender, instance, **kwargs):
+    # Sent for cascades from Job and Detailer and for queryset deletes too, inside the deletion's
+    # transaction. The totals the earning was last saved with are the ones taken back
+    snapshot = getattr(instance, '_balance_snapshot', None) or (instance.detailer_id, instance.payment_status, instance.net_amount)
+    Detailer.objects.apply_balance_deltas(add_balance_delta(balance_deltas(), *snapshot, sign=-1))
+
+
+def _slots_changed(city, day, using):
+    # Invalidated right away and again once committed, like the catalog, then recomputed in the
+    # background so the next customer still hits a warm grid. Bulk updates skip the signals, their
+    # grids expire after SLOT_CACHE_TIMEOUT or are replaced by the nightly precompute
+    invalidate_slots(city, day)
+    transaction.on_commit(partial(invalidate_slots, city, day), using=using)
+    if settings.SHARED_CACHE and (day is None or in_precompute_window(day)):
+        transaction.on_commit(
+            _task_callback(refresh_slot_grids, city, day.isoformat() if day else None),
+            using=using,
+            robust=True,
+        )
+
+
+def _detailer_days_changed(detailer_days, using):
+    if not detailer_days:
+        return
+    cities = detailer_cities({detailer_id for detailer_id, _ in detailer_days})
+    for city, day in {(cities[detailer_id], day) for detailer_id, day in detailer_days if cities.get(detailer_id)}:
+        _slots_changed(city, day, using)
+
+
+@receiver(post_save, sender=Job)
+@receiver(post_delete, sender=Job)
+def job_slots_changed(sender, instance, signal, **kwargs):
+    # Only confirmed jobs whose detailer, status or window changed touch the slot grids
+    changes = instance.state_changes('slot', deleted=signal is post_delete)
+    _detailer_days_changed({(detailer_id, timezone.localdate(start)) for detailer_id, start, _ in changes}, kwargs.get('using'))
+
+
+@receiver(post_save, sender=Job)
+@receiver(post_delete, sender=Job)
+def job_route_changed(sender, instance, signal, **kwargs):
+    # Routes are cheap to plan again, they are only invalidated, right away and once committed
+    changes = instance.state_changes('route', deleted=signal is post_delete)
+    for detailer_id, day in {(detailer_id, timezone.localdate(start)) for detailer_id, start, *_ in changes}:
+        invalidate_route(detailer_id, day)
+        transaction.on_commit(partial(invalidate_route, detailer_id, day), using=kwargs.get('using'))
+
+
+@receiver(post_save, sender=Availability)
+@receiver(post_delete, sender=Availability)
+def availability_slots_changed(sender, instance, signal, **kwargs):
+    changes = instance.state_changes('slot', deleted=signal is post_delete)
+    _detailer_days_changed({(detailer_id, day) for detailer_id, day, _, _ in changes}, kwargs.get('using'))
+
+
+@receiver(post_save, sender=Detailer)
+@receiver(post_delete, sender=Detailer)
+def detailer_slots_changed(sender, instance, signal, **kwargs):
+    # A detailer joining, leaving or moving changes which detailers every day of the city is built from
+    for city in instance.state_changes('slot', deleted=signal is post_delete):
+        _slots_changed(city, None, kwargs.get('using'))
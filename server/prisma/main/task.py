@@ -0,0 +1,88 @@
+import logging
+from datetime import date
+from celery import shared_task
+from celery.signals import worker_process_shutdown
+from .emails import queue_job_reminders, queue_payout_notices
+from .emails import send_queued_emails as send_email_batches
+from .emails.sending import close_worker_connection
+from .services.dispatch import dispatch_pending_jobs as dispatch_jobs
+from .services.earnings import generate_missing_earnings
+from .services.media import process_image_field
+from .services.slots import precompute_slot_grids as precompute_grids, refresh_slot_grids as refresh_grids
+from .services.uploads import cleanup_abandoned_uploads
+from .services.payouts import run_payouts, weekly_run_id
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(ignore_result=True)
+def run_weekly_payouts():
+    """ Settle the pending earnings of the whole fleet. The run id is derived from the ISO week,
+        so a retried or duplicated beat tick never pays a detailer twice.
+    """
+    run = run_payouts(weekly_run_id())
+    logger.info(
+        "Payout run %s: %s batches, %s earnings, %s total", run.run_id, run.batch_count, run.earning_count, run.total_amount
+    )
+    queue_payout_notices(run)
+
+
+@shared_task(ignore_result=True)
+def generate_earnings():
+    """ End of day reconciliation: create the earnings of every completed job that does not have one yet """
+    created = generate_missing_earnings()
+    logger.info("Created %s earnings for completed jobs", created)
+
+
+@shared_task(ignore_result=True, autoretry_for=(OSError,), retry_backoff=True, max_retries=3)
+def process_uploaded_image(model_label, pk, field_name):
+    """ Strip the EXIF data of a freshly uploaded image and generate its thumbnail and medium variants """
+    process_image_field(model_label, pk, field_name)
+
+
+@shared_task(ignore_result=True)
+def cleanup_photo_uploads():
+    """ Hourly sweep of the photo uploads abandoned half way, and of their partial files """
+    deleted = cleanup_abandoned_uploads()
+    logger.info("Deleted %s abandoned photo uploads", deleted)
+
+
+@shared_task(ignore_result=True)
+def send_queued_emails():
+    """ Send the due emails in batches over this worker's mail connection, failures are retried with backoff """
+    sent, failed = send_email_batches()
+    if sent or failed:
+        logger.info("Sent %s emails, %s failed", sent, failed)
+
+
+@shared_task(ignore_result=True)
+def send_job_reminders():
+    """ Remind detailers of tomorrow's jobs, hourly so jobs booked during the day are reminded too """
+    queued = queue_job_reminders()
+    logger.info("Queued %s job reminders", queued)
+
+
+@worker_process_shutdown.connect
+def close_mail_connection(**kwargs):
+    close_worker_connection()
+
+
+@shared_task(ignore_result=True)
+def precompute_slot_grids():
+    """ Nightly, off peak: cache the slot grids of every active city for the next SLOT_PRECOMPUTE_DAYS days """
+    cached = precompute_grids()
+    logger.info("Precomputed %s slot grids", cached)
+
+
+@shared_task(ignore_result=True)
+def refresh_slot_grids(city, day=None):
+    """ Recompute the slot grids a booking or availability change made stale, day is an ISO date or None for the whole city """
+    refresh_grids(city, date.fromisoformat(day) if day else None)
+
+
+@shared_task(ignore_result=True)
+def dispatch_pending_jobs():
+    """ Every minute: assign the pending jobs nobody took to the best scoring free detailer """
+    totals = dispatch_jobs()
+    if totals['assigned'] or totals['unassigned']:
+        logger.info("Dispatched %s jobs, %s left unassigned", totals['assigned'], totals['unassigned'])
@@ -0,0 +1,53 @@
+import json
+import os
+from .instrumentation import QueryRecorder, action_budget, action_label
+
+
+class QueryBudgetTestMixin:
+    """
+    Test case mixin enforcing the query budgets declared by action_handler views.
+
+    Every checked action is collected into a report. When the QUERY_BUDGET_REPORT environment
+    variable names a file, the report is merged into it as JSON after the test class ran, so
+    CI can keep the per action query counts over time.
+    """
+    query_budget_report = {}
+
+    def assertActionWithinBudget(self, view_class, action, send_request):
+        """
+        Run send_request and fail when it needs more queries than the action's budget.
+
+        Args:
+            view_class: View declaring action_handler and query_budgets
+            action: Action key of the view's action_handler
+            send_request: Callable performing the request, e.g. lambda: self.client.get(url)
+
+        Returns:
+            The response returned by send_request
+        """
+        label = action_label(view_class, action)
+        budget = action_budget(view_class, action)
+        self.assertIsNotNone(budget, f"{label} does not declare a query budget")
+
+        recorder = QueryRecorder()
+        with recorder.record():
+            response = send_request()
+
+        QueryBudgetTestMixin.query_budget_report[label] = {'budget': budget, 'queries': recorder.count}
+        self.assertLess(response.status_code, 400, f"{label} failed with status {response.status_code}")
+        self.assertLessEqual(recorder.count, budget, f"{label} ran {recorder.count} queries, over its budget of {budget}")
+        return response
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        path = os.getenv('QUERY_BUDGET_REPORT')
+        if not path or not QueryBudgetTestMixin.query_budget_report:
+            return
+        report = {}
+        if os.path.exists(path):
+            with open(path) as handle:
+                report = json.load(handle)
+        report.update(QueryBudgetTestMixin.query_budget_report)
+        with open(path, 'w') as handle:
+            json.dump(report, handle, indent=2, sort_keys=True)
@@ -1,11 +1,64 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import LiveServerTestCase, RequestFactory, TestCase, TransactionTestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APITestCase
 from rest_framework import status
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.tokens import AccessToken
 from django.contrib.auth import get_user_model
-from datetime import datetime, date, time
-from main.models import Detailer, Availability, Job, ServiceType, User
+from datetime import datetime, date, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from main.admin import JobAdmin, ServiceTypeForm
+from main.checks import check_shared_cache
+from main.catalog import catalog_etag, get_service_type, invalidate_catalog, service_price, service_types
+from main.consumers import notify_detailer
+from main.emails import queue_email, render_email, queue_job_reminders, queue_payout_notices, send_queued_batch
+from main.emails.sending import _schedule_send, close_worker_connection
+from main.instrumentation import action_budget, action_label
+from main.loadtest import compare_reports, parse_mix, run_load_test
+from main.metrics import MetricsRegistry, render_prometheus
+from main.middleware import ReplicaStickinessMiddleware
+from main.models import Detailer, Availability, EmailLog, Job, PhotoUpload, ServiceType, User, Earning, PayoutBatch, PayoutRun, Review
+from main.profiling import PROFILE_HEADER, list_profiles, make_profile_token, profile_file
+from main.renderers import FastJSONParser, FastJSONRenderer
+from main.routers import ReplicaRouter, is_sticky, mark_sticky, replica_reads
+from main.services.balances import _fix_drift, find_balance_drift
+from main.services.media import process_image_field, variant_name
+from main.services.dispatch import dispatch_pending_jobs, plan_assignments
+from main.services.earnings import generate_missing_earnings, jobs_missing_earnings
+from main.services.payouts import run_payouts, weekly_run_id
+from main.services.routes import detailer_route, invalidate_route, plan_route
+from main.services.seed import seed_data
+from main.services.slots import build_grids, precompute_slot_grids, refresh_slot_grids
+from main.services.uploads import cleanup_abandoned_uploads
+from main.task import process_uploaded_image, run_weekly_payouts
+from main.testing import QueryBudgetTestMixin
+from main.utils import day_range, get_full_media_url
+from main.views.authentication import AuthenticationView
+from main.views.availability import AvailabilityView
+from main.views.catalog import CatalogView
+from main.views.dashboard import DashboardView
+from main.views.uploads import PhotoUploadView
+import io
+import json
+import os
+import tempfile
 import uuid
+import warnings
+from PIL import Image
+from unittest import skipUnless
 
 User = get_user_model()
 
@@ -245,3 +298,1638 @@ class TimeslotsAPITestCase(APITestCase):
             end_time = datetime.strptime(slot['end_time'], '%H:%M')
             duration_minutes = (end_time - start_time).seconds // 60
             self.assertEqual(duration_minutes, 120)
+
+
+def make_job(detailer, service_type, appointment_date, **extra_fields):
+    """Create a job with the required vehicle and address fields filled in"""
+    fields = {
+        'service_type': service_type,
+        'booking_reference': str(uuid.uuid4()),
+        'client_name': 'Test Client',
+        'client_phone': '1234567890',
+        'vehicle_registration': 'ABC123',
+        'vehicle_make': 'Toyota',
+        'vehicle_model': 'Camry',
+        'vehicle_color': 'White',
+        'address': '123 Test St',
+        'city': 'London',
+        'post_code': 'SW1A 1AA',
+        'country': 'UK',
+        'appointment_date': appointment_date,
+        'appointment_time': appointment_date.time(),
+        'detailer': detailer,
+    }
+    fields.update(extra_fields)
+    return Job.objects.create(**fields)
+
+
+class PayoutRunTestCase(TestCase):
+    def setUp(self):
+        self.service_type = ServiceType.objects.create(name='Basic Wash', wash_type='traditional', duration=60, price=25.00)
+        self.detailers = []
+        for index in range(2):
+            user = User.objects.create_user(
+                email=f'payout{index}@test.com',
+                password='testpass123',
+                first_name='Pay',
+                last_name=f'Out{index}',
+                phone=f'55500000{index}',
+                username=f'payout{index}@test.com',
+            )
+            self.detailers.append(Detailer.objects.create(user=user, city='London', country='UK'))
+
+        for detailer in self.detailers:
+            for hour in (9, 11, 13):
+                job = make_job(detailer, self.service_type, timezone.make_aware(datetime(2024, 1, 15, hour, 0)), status='completed')
+                Earning.objects.create(
+                    detailer=detailer,
+                    job=job,
+                    gross_amount=Decimal('25.00'),
+                    commission=Decimal('3.75'),
+                    tip_amount=Decimal('2.00'),
+                )
+
+    def test_run_groups_earnings_per_detailer(self):
+        run = run_payouts('test-run', payout_date=date(2024, 1, 22))
+
+        self.assertEqual(run.status, 'completed')
+        self.assertEqual(run.batch_count, 2)
+        self.assertEqual(run.earning_count, 6)
+        self.assertEqual(run.total_amount, Decimal('139.50'))
+        for batch in run.batches.all():
+            self.assertEqual(batch.earning_count, 3)
+            self.assertEqual(batch.net_amount, Decimal('63.75'))
+            self.assertEqual(batch.total_amount, Decimal('69.75'))
+        self.assertFalse(Earning.objects.filter(payment_status='pending').exists())
+        self.assertEqual(Earning.objects.filter(payout_date=date(2024, 1, 22), payout_batch__isnull=False).count(), 6)
+
+    def test_run_is_idempotent(self):
+        first = run_payouts('test-run')
+        second = run_payouts('test-run')
+
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(PayoutBatch.objects.count(), 2)
+
+    def test_manual_run_does_not_stand_in_for_the_scheduled_one(self):
+        call_command('run_payouts', stdout=io.StringIO())
+        run_weekly_payouts()
+        week = weekly_run_id().split('-', 1)[1]
+        self.assertEqual(set(PayoutRun.objects.values_list('run_id', flat=True)), {f'manual-{week}', f'beat-{week}'})
+
+    def test_query_count_does_not_grow_with_earnings(self):
+        with self.assertNumQueries(12):
+            run_payouts('test-run')
+
+
+class GenerateEarningsTestCase(TestCase):
+    def setUp(self):
+        self.service_type = ServiceType.objects.create(name='Basic Wash', wash_type='traditional', duration=60, price=25.00)
+        user = User.objects.create_user(
+            email='earnings@test.com',
+            password='testpass123',
+            first_name='Earn',
+            last_name='Ings',
+            phone='5550001000',
+            username='earnings@test.com',
+        )
+        self.detailer = Detailer.objects.create(user=user, city='London', country='UK', commission_rate=0.15)
+        for hour in range(8, 16):
+            make_job(self.detailer, self.service_type, timezone.make_aware(datetime(2024, 1, 15, hour, 0)), status='completed')
+        make_job(self.detailer, self.service_type, timezone.make_aware(datetime(2024, 1, 16, 9, 0)), status='pending')
+
+    def test_creates_one_earning_per_completed_job(self):
+        created = generate_missing_earnings(batch_size=3)
+
+        self.assertEqual(created, 8)
+        self.assertEqual(Earning.objects.count(), 8)
+        earning = Earning.objects.first()
+        self.assertEqual(earning.gross_amount, Decimal('25.00'))
+        self.assertEqual(earning.commission, Decimal('3.75'))
+        self.assertEqual(earning.net_amount, Decimal('21.25'))
+
+    def test_resumes_where_previous_run_stopped(self):
+        self.assertEqual(generate_missing_earnings(limit=5), 5)
+        self.assertEqual(generate_missing_earnings(), 3)
+        self.assertEqual(generate_missing_earnings(), 0)
+        self.assertFalse(jobs_missing_earnings().exists())
+
+
+class EarningsExportTestCase(APITestCase):
+    def setUp(self):
+        service_type = ServiceType.objects.create(name='Basic Wash', wash_type='traditional', duration=60, price=25.00)
+        user = User.objects.create_user(
+            email='export@test.com',
+            password='testpass123',
+            first_name='Ex',
+            last_name='Port',
+            phone='5550002000',
+            username='export@test.com',
+        )
+        detailer = Detailer.objects.create(user=user, city='London', country='UK')
+        for hour in (9, 11):
+            make_job(detailer, service_type, timezone.make_aware(datetime(2024, 1, 15, hour, 0)), status='completed')
+        generate_missing_earnings()
+        Earning.objects.filter(pk=Earning.objects.first().pk).update(payment_status='paid')
+
+        self.staff = User.objects.create_user(
+            email='finance@test.com',
+            password='testpass123',
+            phone='5550002001',
+            username='finance@test.com',
+            is_staff=True,
+        )
+        self.url = '/api/v1/export/earnings/'
+
+    def test_requires_staff(self):
+        response = self.client.get(self.url)
+        self.assertIn(response.status_code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
+
+    def test_streams_csv_with_status_filter(self):
+        self.client.force_authenticate(self.staff)
+        response = self.client.get(self.url, {'payment_status': 'pending'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().strip().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].startswith('earning_id,created_at,payment_status'))
+        self.assertIn('pending', lines[1])
+        self.assertIn('export@test.com', lines[1])
+
+    def test_streams_arrow(self):
+        import pyarrow
+
+        self.client.force_authenticate(self.staff)
+        response = self.client.get(self.url, {'file_format': 'arrow'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        table = pyarrow.ipc.open_stream(b''.join(response.streaming_content)).read_all()
+        self.assertEqual(table.num_rows, 2)
+        self.assertEqual(sum(value.as_py() for value in table.column('net_amount')), Decimal('42.50'))
+
+    def test_rejects_invalid_filters(self):
+        self.client.force_authenticate(self.staff)
+        self.assertEqual(self.client.get(self.url, {'file_format': 'xml'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(self.url, {'start_date': '15/01/2024'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AsgiStreamingTestCase(TransactionTestCase):
+    def setUp(self):
+        service_type = ServiceType.objects.create(name='Basic Wash', wash_type='traditional', duration=60, price=25.00)
+        user = User.objects.create_user(
+            email='asgi@test.com',
+            password='testpass123',
+            phone='5550002100',
+            username='asgi@test.com',
+        )
+        detailer = Detailer.objects.create(user=user, city='London', country='UK')
+        for hour in (9, 11, 13):
+            make_job(detailer, service_type, timezone.make_aware(datetime(2024, 1, 15, hour, 0)), status='completed')
+        generate_missing_earnings()
+        self.staff = User.objects.create_user(
+            email='asgi-finance@test.com',
+            password='testpass123',
+            phone='5550002101',
+            username='asgi-finance@test.com',
+            is_staff=True,
+        )
+
+    def test_export_is_streamed_a_row_at_a_time(self):
+        from prisma.asgi import application
+
+        async def export():
+            communicator = ApplicationCommunicator(application, {
+                'type': 'http',
+                'method': 'GET',
+                'path': '/api/v1/export/earnings/',
+                'query_string': b'',
+                'headers': [
+                    (b'host', b'testserver'),
+                    (b'authorization', f'Bearer {AccessToken.for_user(self.staff)}'.encode()),
+                ],
+            })
+            await communicator.send_input({'type': 'http.request', 'body': b''})
+            start = await communicator.receive_output(5)
+            bodies = []
+            while True:
+                message = await communicator.receive_output(5)
+                bodies.append(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            await communicator.wait(5)
+            return start, bodies
+
+        # Django warns when it falls back to reading a sync iterator whole with sync_to_async(list)
+        with warnings.catch_warnings():
+            warnings.filterwarnings('error', message='StreamingHttpResponse must consume synchronous iterators')
+            start, bodies = async_to_sync(export)()
+        self.assertEqual(start['status'], status.HTTP_200_OK)
+        # The header, a message per earning and the closing one
+        self.assertEqual(len(bodies), 5)
+        self.assertEqual(len(b''.join(bodies).decode().strip().splitlines()), 4)
+
+
+class DetailerRunningTotalsTestCase(TestCase):
+    def setUp(self):
+        self.service_type = ServiceType.objects.create(name='Basic Wash', wash_type='traditional', duration=60, price=25.00)
+        user = User.objects.create_user(
+            email='totals@test.com',
+            password='testpass123',
+            first_name='Run',
+            last_name='Ning',
+            phone='5550003000',
+            username='totals@test.com',
+        )
+        self.detailer = Detailer.objects.create(user=user, city='London', country='UK', commission_rate=0.15)
+        self.jobs = [
+            make_job(self.detailer, self.service_type, timezone.make_aware(datetime(2024, 1, 15, hour, 0)), status='completed')
+            for hour in (9, 11, 13)
+        ]
+
+    def assertTotals(self, lifetime, unpaid, paid):
+        self.detailer.refresh_from_db()
+        self.assertEqual(self.detailer.total_earnings(), Decimal(lifetime))
+        self.assertEqual(self.detailer.unpaid_earnings(), Decimal(unpaid))
+        self.assertEqual(self.detailer.paid_earnings(), Decimal(paid))
+
+    def test_save_and_mark_as_paid_move_totals(self):
+        earning = Earning.objects.create(detailer=self.detailer, job=self.jobs[0], gross_amount=Decimal('25.00'))
+        self.assertTotals('21.25', '21.25', '0')
+
+        Earning.objects.get(pk=earning.pk).mark_as_paid(date(2024, 1, 22))
+        self.assertTotals('21.25', '0', '21.25')
+
+        Earning.objects.get(pk=earning.pk).delete()
+        self.assertTotals('0', '0', '0')
+
+    def test_cascade_and_queryset_deletes_take_back_totals(self):
+        generate_missing_earnings()
+        self.assertTotals('63.75', '63.75', '0')
+
+        # The earning goes with its job
+        self.jobs[0].delete()
+        self.assertTotals('42.50', '42.50', '0')
+        Earning.objects.filter(job=self.jobs[1]).delete()
+        self.assertTotals('21.25', '21.25', '0')
+        self.assertEqual(find_balance_drift(), [])
+
+    def test_stale_detailer_save_keeps_totals(self):
+        stale = Detailer.objects.get(pk=self.detailer.pk)
+        generate_missing_earnings()
+        stale.rating = 4.5
+        stale.save()
+        self.assertTotals('63.75', '63.75', '0')
+        self.assertEqual(self.detailer.rating, 4.5)
+
+    def test_bulk_generation_and_payout_update_totals(self):
+        generate_missing_earnings()
+        self.assertTotals('63.75', '63.75', '0')
+
+        run_payouts('totals-run')
+        self.assertTotals('63.75', '0', '63.75')
+        self.assertEqual(find_balance_drift(), [])
+
+    def test_verification_reports_and_fixes_drift(self):
+        generate_missing_earnings()
+        Earning.objects.filter(job=self.jobs[0]).update(payment_status='failed')
+
+        drift = find_balance_drift()
+        self.assertEqual(drift, [(self.detailer.pk, 'unpaid_net_total', Decimal('63.75'), Decimal('42.50'))])
+
+        find_balance_drift(fix=True)
+        self.assertEqual(find_balance_drift(), [])
+        self.assertTotals('63.75', '42.50', '0')
+
+    def test_fix_recomputes_under_the_lock(self):
+        generate_missing_earnings()
+        Earning.objects.filter(job=self.jobs[0]).update(payment_status='failed')
+        self.assertEqual(len(find_balance_drift()), 1)
+
+        # An earning deleted after the scan moves the totals with its delta, the fix must not overwrite it
+        Earning.objects.filter(job=self.jobs[1]).delete()
+        self.assertEqual(_fix_drift([self.detailer.pk]), [(self.detailer.pk, 'unpaid_net_total', Decimal('42.50'), Decimal('21.25'))])
+        self.assertEqual(find_balance_drift(), [])
+        self.assertTotals('42.50', '21.25', '0')
+
+
+class AppointmentRangeQueryTestCase(APITestCase):
+    def setUp(self):
+        self.service_type = ServiceType.objects.create(name='Basic Wash', wash_type='traditional', duration=60, price=25.00)
+        self.user = User.objects.create_user(
+            email='ranges@test.com',
+            password='testpass123',
+            first_name='Date',
+            last_name='Range',
+            phone='5550004000',
+            username='ranges@test.com',
+        )
+        self.detailer = Detailer.objects.create(user=self.user, city='London', country='UK')
+
+    def test_day_range_is_half_open_local_day(self):
+        start, end = day_range(date(2024, 3, 31))  # clocks go forward in London
+
+        self.assertEqual(timezone.localtime(start).replace(tzinfo=None), datetime(2024, 3, 31))
+        self.assertEqual(timezone.localtime(end).replace(tzinfo=None), datetime(2024, 4, 1))
+        self.assertEqual((end.astimezone(dt_timezone.utc) - start.astimezone(dt_timezone.utc)).total_seconds(), 23 * 3600)
+
+    def test_on_day_matches_date_lookup(self):
+        for day, hour in ((14, 23), (15, 0), (15, 23), (16, 0)):
+            make_job(self.detailer, self.service_type, timezone.make_aware(datetime(2024, 1, day, hour, 30)))
+
+        on_day = set(Job.objects.on_day(date(2024, 1, 15)).values_list('pk', flat=True))
+        date_lookup = set(Job.objects.filter(appointment_date__date=date(2024, 1, 15)).values_list('pk', flat=True))
+        self.assertEqual(on_day, date_lookup)
+        self.assertEqual(len(on_day), 2)
+
+    @skipUnless(connection.vendor == 'sqlite', "Reads SQLite's EXPLAIN QUERY PLAN output")
+    def test_hot_queries_search_an_index(self):
+        today = timezone.localdate()
+        hot_queries = {
+            'today_overview': Job.objects.filter(detailer=self.detailer).on_day(today),
+            'completed_this_week': Job.objects.filter(detailer=self.detailer, status='completed').between_days(today - timedelta(days=today.weekday()), today),
+            'recent_jobs': Job.objects.filter(detailer=self.detailer).since_day(today - timedelta(days=7)).order_by('-appointment_date'),
+            'slot_conflicts': Job.objects.filter(detailer__in=[self.detailer], status__in=['completed', 'accepted', 'in_progress']).on_day(today),
+        }
+        for name, queryset in hot_queries.items():
+            with self.subTest(query=name):
+                self.assertNotIn('cast_date', str(queryset.query))
+                plan = queryset.explain()
+                self.assertRegex(plan, r'SEARCH main_job USING (COVERING )?INDEX')
+                self.assertNotIn('SCAN main_job', plan)
+
+    def test_today_overview_endpoint(self):
+        now = timezone.localtime()
+        make_job(self.detailer, self.service_type, now, status='in_progress')
+        self.client.force_authenticate(self.user)
+
+        response = self.client.get('/api/v1/dashboard/get_today_overview/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['totalAppointments'], 1)
+        self.assertEqual(response.data['currentJob']['serviceType'], 'Basic Wash')
+
+
+class AppointmentWindowTestCase(TestCase):
+    def setUp(self):
+        self.service_type = ServiceType.objects.create(name='Full Valet', wash_type='traditional', duration=90, price=60.00)
+        user = User.objects.create_user(
+            email='window@test.com',
+            password='testpass123',
+            first_name='Win',
+            last_name='Dow',
+            phone='5550005000',
+            username='window@test.com',
+        )
+        self.detailer = Detailer.objects.create(user=user, city='London', country='UK')
+        self.job = make_job(self.detailer, self.service_type, timezone.make_aware(datetime(2024, 1, 15, 10, 0)), status='accepted')
+
+    def test_window_is_stored_on_save(self):
+        self.assertEqual(timezone.localtime(self.job.appointment_start).time(), time(10, 0))
+        self.assertEqual(timezone.localtime(self.job.appointment_end).time(), time(11, 30))
+
+        self.job.appointment_time = time(12, 0)
+        self.job.save(update_fields=['appointment_time'])
+        self.job.refresh_from_db()
+        self.assertEqual(timezone.localtime(self.job.appointment_end).time(), time(13, 30))
+
+    def test_overlap_is_a_single_query(self):
+        start = timezone.make_aware(datetime(2024, 1, 15, 11, 0))
+        with self.assertNumQueries(1):
+            self.assertTrue(Job.objects.booked().filter(detailer=self.detailer).overlapping(start, start + timedelta(hours=1)).exists())
+        self.assertFalse(Job.objects.filter(detailer=self.detailer).overlapping(start + timedelta(minutes=30), start + timedelta(hours=2)).exists())
+
+    def test_clean_rejects_double_booking(self):
+        other = Job(
+            service_type=self.service_type,
+            detailer=self.detailer,
+            status='pending',
+            appointment_date=timezone.make_aware(datetime(2024, 1, 15, 11, 0)),
+            appointment_time=time(11, 0),
+        )
+        with self.assertRaises(ValidationError):
+            other.clean()
+
+        other.appointment_time = time(11, 30)
+        other.clean()
+
+    def test_booked_slots_are_removed(self):
+        response = self.client.get('/api/v1/availability/get_timeslots/', {
+            'date': '2024-01-15',
+            'service_duration': '60',
+            'country': 'UK',
+            'city': 'London',
+        })
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # The job blocks 10:00 to 12:00 (11:30 end + 30 minutes travel)
+        start_times = [slot['start_time'] for slot in response.json()['slots']]
+        self.assertIn('09:00', start_times)
+        self.assertNotIn('10:30', start_times)
+        self.assertIn('12:00', start_times)
+
+
+class JobIndexUsageTestCase(TestCase):
+    """EXPLAIN the hot Job queries and check each one searches the index designed for it"""
+
+    def setUp(self):
+        self.service_type = ServiceType.objects.create(name='Basic Wash', wash_type='traditional', duration=60, price=25.00)
+        user = User.objects.create_user(
+            email='indexes@test.com',
+            password='testpass123',
+            first_name='In',
+            last_name='Dex',
+            phone='5550006000',
+            username='indexes@test.com',
+        )
+        self.detailer = Detailer.objects.create(user=user, city='London', country='UK')
+
+    @skipUnless(connection.vendor == 'sqlite', "Reads SQLite's EXPLAIN QUERY PLAN output")
+    def test_hot_queries_use_their_index(self):
+        today = timezone.localdate()
+        now = timezone.now()
+        expected = [
+            (['job_detailer_appt_idx'], 'appointment_date>? AND appointment_date<?',
+             Job.objects.filter(detailer=self.detailer).on_day(today)),
+            (['job_detailer_appt_idx'], 'appointment_date>?',
+             Job.objects.filter(detailer=self.detailer).since_day(today - timedelta(days=7)).order_by('-appointment_date')),
+            (['job_detailer_status_appt_idx'], 'appointment_date>? AND appointment_date<?',
+             Job.objects.filter(detailer=self.detailer, status='completed').in_week(today)),
+            (['job_detailer_status_appt_idx'], 'status=?',
+             Job.objects.filter(detailer=self.detailer, status__in=['pending', 'accepted'])),
+            (['job_detailer_window_idx'], 'appointment_start<?',
+             Job.objects.filter(detailer=self.detailer).overlapping(now, now + timedelta(hours=1))),
+            # Without ANALYZE statistics SQLite may prefer the composite index with detailer_id IS NULL
+            (['job_unassigned_start_idx', 'job_detailer_window_idx'], 'appointment_start>?',
+             Job.objects.filter(status='pending', detailer__isnull=True, appointment_start__gte=now).order_by('appointment_start', 'pk')),
+            # Admin change list
+            (['job_appt_date_idx'], 'SCAN', Job.objects.order_by(*JobAdmin.ordering)[:100]),
+        ]
+        for index_names, constraint, queryset in expected:
+            with self.subTest(index=index_names[0], query=str(queryset.query)):
+                plan = queryset.explain()
+                self.assertRegex(plan, r'USING (COVERING )?INDEX (%s)\b' % '|'.join(index_names))
+                self.assertIn(constraint, plan)
+
+
+class QueryBudgetTestCase(QueryBudgetTestMixin, APITestCase):
+    """Every dispatched action must stay within its declared query budget on realistic data"""
+
+    views = [AuthenticationView, AvailabilityView, CatalogView, DashboardView, PhotoUploadView]
+
+    def setUp(self):
+        service_types = [
+            ServiceType.objects.create(name=name, wash_type='traditional', duration=duration, price=price)
+            for name, duration, price in (('Basic Wash', 60, 25.00), ('Full Valet', 120, 80.00), ('Interior', 90, 50.00))
+        ]
+        now = timezone.localtime()
+        today = now.date()
+        self.detailers = []
+        for index in range(5):
+            user = User.objects.create_user(
+                email=f'budget{index}@test.com',
+                password='testpass123',
+                first_name='Budget',
+                last_name=f'Detailer{index}',
+                phone=f'55500070{index:02d}',
+                username=f'budget{index}@test.com',
+            )
+            detailer = Detailer.objects.create(user=user, city='London', country='UK')
+            Availability.objects.create(detailer=detailer, date=today, start_time=time(8, 0), end_time=time(18, 0))
+            self.detailers.append(detailer)
+
+        # Two weeks of history for the first detailer, with earnings and reviews on the completed jobs
+        self.user = self.detailers[0].user
+        for day_offset in range(-14, 2):
+            for slot, hour in enumerate((8, 11, 14)):
+                appointment = timezone.make_aware(datetime.combine(today + timedelta(days=day_offset), time(hour, 0)))
+                job_status = 'completed' if day_offset < 0 else ('accepted', 'in_progress', 'pending')[slot]
+                job = make_job(self.detailers[0], service_types[slot], appointment, status=job_status)
+                if job_status == 'completed':
+                    Review.objects.create(job=job, detailer=self.detailers[0], rating=Decimal('4.50'))
+        generate_missing_earnings()
+        run_payouts('budget-run', payout_date=today)
+
+    def test_every_action_declares_a_budget(self):
+        for view_class in self.views:
+            for action in view_class.action_handler:
+                with self.subTest(action=action_label(view_class, action)):
+                    self.assertIsNotNone(action_budget(view_class, action))
+
+    def test_dashboard_actions_within_budget(self):
+        self.client.force_authenticate(self.user)
+        for action in DashboardView.action_handler:
+            with self.subTest(action=action):
+                self.assertActionWithinBudget(DashboardView, action, lambda: self.client.get(f'/api/v1/dashboard/{action}/'))
+
+    def test_availability_actions_within_budget(self):
+        params = {'date': timezone.localdate().isoformat(), 'service_duration': '60', 'country': 'UK', 'city': 'London'}
+        self.assertActionWithinBudget(AvailabilityView, 'get_timeslots', lambda: self.client.get('/api/v1/availability/get_timeslots/', params))
+
+    def test_catalog_actions_within_budget(self):
+        invalidate_catalog()
+        self.assertActionWithinBudget(CatalogView, 'get_service_types', lambda: self.client.get('/api/v1/catalog/get_service_types/'))
+
+    def test_authentication_actions_within_budget(self):
+        credentials = {
+            'email': 'new.detailer@test.com',
+            'password': 'testpass123',
+            'first_name': 'New',
+            'last_name': 'Detailer',
+            'phone': '5550007999',
+            'address': '1 High Street',
+            'city': 'London',
+            'postcode': 'SW1A 1AA',
+            'country': 'UK',
+        }
+        self.assertActionWithinBudget(
+            AuthenticationView,
+            'create_new_user',
+            lambda: self.client.post('/api/v1/onboard/create_new_user/', {'credentials': credentials}, format='json'),
+        )
+
+
+@override_settings(METRICS_TOKEN='scrape-token', METRICS_REDIS_URL=None)
+class ActionMetricsTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='metrics@test.com',
+            password='testpass123',
+            first_name='Met',
+            last_name='Rics',
+            phone='5550008000',
+            username='metrics@test.com',
+        )
+        Detailer.objects.create(user=self.user, city='London', country='UK')
+
+    def test_render_prometheus_histogram(self):
+        registry = MetricsRegistry()
+        registry.observe_request('DashboardView.get_quick_stats', 200, 0.03, 0.01, 8, 512)
+        registry.observe_request('DashboardView.get_quick_stats', 200, 0.2, 0.05, 8, 512)
+
+        text = render_prometheus(registry.collect())
+
+        self.assertIn('# TYPE prisma_action_latency_seconds histogram', text)
+        self.assertIn('prisma_action_latency_seconds_bucket{action="DashboardView.get_quick_stats",le="0.05"} 1', text)
+        self.assertIn('prisma_action_latency_seconds_bucket{action="DashboardView.get_quick_stats",le="+Inf"} 2', text)
+        self.assertIn('prisma_action_queries_sum{action="DashboardView.get_quick_stats"} 16', text)
+        self.assertIn('prisma_action_requests_total{action="DashboardView.get_quick_stats",status="2xx"} 2', text)
+
+    def test_endpoint_labels_requests_by_action(self):
+        self.client.force_authenticate(self.user)
+        self.client.get('/api/v1/dashboard/get_recent_jobs/')
+        self.client.force_authenticate(None)
+
+        self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+        with override_settings(DEBUG=True):
+            self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong-token').status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('prisma_action_db_seconds_count{action="DashboardView.get_recent_jobs"}', response.content.decode())
+
+
+class RequestProfilingTestCase(APITestCase):
+    def setUp(self):
+        store = tempfile.TemporaryDirectory()
+        self.addCleanup(store.cleanup)
+        settings_override = override_settings(PROFILE_STORE_DIR=store.name, PROFILE_STORE_MAX_PROFILES=2)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create_user(
+            email='profile@test.com',
+            password='testpass123',
+            first_name='Pro',
+            last_name='File',
+            phone='5550009000',
+            username='profile@test.com',
+        )
+        Detailer.objects.create(user=self.user, city='London', country='UK')
+        self.staff = User.objects.create_user(
+            email='staff@test.com',
+            password='testpass123',
+            first_name='Staff',
+            last_name='User',
+            phone='5550009001',
+            username='staff@test.com',
+            is_staff=True,
+        )
+        self.url = '/api/v1/dashboard/get_recent_jobs/'
+
+    def test_requests_are_not_profiled_by_default(self):
+        self.client.force_authenticate(self.user)
+        self.assertNotIn('X-Profile-Id', self.client.get(self.url))
+        self.assertNotIn('X-Profile-Id', self.client.get(self.url, {'__profile': 1}))
+        self.assertNotIn('X-Profile-Id', self.client.get(self.url, headers={PROFILE_HEADER: 'profile:forged:signature'}))
+        self.assertEqual(list_profiles(), [])
+
+    def test_signed_header_stores_profile_and_sql_timeline(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get(self.url, headers={PROFILE_HEADER: make_profile_token()})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        profile_id = response['X-Profile-Id']
+        with open(profile_file(profile_id, 'meta')) as handle:
+            meta = json.load(handle)
+        self.assertEqual(meta['action'], 'DashboardView.get_recent_jobs')
+        self.assertEqual(meta['query_count'], len(meta['queries']))
+        self.assertTrue(all('sql' in query and 'offset' in query for query in meta['queries']))
+        self.assertTrue(os.path.exists(profile_file(profile_id, 'collapsed')))
+
+    def test_store_keeps_the_most_recent_profiles(self):
+        self.client.force_authenticate(self.user)
+        ids = [
+            self.client.get(self.url, headers={PROFILE_HEADER: make_profile_token()})['X-Profile-Id']
+            for _ in range(3)
+        ]
+
+        self.assertEqual(len(list_profiles()), 2)
+        self.assertFalse(os.path.exists(profile_file(ids[0], 'meta')))
+        self.assertFalse(os.path.exists(profile_file(ids[0], 'collapsed')))
+
+    def test_staff_query_parameter_and_admin_pages(self):
+        self.client.force_login(self.staff)
+        response = self.client.get('/metrics', {'__profile': 1})
+        profile_id = response['X-Profile-Id']
+
+        listing = self.client.get('/admin/profiles/')
+        self.assertEqual(listing.status_code, status.HTTP_200_OK)
+        self.assertContains(listing, profile_id)
+        download = self.client.get(f'/admin/profiles/{profile_id}/meta/')
+        self.assertEqual(download.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get('/admin/profiles/missing/meta/').status_code, status.HTTP_404_NOT_FOUND)
+
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/admin/profiles/').status_code, status.HTTP_302_FOUND)
+
+
+class SeedDataTestCase(TestCase):
+    def test_seeded_data_is_consistent(self):
+        counts = seed_data(detailers=6, jobs_per_detailer=15, days_back=30, days_ahead=7, availability_days=7, seed=7, batch_size=20)
+
+        self.assertEqual(Detailer.objects.count(), 6)
+        self.assertEqual(Job.objects.count(), counts['jobs'])
+        self.assertEqual(Earning.objects.count(), Job.objects.filter(status='completed').count())
+        self.assertEqual(Review.objects.count(), counts['reviews'])
+        self.assertEqual(Availability.objects.count(), counts['availability'])
+        # One shared password hash, running totals in step with the earnings
+        self.assertEqual(User.objects.values('password').distinct().count(), 1)
+        self.assertEqual(find_balance_drift(), [])
+
+        for job in Job.objects.booked().filter(detailer__isnull=False)[:50]:
+            self.assertFalse(job.conflicting_jobs().exists())
+
+
+class LoadTestHarnessTestCase(LiveServerTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='load@test.com',
+            password='testpass123',
+            first_name='Lo',
+            last_name='Ad',
+            phone='5550010000',
+            username='load@test.com',
+        )
+        Detailer.objects.create(user=self.user, city='London', country='UK')
+
+    def test_mixed_load_reports_every_action(self):
+        report = run_load_test(
+            url=self.live_server_url,
+            credentials=[('load@test.com', 'testpass123')],
+            mix=parse_mix('get_timeslots:2,get_quick_stats:1,get_recent_jobs:1,create_new_user:1'),
+            rps=40,
+            duration=0.5,
+            concurrency=4,
+            seed=1,
+        )
+
+        self.assertEqual(report['total']['requests'], 20)
+        self.assertEqual(report['total']['errors'], 0, report['total']['status_codes'])
+        self.assertEqual(report['login']['requests'], 1)
+        self.assertTrue(set(report['actions']) <= {'get_timeslots', 'get_quick_stats', 'get_recent_jobs', 'create_new_user'})
+        self.assertLessEqual(report['total']['latency_ms']['p50'], report['total']['latency_ms']['p99'])
+
+        slower = json.loads(json.dumps(report))
+        slower['total']['latency_ms']['p95'] = report['total']['latency_ms']['p95'] * 2
+        _, regressions = compare_reports(report, slower)
+        self.assertIn('total', regressions)
+
+    def test_command_raises_on_regression(self):
+        with tempfile.TemporaryDirectory() as directory:
+            options = {'url': self.live_server_url, 'user': ['load@test.com:testpass123'], 'mix': 'get_recent_jobs:1', 'rps': 10, 'duration': 0.3}
+            baseline = os.path.join(directory, 'baseline.json')
+            call_command('loadtest', output=baseline, **options)
+            with open(baseline) as handle:
+                report = json.load(handle)
+            report['total']['latency_ms']['p95'] = 0.001
+            with open(baseline, 'w') as handle:
+                json.dump(report, handle)
+
+            with self.assertRaisesMessage(CommandError, 'Regressed: total'):
+                call_command('loadtest', compare=baseline, stdout=io.StringIO(), stderr=io.StringIO(), **options)
+
+
+class FastJSONRendererTestCase(TestCase):
+    payload = {
+        'net_amount': Decimal('72.25'),
+        'created_at': datetime(2025, 3, 1, 9, 30, 15, 123456, tzinfo=dt_timezone.utc),
+        'naive': datetime(2025, 3, 1, 9, 30),
+        'day': date(2025, 3, 1),
+        'start_time': time(9, 30),
+        'reference': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+        'slots': [{'start_time': '09:00', 'is_available': True, 'rating': None}],
+        1: 'non string key',
+        'name': 'Zoë',
+        'note': 'line\u2028break\u2029 – dash',
+        'precise_time': time(9, 30, 1, 123456),
+        'rating': 4.75,
+    }
+
+    def test_renders_like_the_stock_renderer(self):
+        self.assertEqual(FastJSONRenderer().render(self.payload), JSONRenderer().render(self.payload))
+        self.assertIn(b'"created_at":"2025-03-01T09:30:15.123456Z"', FastJSONRenderer().render(self.payload))
+        self.assertIn(b'"note":"line\\u2028break\\u2029 \xe2\x80\x93 dash"', FastJSONRenderer().render(self.payload))
+
+    def test_non_finite_floats_render_as_null(self):
+        # The documented difference: DRF's strict encoder refuses them
+        with self.assertRaises(ValueError):
+            JSONRenderer().render({'rating': float('nan')})
+        self.assertEqual(FastJSONRenderer().render({'rating': float('nan'), 'max': float('inf')}), b'{"rating":null,"max":null}')
+
+    def test_indent_and_oversized_integers_fall_back(self):
+        indented = FastJSONRenderer().render(self.payload, 'application/json; indent=4')
+        self.assertEqual(indented, JSONRenderer().render(self.payload, 'application/json; indent=4'))
+        self.assertEqual(FastJSONRenderer().render({'big': 2 ** 70}), b'{"big":1180591620717411303424}')
+
+    def test_parser(self):
+        body = b'{"credentials":{"email":"a@b.com","amount":12.5}}'
+        self.assertEqual(FastJSONParser().parse(io.BytesIO(body)), JSONParser().parse(io.BytesIO(body)))
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(io.BytesIO(b'{"broken":'))
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'])
+class ReplicaRoutingTestCase(TestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.user = User.objects.create_user(
+            email='replica@test.com',
+            password='testpass123',
+            first_name='Rep',
+            last_name='Lica',
+            phone='5550011000',
+            username='replica@test.com',
+        )
+
+    def test_reads_are_pinned_inside_replica_blocks(self):
+        self.assertIsNone(self.router.db_for_read(Job))
+        with replica_reads(self.user) as alias:
+            self.assertEqual(alias, 'replica_1')
+            self.assertEqual(self.router.db_for_read(Job), 'replica_1')
+            self.assertEqual(self.router.db_for_write(Job), 'default')
+        self.assertIsNone(self.router.db_for_read(Job))
+        self.assertFalse(self.router.allow_migrate('replica_1', 'main'))
+
+    def test_writing_user_reads_from_primary(self):
+        def view(request):
+            request.user = self.user
+            with replica_reads(request.user):
+                Detailer.objects.create(user=self.user, city='London', country='UK')
+                # Reads after a write in the same request see it on the primary
+                self.assertIsNone(self.router.db_for_read(Detailer))
+            return HttpResponse()
+
+        ReplicaStickinessMiddleware(view)(RequestFactory().post('/api/v1/onboard/create_new_user/'))
+
+        self.assertTrue(is_sticky(self.user))
+        with replica_reads(self.user) as alias:
+            self.assertEqual(alias, 'default')
+            self.assertIsNone(self.router.db_for_read(Job))
+
+    @override_settings(REPLICA_STICKY_SECONDS=0)
+    def test_stickiness_expires(self):
+        mark_sticky(self.user)
+        with replica_reads(self.user) as alias:
+            self.assertEqual(alias, 'replica_1')
+
+
+class SQLiteTuningTestCase(TestCase):
+    def test_connection_pragmas_and_immediate_transactions(self):
+        if connection.vendor != 'sqlite' or not settings.SQLITE_TUNING:
+            self.skipTest("SQLite tuning is off")
+        with connection.cursor() as cursor:
+            pragmas = {
+                pragma: cursor.execute(f'PRAGMA {pragma}').fetchone()[0]
+                for pragma in ('synchronous', 'busy_timeout', 'temp_store')
+            }
+        self.assertEqual(pragmas, {'synchronous': 1, 'busy_timeout': settings.SQLITE_BUSY_TIMEOUT * 1000, 'temp_store': 2})
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+
+async def _open_websocket(application, path, headers=()):
+    """ Run the websocket handshake against an ASGI app, returns (communicator, accepted, close code) """
+    path, _, query_string = path.partition('?')
+    communicator = ApplicationCommunicator(application, {
+        'type': 'websocket',
+        'path': path,
+        'query_string': query_string.encode(),
+        'headers': [(b'host', b'testserver'), *headers],
+        'subprotocols': [],
+    })
+    await communicator.send_input({'type': 'websocket.connect'})
+    response = await communicator.receive_output(5)
+    return communicator, response['type'] == 'websocket.accept', response.get('code')
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class DetailerWebsocketTestCase(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='socket@test.com',
+            password='testpass123',
+            first_name='Sock',
+            last_name='Et',
+            phone='5550012000',
+            username='socket@test.com',
+        )
+        self.detailer = Detailer.objects.create(user=self.user, city='London', country='UK')
+
+    def test_jwt_authenticated_detailer_receives_events(self):
+        from prisma.asgi import application
+
+        async def receive_json(communicator):
+            message = await communicator.receive_output(5)
+            return json.loads(message['text'])
+
+        async def scenario():
+            communicator, accepted, _ = await _open_websocket(application, '/ws/detailer/', headers=[
+                (b'authorization', f'Bearer {AccessToken.for_user(self.user)}'.encode()),
+            ])
+            self.assertTrue(accepted)
+            await communicator.send_input({'type': 'websocket.receive', 'text': json.dumps({'type': 'ping'})})
+            self.assertEqual(await receive_json(communicator), {'type': 'pong'})
+            await sync_to_async(notify_detailer)(self.detailer.pk, 'job.assigned', {'job_id': 7})
+            self.assertEqual(await receive_json(communicator), {'type': 'job.assigned', 'payload': {'job_id': 7}})
+            await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await communicator.wait(5)
+
+        async_to_sync(scenario)()
+
+    def test_connections_without_a_valid_token_are_refused(self):
+        from prisma.asgi import application
+
+        async def connect(path):
+            communicator, accepted, code = await _open_websocket(application, path)
+            await communicator.send_input({'type': 'websocket.disconnect', 'code': code})
+            await communicator.wait(5)
+            return accepted, code
+
+        self.assertEqual(async_to_sync(connect)('/ws/detailer/'), (False, 4401))
+        self.assertEqual(async_to_sync(connect)('/ws/detailer/?token=not-a-jwt'), (False, 4401))
+
+
+class ServiceCatalogTestCase(APITestCase):
+    def setUp(self):
+        self.service_type = ServiceType.objects.create(name='Full Valet', wash_type='traditional', duration=120, price=80.0)
+        invalidate_catalog()
+
+    def test_catalog_is_served_from_cache_after_the_first_read(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(get_service_type(self.service_type.pk)['duration'], 120)
+        with self.assertNumQueries(0):
+            self.assertEqual(service_price(self.service_type.pk), 80.0)
+            self.assertIsNone(get_service_type(None))
+
+    def test_admin_form_save_invalidates_the_catalog(self):
+        etag = catalog_etag()
+        form = ServiceTypeForm(
+            {'name': 'Full Valet', 'wash_type': 'traditional', 'duration': 150, 'price': 95.0, 'description_text': 'Seats\nCarpets'},
+            instance=self.service_type,
+        )
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+
+        self.assertEqual(get_service_type(self.service_type.pk)['duration'], 150)
+        self.assertEqual(get_service_type(self.service_type.pk)['description'], ['Seats', 'Carpets'])
+        self.assertNotEqual(catalog_etag(), etag)
+
+    def test_service_types_endpoint_honours_if_none_match(self):
+        response = self.client.get('/api/v1/catalog/get_service_types/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['serviceTypes'], [{
+            'id': self.service_type.pk, 'name': 'Full Valet', 'description': {}, 'washType': 'traditional', 'duration': 120, 'price': 80.0,
+        }])
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/v1/catalog/get_service_types/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+        ServiceType.objects.create(name='Interior', wash_type='steam', duration=60, price=40.0)
+        response = self.client.get('/api/v1/catalog/get_service_types/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()['serviceTypes']), 2)
+
+
+class MediaProcessingTestCase(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+
+        user = User.objects.create_user(
+            email='photos@test.com',
+            password='testpass123',
+            first_name='Photo',
+            last_name='Grapher',
+            phone='5550013000',
+            username='photos@test.com',
+        )
+        self.detailer = Detailer.objects.create(user=user, city='London', country='UK')
+        self.service_type = ServiceType.objects.create(name='Basic Wash', wash_type='traditional', duration=60, price=25.00)
+        self.job = make_job(self.detailer, self.service_type, timezone.now())
+
+    def _phone_photo(self):
+        """ 3000x2000 JPEG taken sideways (orientation 6) with a GPS position in its EXIF """
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x010F] = 'PhoneMaker'
+        exif.get_ifd(0x8825)[2] = (51.0, 30.0, 0.0)
+        buffer = io.BytesIO()
+        Image.new('RGB', (3000, 2000), (200, 30, 30)).save(buffer, 'JPEG', exif=exif, quality=95)
+        return SimpleUploadedFile('car.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def test_upload_queues_processing_once_committed(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.job.status = 'accepted'
+            self.job.save(update_fields=['status'])
+        self.assertNotIn(process_uploaded_image.name, [getattr(callback, '__qualname__', None) for callback in callbacks])
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.job.before_photo = self._phone_photo()
+            self.job.save()
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(callbacks[0].args, ('main.job', self.job.pk, 'before_photo'))
+
+    def test_variants_are_generated_and_served_to_lists(self):
+        self.job.before_photo = self._phone_photo()
+        self.job.save()
+        original_url = get_full_media_url(self.job.before_photo, variant='thumbnail')
+        self.assertTrue(original_url.endswith(self.job.before_photo.name))
+
+        entry = process_image_field('main.job', self.job.pk, 'before_photo')
+        self.assertEqual((entry['width'], entry['height']), (2000, 3000))
+        self.assertEqual(entry['variants']['thumbnail']['height'], 240)
+        self.assertEqual(entry['variants']['medium']['width'], 720)
+        self.assertIsNone(process_image_field('main.job', self.job.pk, 'before_photo'))
+
+        self.job.refresh_from_db()
+        with self.job.before_photo.open('rb') as original:
+            image = Image.open(original)
+            self.assertEqual(image.size, (2000, 3000))
+            self.assertEqual(dict(image.getexif()), {})
+        thumbnail = entry['variants']['thumbnail']['webp']
+        self.assertLess(self.job.before_photo.storage.size(thumbnail), 10 * 1024)
+
+        self.assertTrue(get_full_media_url(self.job.before_photo, variant='thumbnail').endswith(thumbnail))
+        self.assertTrue(get_full_media_url(self.job.before_photo, variant='medium', image_format='jpeg').endswith('.medium.jpeg'))
+        self.assertTrue(get_full_media_url(self.job.before_photo).endswith(self.job.before_photo.name))
+        self.assertIsNone(get_full_media_url(self.job.after_photo, variant='thumbnail'))
+
+
+class PhotoUploadTestCase(APITestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+
+        self.user = User.objects.create_user(
+            email='uploader@test.com',
+            password='testpass123',
+            first_name='Up',
+            last_name='Loader',
+            phone='5550014000',
+            username='uploader@test.com',
+        )
+        detailer = Detailer.objects.create(user=self.user, city='London', country='UK')
+        service_type = ServiceType.objects.create(name='Basic Wash', wash_type='traditional', duration=60, price=25.00)
+        self.job = make_job(detailer, service_type, timezone.now())
+        self.client.force_authenticate(self.user)
+
+        buffer = io.BytesIO()
+        Image.effect_noise((400, 300), 50).convert('RGB').save(buffer, 'JPEG', quality=95)
+        self.photo = buffer.getvalue()
+
+    def _create(self, **overrides):
+        data = {'job_id': self.job.pk, 'field': 'after_photo', 'filename': 'after.jpg', 'size': len(self.photo), **overrides}
+        return self.client.post('/api/v1/uploads/create/', data, format='json')
+
+    def _patch(self, upload_id, offset, chunk):
+        return self.client.generic(
+            'PATCH', f'/api/v1/uploads/{upload_id}/', chunk,
+            content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def test_chunked_upload_resumes_and_finalizes(self):
+        response = self._create()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        upload_id = response.json()['uploadId']
+        self.assertTrue(response['Location'].endswith(f'/api/v1/uploads/{upload_id}/'))
+
+        middle = len(self.photo) // 2
+        response = self._patch(upload_id, 0, self.photo[:middle])
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(response['Upload-Offset'], str(middle))
+
+        # A retried chunk the server already has is refused with the offset to resume from
+        response = self._patch(upload_id, 0, self.photo[:middle])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response['Upload-Offset'], str(middle))
+        response = self.client.post('/api/v1/uploads/finalize/', {'upload_id': upload_id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        response = self.client.head(f'/api/v1/uploads/{upload_id}/')
+        self.assertEqual((response['Upload-Offset'], response['Upload-Length']), (str(middle), str(len(self.photo))))
+        self.assertEqual(self._patch(upload_id, middle, self.photo[middle:])['Upload-Offset'], str(len(self.photo)))
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post('/api/v1/uploads/finalize/', {'upload_id': upload_id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Setting the photo queued its processing, the other callback removes the partial file
+        queued = [callback for callback in callbacks if getattr(callback, 'args', None) == ('main.job', self.job.pk, 'after_photo')]
+        self.assertEqual(len(queued), 1)
+        for callback in callbacks:
+            if callback not in queued:
+                callback()
+        self.job.refresh_from_db()
+        self.assertTrue(response.json()['url'].endswith(self.job.after_photo.name))
+        with self.job.after_photo.open('rb') as photo:
+            self.assertEqual(photo.read(), self.photo)
+        upload = PhotoUpload.objects.get(pk=upload_id)
+        self.assertEqual(upload.status, 'complete')
+        self.assertFalse(self.job.after_photo.storage.exists(upload.partial_name))
+
+    def test_invalid_uploads_are_refused(self):
+        self.assertEqual(self._create(filename='notes.pdf').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self._create(size=settings.PHOTO_UPLOAD_MAX_SIZE + 1).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self._create(job_id=self.job.pk + 1).status_code, status.HTTP_404_NOT_FOUND)
+
+        upload_id = self._create(size=8).json()['uploadId']
+        self.assertEqual(self._patch(upload_id, 0, b'x' * 9).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self._patch(upload_id, 0, b'not jpeg').status_code, status.HTTP_204_NO_CONTENT)
+        response = self.client.post('/api/v1/uploads/finalize/', {'upload_id': upload_id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.job.refresh_from_db()
+        self.assertFalse(self.job.after_photo)
+
+    def test_abandoned_uploads_are_cleaned_up(self):
+        stale_id = self._create().json()['uploadId']
+        self._patch(stale_id, 0, self.photo[:100])
+        fresh_id = self._create().json()['uploadId']
+        PhotoUpload.objects.filter(pk=stale_id).update(updated_at=timezone.now() - timedelta(hours=25))
+        stale = PhotoUpload.objects.get(pk=stale_id)
+        storage = self.job.after_photo.storage
+        self.assertTrue(storage.exists(stale.partial_name))
+
+        self.assertEqual(cleanup_abandoned_uploads(), 1)
+        self.assertFalse(PhotoUpload.objects.filter(pk=stale_id).exists())
+        self.assertFalse(storage.exists(stale.partial_name))
+        self.assertTrue(PhotoUpload.objects.filter(pk=fresh_id).exists())
+
+
+class MediaAccessTestCase(APITestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+
+        service_type = ServiceType.objects.create(name='Basic Wash', wash_type='traditional', duration=60, price=25.00)
+        self.users = []
+        for index in range(2):
+            user = User.objects.create_user(
+                email=f'media{index}@test.com',
+                password='testpass123',
+                first_name='Media',
+                last_name=f'User{index}',
+                phone=f'55500150{index:02d}',
+                username=f'media{index}@test.com',
+            )
+            self.users.append(user)
+        detailer = Detailer.objects.create(user=self.users[0], city='London', country='UK')
+        self.job = make_job(detailer, service_type, timezone.now())
+        Job.objects.filter(pk=self.job.pk).update(before_photo='jobs/before/car.jpg')
+        os.makedirs(os.path.join(media_root.name, 'jobs', 'before'))
+        with open(os.path.join(media_root.name, 'jobs', 'before', 'car.jpg'), 'wb') as photo:
+            photo.write(b'jpeg bytes')
+
+    def test_authorized_requests_are_handed_to_nginx(self):
+        self.client.force_authenticate(self.users[0])
+        with self.assertNumQueries(1):
+            response = self.client.get('/media/jobs/before/car.jpg')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/jobs/before/car.jpg')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Cache-Control'], 'private, max-age=86400')
+        self.assertEqual(response.content, b'')
+
+        thumbnail = variant_name('jobs/before/car.jpg', 'thumbnail', 'webp')
+        response = self.client.get(f'/media/{thumbnail}')
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{thumbnail}')
+        self.assertEqual(response['Content-Type'], 'image/webp')
+
+    def test_other_users_and_unsafe_paths_are_refused(self):
+        self.assertEqual(self.client.get('/media/jobs/before/car.jpg').status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.force_authenticate(self.users[1])
+        self.assertEqual(self.client.get('/media/jobs/before/car.jpg').status_code, status.HTTP_404_NOT_FOUND)
+
+        self.users[1].is_staff = True
+        self.users[1].save(update_fields=['is_staff'])
+        self.assertEqual(self.client.get('/media/jobs/before/car.jpg').status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get('/media/uploads/partial/abc.part').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get('/media/jobs/../../settings.py').status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(MEDIA_ACCEL_REDIRECT=False)
+    def test_django_streams_the_file_without_nginx(self):
+        self.client.force_authenticate(self.users[0])
+        response = self.client.get('/media/jobs/before/car.jpg')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('X-Accel-Redirect', response)
+        self.assertEqual(b''.join(response.streaming_content), b'jpeg bytes')
+
+
+class CountingEmailBackend(LocmemEmailBackend):
+    """ Locmem backend counting the connections opened, optionally failing every send or the sends after fail_after """
+    opened = 0
+    fail_with = None
+    fail_after = None
+
+    def open(self):
+        CountingEmailBackend.opened += 1
+        return super().open()
+
+    def send_messages(self, messages):
+        if self.fail_with is not None and (self.fail_after is None or len(mail.outbox) >= self.fail_after):
+            raise self.fail_with
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND='main.tests.CountingEmailBackend', EMAIL_RETRY_BACKOFF=60, EMAIL_MAX_ATTEMPTS=3)
+class EmailSubsystemTestCase(APITestCase):
+    def setUp(self):
+        close_worker_connection()
+        self.addCleanup(close_worker_connection)
+        CountingEmailBackend.opened = 0
+        CountingEmailBackend.fail_with = None
+        CountingEmailBackend.fail_after = None
+        self.user = User.objects.create_user(
+            email='mail@test.com',
+            password='testpass123',
+            first_name='Mail',
+            last_name='User',
+            phone='5550016000',
+            username='mail@test.com',
+        )
+        self.detailer = Detailer.objects.create(user=self.user, city='London', country='UK')
+
+    def _queue_payout_notice(self, run_id, recipient='mail@test.com'):
+        context = {'first_name': 'Mail', 'total_amount': '69.75', 'earning_count': 3, 'payout_date': '2024-01-22', 'run_id': run_id}
+        return queue_email('payout_notice', recipient, context, dedupe_key=run_id, user=self.user)
+
+    def test_queueing_is_deduplicated(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertTrue(self._queue_payout_notice('2024-W03'))
+            self.assertFalse(self._queue_payout_notice('2024-W03'))
+            self.assertTrue(self._queue_payout_notice('2024-W04'))
+        self.assertEqual(EmailLog.objects.count(), 2)
+        self.assertEqual(len(callbacks), 2)
+        with self.assertRaises(ValueError):
+            queue_email('unknown', 'mail@test.com', {})
+
+    def test_batch_is_sent_over_one_connection(self):
+        for index in range(3):
+            self._queue_payout_notice(f'run-{index}', recipient=f'mail{index}@test.com')
+
+        # The claim, then one update per email
+        with self.assertNumQueries(3 + 3):
+            self.assertEqual(send_queued_batch(), (3, 0))
+        self.assertEqual(CountingEmailBackend.opened, 1)
+        self.assertEqual(len(mail.outbox), 3)
+        message = mail.outbox[0]
+        self.assertEqual(message.subject, 'Your payout of £69.75 is on its way')
+        self.assertIn('69.75', message.body)
+        self.assertEqual(message.alternatives[0][1], 'text/html')
+        self.assertFalse(EmailLog.objects.exclude(status='sent').exists())
+
+        self._queue_payout_notice('run-3')
+        send_queued_batch()
+        self.assertEqual(CountingEmailBackend.opened, 1)
+        self.assertEqual(send_queued_batch(), (0, 0))
+
+    def test_failures_are_retried_with_backoff(self):
+        CountingEmailBackend.fail_with = ValueError('mailbox unavailable')
+        self._queue_payout_notice('2024-W03')
+
+        self.assertEqual(send_queued_batch(), (0, 1))
+        log = EmailLog.objects.get()
+        self.assertEqual((log.status, log.attempts), ('queued', 1))
+        self.assertIn('mailbox unavailable', log.last_error)
+        self.assertAlmostEqual((log.next_attempt_at - timezone.now()).total_seconds(), 60, delta=5)
+        # Not due yet
+        self.assertEqual(send_queued_batch(), (0, 0))
+
+        for attempts in (2, 3):
+            EmailLog.objects.update(next_attempt_at=timezone.now())
+            send_queued_batch()
+        log.refresh_from_db()
+        self.assertEqual((log.status, log.attempts), ('failed', 3))
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_emails_sent_before_a_worker_dies_are_not_sent_again(self):
+        for index in range(3):
+            self._queue_payout_notice(f'run-{index}', recipient=f'mail{index}@test.com')
+        CountingEmailBackend.fail_with = SystemExit()
+        CountingEmailBackend.fail_after = 1
+        with self.assertRaises(SystemExit):
+            send_queued_batch()
+        self.assertEqual(EmailLog.objects.filter(status='sent').count(), 1)
+
+        # The rest of the batch is claimed again once the claim times out
+        CountingEmailBackend.fail_with = None
+        EmailLog.objects.filter(status='sending').update(claimed_at=timezone.now() - timedelta(seconds=settings.EMAIL_CLAIM_TIMEOUT + 1))
+        self.assertEqual(send_queued_batch(), (2, 0))
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['mail0@test.com', 'mail1@test.com', 'mail2@test.com'])
+
+    def test_dropped_connection_is_reopened(self):
+        CountingEmailBackend.fail_with = ConnectionResetError()
+        self._queue_payout_notice('2024-W03')
+
+        self.assertEqual(send_queued_batch(), (0, 1))
+        self.assertEqual(CountingEmailBackend.opened, 2)
+
+    def test_event_emails_are_queued(self):
+        service_type = ServiceType.objects.create(name='Basic Wash', wash_type='traditional', duration=60, price=25.00)
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        job = make_job(self.detailer, service_type, timezone.make_aware(datetime.combine(tomorrow, time(10, 0))), status='accepted')
+        make_job(self.detailer, service_type, timezone.make_aware(datetime.combine(tomorrow, time(14, 0))), status='cancelled')
+        self.assertEqual(queue_job_reminders(), 1)
+        self.assertEqual(queue_job_reminders(), 0)
+        reminder = EmailLog.objects.get(event='job_reminder')
+        job.refresh_from_db()
+        self.assertEqual(reminder.dedupe_key, f'job:{job.pk}:{job.appointment_start.isoformat()}')
+        self.assertEqual(reminder.context['service_type'], 'Basic Wash')
+
+        # Moving only the time of the job reminds the detailer again
+        job.appointment_time = time(11, 0)
+        job.save()
+        self.assertEqual(queue_job_reminders(), 1)
+        self.assertEqual(EmailLog.objects.filter(event='job_reminder').latest('pk').context['appointment_time'], '11:00')
+
+        job.status = 'completed'
+        job.save()
+        Earning.objects.create(detailer=self.detailer, job=job, gross_amount=Decimal('25.00'), commission=Decimal('3.75'))
+        run = run_payouts('test-run', payout_date=date(2024, 1, 22))
+        self.assertEqual(queue_payout_notices(run), 1)
+        self.assertEqual(queue_payout_notices(run), 0)
+        self.assertEqual(EmailLog.objects.get(event='payout_notice').context['total_amount'], '21.25')
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post('/api/v1/onboard/create_new_user/', {'credentials': {
+                'email': 'welcome@test.com', 'password': 'testpass123', 'first_name': 'New', 'last_name': 'Detailer',
+                'phone': '5550016001', 'address': '1 Road', 'city': 'London', 'postcode': 'E1 1AA', 'country': 'UK',
+            }}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIn(_schedule_send, callbacks)
+        welcome = EmailLog.objects.get(event='welcome')
+        self.assertEqual((welcome.recipient, welcome.status), ('welcome@test.com', 'queued'))
+        subject, text, html = render_email('welcome', welcome.context)
+        self.assertEqual(subject, 'Welcome to Prisma, New')
+
+    def test_signup_succeeds_without_a_broker(self):
+        # The send is published straight from the signup's commit hook. Outside docker-compose the broker
+        # host doesn't resolve, the publish fails without a retry and the email waits for the sweep
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/v1/onboard/create_new_user/', {'credentials': {
+                'email': 'nobroker@test.com', 'password': 'testpass123', 'first_name': 'No', 'last_name': 'Broker',
+                'phone': '5550016002', 'address': '1 Road', 'city': 'London', 'postcode': 'E1 1AA', 'country': 'UK',
+            }}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(EmailLog.objects.get(event='welcome').status, 'queued')
+        self.assertEqual(send_queued_batch(), (1, 0))
+
+
+@override_settings(SHARED_CACHE=True)
+class SlotPrecomputeTestCase(APITestCase):
+    def setUp(self):
+        user = User.objects.create_user(
+            email='slots@test.com',
+            password='testpass123',
+            first_name='Slot',
+            last_name='Grid',
+            phone='5550017000',
+            username='slots@test.com',
+        )
+        self.detailer = Detailer.objects.create(user=user, city='London', country='UK')
+        self.service_type = ServiceType.objects.create(name='Full Valet', wash_type='traditional', duration=90, price=60.00)
+        invalidate_catalog()
+        self.tomorrow = timezone.localdate() + timedelta(days=1)
+
+    def _get_timeslots(self, day, duration=90, city='London'):
+        params = {'date': day.isoformat(), 'service_duration': duration, 'country': 'UK', 'city': city}
+        return self.client.get('/api/v1/availability/get_timeslots/', params)
+
+    def test_precomputed_grids_are_served_without_queries(self):
+        # London over three days, for the catalog duration and the default one
+        self.assertEqual(precompute_slot_grids(days=3), 6)
+        with self.assertNumQueries(0):
+            response = self._get_timeslots(self.tomorrow)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        cold = next(iter(build_grids(self.tomorrow, self.tomorrow, [90]).values()))
+        self.assertEqual(response.json()['slots'], cold['slots'])
+        self.assertEqual(response.json()['slots'][0], {'start_time': '06:00', 'end_time': '07:30', 'is_available': True})
+
+    def test_booking_refreshes_only_its_day(self):
+        precompute_slot_grids(days=3)
+        with self.captureOnCommitCallbacks() as callbacks:
+            make_job(self.detailer, self.service_type, timezone.make_aware(datetime.combine(self.tomorrow, time(8, 0))), status='accepted')
+        self.assertIn('main.task.refresh_slot_grids', [getattr(callback, '__qualname__', None) for callback in callbacks])
+
+        with self.assertNumQueries(0):
+            self._get_timeslots(self.tomorrow + timedelta(days=1))
+        self.assertEqual(refresh_slot_grids('London', self.tomorrow), 2)
+        with self.assertNumQueries(0):
+            response = self._get_timeslots(self.tomorrow)
+        start_times = [slot['start_time'] for slot in response.json()['slots']]
+        self.assertNotIn('08:00', start_times)
+        self.assertIn('10:00', start_times)
+
+        # Moving the job to a pending state frees the slot again, a status unrelated save doesn't
+        job = Job.objects.get()
+        job.status = 'pending'
+        job.save()
+        self.assertIn('08:00', [slot['start_time'] for slot in self._get_timeslots(self.tomorrow).json()['slots']])
+        with self.captureOnCommitCallbacks() as callbacks:
+            job.owner_note = 'Gate code 1234'
+            job.save()
+        self.assertEqual(callbacks, [])
+
+    def test_detailer_changes_refresh_their_city(self):
+        self.assertEqual(self._get_timeslots(self.tomorrow, city='Leeds').json()['slots'], [])
+        self._get_timeslots(self.tomorrow)
+
+        Detailer.objects.create(user=self.detailer.user, city='Leeds', country='UK')
+        self.assertTrue(self._get_timeslots(self.tomorrow, city='Leeds').json()['slots'])
+
+        self.detailer.is_active = False
+        self.detailer.save()
+        self.assertIn('No active detailers', self._get_timeslots(self.tomorrow).json()['error'])
+
+    @override_settings(SHARED_CACHE=False)
+    def test_process_local_cache_computes_grids_per_request(self):
+        # Another worker would never see this process bump the version, nothing is cached or refreshed
+        self.assertEqual(precompute_slot_grids(days=3), 0)
+        with self.assertNumQueries(3):
+            self._get_timeslots(self.tomorrow)
+        with self.captureOnCommitCallbacks() as callbacks:
+            make_job(self.detailer, self.service_type, timezone.make_aware(datetime.combine(self.tomorrow, time(8, 0))), status='accepted')
+        self.assertNotIn('main.task.refresh_slot_grids', [getattr(callback, '__qualname__', None) for callback in callbacks])
+        with self.assertNumQueries(3):
+            response = self._get_timeslots(self.tomorrow)
+        self.assertNotIn('08:00', [slot['start_time'] for slot in response.json()['slots']])
+
+    def test_shared_cache_is_checked_at_startup(self):
+        # The test cache is process local
+        self.assertEqual([error.id for error in check_shared_cache(None)], ['main.E001'])
+        with override_settings(SHARED_CACHE=False):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+class JobDispatchTestCase(TestCase):
+    def setUp(self):
+        self.service_type = ServiceType.objects.create(name='Basic Wash', wash_type='traditional', duration=60, price=25.00)
+        self.tomorrow = timezone.localdate() + timedelta(days=1)
+        # Two London detailers, one in Camden and one in Greenwich, and one in Leeds
+        self.detailers = []
+        for index, (city, latitude, longitude, rating) in enumerate([
+            ('London', 51.5390, -0.1426, 4.0),
+            ('London', 51.4826, 0.0077, 4.9),
+            ('Leeds', 53.8008, -1.5491, 5.0),
+        ]):
+            user = User.objects.create_user(
+                email=f'dispatch{index}@test.com',
+                password='testpass123',
+                first_name='Dispatch',
+                last_name=f'Detailer{index}',
+                phone=f'55500180{index:02d}',
+                username=f'dispatch{index}@test.com',
+            )
+            self.detailers.append(Detailer.objects.create(
+                user=user, city=city, country='UK', latitude=latitude, longitude=longitude, rating=rating,
+            ))
+
+    def _at(self, hour, minute=0):
+        return timezone.make_aware(datetime.combine(self.tomorrow, time(hour, minute)))
+
+    def _pending_job(self, hour, latitude, longitude, city='London'):
+        return make_job(None, self.service_type, self._at(hour), city=city, latitude=latitude, longitude=longitude)
+
+    def test_nearest_free_detailer_is_chosen(self):
+        camden, greenwich, leeds = self.detailers
+        detailer_rows = [
+            (camden.pk, 'London', camden.latitude, camden.longitude, camden.rating, 0),
+            (greenwich.pk, 'london', greenwich.latitude, greenwich.longitude, greenwich.rating, 0),
+            (leeds.pk, 'Leeds', leeds.latitude, leeds.longitude, leeds.rating, 0),
+        ]
+        kentish_town = (1, 'London', 51.5502, -0.1409, self._at(9), self._at(10))
+        self.assertEqual(plan_assignments([kentish_town], detailer_rows, [], []), {1: camden.pk})
+
+        # Busy at the time, travel interval included: the next best London detailer gets it
+        booked = [(camden.pk, self._at(10, 15), self._at(11))]
+        self.assertEqual(plan_assignments([kentish_town], detailer_rows, booked, []), {1: greenwich.pk})
+        # Available only in the afternoon
+        availability = [(camden.pk, self.tomorrow, time(13, 0), time(18, 0))]
+        self.assertEqual(plan_assignments([kentish_town], detailer_rows, [], availability), {1: greenwich.pk})
+
+        # Two clashing jobs never go to the same detailer, a job beyond the distance limit to nobody
+        clashing = (2, 'London', 51.5502, -0.1409, self._at(9, 30), self._at(10, 30))
+        oxford = (3, 'London', 51.7520, -1.2577, self._at(14), self._at(15))
+        assignments = plan_assignments([kentish_town, clashing, oxford], detailer_rows, [], [])
+        self.assertEqual(set(assignments), {1, 2})
+        self.assertNotEqual(assignments[1], assignments[2])
+
+    def test_pending_jobs_are_dispatched_in_batches(self):
+        camden, greenwich, leeds = self.detailers
+        jobs = [self._pending_job(hour, 51.5502, -0.1409) for hour in (8, 10, 12)]
+        jobs += [self._pending_job(hour, 51.4769, -0.0005) for hour in (8, 10, 12)]
+        unreachable = self._pending_job(9, 53.8008, -1.5491, city='York')
+        make_job(camden, self.service_type, self._at(14), status='accepted')
+
+        # Six queries, a savepoint around the batch and one around the update, and the back off of the
+        # jobs left unassigned, whatever the number of jobs and detailers
+        with self.captureOnCommitCallbacks() as callbacks:
+            with self.assertNumQueries(21):
+                totals = dispatch_pending_jobs(batch_size=4)
+        self.assertEqual(totals, {'assigned': 6, 'unassigned': 1, 'batches': 2})
+        # A notification per batch, beside the route invalidations of the detailer-days assigned to
+        notifications = [callback for callback in callbacks if getattr(callback, 'func', None) is not invalidate_route]
+        self.assertEqual(len(notifications), 2)
+        for job in jobs:
+            job.refresh_from_db()
+        self.assertEqual({job.detailer_id for job in jobs[:3]}, {camden.pk})
+        self.assertEqual({job.detailer_id for job in jobs[3:]}, {greenwich.pk})
+        self.assertEqual(Job.objects.filter(detailer=leeds).count(), 0)
+        unreachable.refresh_from_db()
+        self.assertIsNone(unreachable.detailer_id)
+        self.assertGreater(unreachable.dispatch_after, timezone.now())
+
+        # The job nobody can take isn't scored again until its delay is over
+        self.assertEqual(dispatch_pending_jobs(), {'assigned': 0, 'unassigned': 0, 'batches': 0})
+        Job.objects.filter(pk=unreachable.pk).update(dispatch_after=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(dispatch_pending_jobs(), {'assigned': 0, 'unassigned': 1, 'batches': 1})
+
+    @skipUnless(connection.vendor == 'sqlite', "Stands a SQLite trigger in for PostgreSQL's job_no_double_booking")
+    def test_a_conflicting_assignment_leaves_the_rest_of_the_batch(self):
+        camden, greenwich = self.detailers[:2]
+        conflicting = self._pending_job(9, 51.5502, -0.1409)
+        others = [self._pending_job(hour, 51.5502, -0.1409) for hour in (11, 13)]
+        # As if the detailer was booked by another transaction since the batch was planned
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TEMP TRIGGER dispatch_conflict BEFORE UPDATE OF detailer_id ON main_job "
+                f"WHEN NEW.id = {conflicting.pk} BEGIN SELECT RAISE(ABORT, 'double booking'); END"
+            )
+        try:
+            with self.captureOnCommitCallbacks(execute=True):
+                totals = dispatch_pending_jobs()
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute("DROP TRIGGER dispatch_conflict")
+        self.assertEqual(totals, {'assigned': 2, 'unassigned': 1, 'batches': 1})
+        for job in others:
+            job.refresh_from_db()
+            self.assertIn(job.detailer_id, {camden.pk, greenwich.pk})
+        conflicting.refresh_from_db()
+        self.assertIsNone(conflicting.detailer_id)
+        self.assertIsNotNone(conflicting.dispatch_after)
+
+    def test_jobs_later_today_stored_at_midnight_are_dispatched(self):
+        # The day is kept in appointment_date and the time apart, the stored window is what's upcoming
+        today = timezone.localdate()
+        if timezone.localtime().time() >= time(23, 30):
+            self.skipTest('No time left today for an upcoming job')
+        midnight = timezone.make_aware(datetime.combine(today, time(0, 0)))
+        job = make_job(None, self.service_type, midnight, appointment_time=time(23, 30), latitude=51.5502, longitude=-0.1409)
+        self.assertGreater(job.appointment_start, timezone.now())
+        self.assertEqual(dispatch_pending_jobs(day=today), {'assigned': 0, 'unassigned': 1, 'batches': 1})
+
+
+@override_settings(SHARED_CACHE=True)
+class RouteOptimizationTestCase(APITestCase):
+    def setUp(self):
+        self.service_type = ServiceType.objects.create(name='Basic Wash', wash_type='traditional', duration=30, price=25.00)
+        invalidate_catalog()
+        user = User.objects.create_user(
+            email='routes@test.com',
+            password='testpass123',
+            first_name='Route',
+            last_name='Planner',
+            phone='5550019000',
+            username='routes@test.com',
+        )
+        # Based in Camden
+        self.detailer = Detailer.objects.create(user=user, city='London', country='UK', latitude=51.5390, longitude=-0.1426)
+        self.tomorrow = timezone.localdate() + timedelta(days=1)
+        self.client.force_authenticate(user)
+
+    def _at(self, hour, minute=0):
+        return timezone.make_aware(datetime.combine(self.tomorrow, time(hour, minute)))
+
+    def _get_route(self, day=None):
+        return self.client.get('/api/v1/dashboard/get_route/', {'date': (day or self.tomorrow).isoformat()})
+
+    def test_overlapping_windows_are_reordered_to_drive_less(self):
+        # Greenwich, Kentish Town, Canary Wharf and Highgate half an hour apart: in appointment order the
+        # detailer crosses the city three times, within the arrival window both ends are done together
+        stops = [
+            (1, 51.4826, 0.0077, self._at(9), self._at(9, 15)),
+            (2, 51.5502, -0.1409, self._at(9, 30), self._at(9, 45)),
+            (3, 51.5054, -0.0235, self._at(10), self._at(10, 15)),
+            (4, 51.5712, -0.1456, self._at(10, 30), self._at(10, 45)),
+        ]
+        route = plan_route(stops, arrival_window=120)
+        self.assertEqual(route['order'], [1, 3, 2, 4])
+        self.assertEqual(route['late_minutes'], 0)
+        self.assertLess(route['distance_km'], route['appointment_order_km'])
+        self.assertEqual([stop['begin_minute'] for stop in route['stops']][0], 9 * 60)
+
+        # Without any slack the appointment order is kept
+        self.assertEqual(plan_route(stops, arrival_window=0)['order'], [1, 2, 3, 4])
+        self.assertEqual(plan_route([]), {
+            'order': [], 'stops': [], 'distance_km': 0.0, 'travel_minutes': 0.0, 'late_minutes': 0.0,
+            'appointment_order_km': 0.0, 'appointment_order_late_minutes': 0.0,
+        })
+
+    def test_route_is_cached_until_a_job_changes(self):
+        first = make_job(self.detailer, self.service_type, self._at(9), status='accepted', latitude=51.5502, longitude=-0.1409)
+        make_job(self.detailer, self.service_type, self._at(11), status='pending', latitude=51.4826, longitude=0.0077)
+        make_job(self.detailer, self.service_type, self._at(13), status='accepted')
+        make_job(self.detailer, self.service_type, self._at(15), status='cancelled', latitude=51.5054, longitude=-0.0235)
+
+        response = self._get_route()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        route = response.json()
+        self.assertEqual(route['date'], self.tomorrow.isoformat())
+        self.assertEqual([stop['appointmentTime'] for stop in route['stops']], ['09:00', '11:00'])
+        self.assertEqual(route['stops'][0]['jobId'], str(first.pk))
+        self.assertEqual(route['stops'][0]['serviceType'], 'Basic Wash')
+        self.assertFalse(any(stop['late'] for stop in route['stops']))
+        # The job without coordinates can't be placed on the route
+        self.assertEqual(len(route['unrouted']), 1)
+        self.assertGreater(route['totalDistanceKm'], route['stops'][0]['legDistanceKm'])
+
+        # Only the detailer is loaded once the route is cached
+        with self.assertNumQueries(1):
+            self.assertEqual(self._get_route().json(), route)
+
+        # Moving a job plans the day again
+        first.latitude, first.longitude = 51.5712, -0.1456
+        first.save()
+        with self.assertNumQueries(2):
+            moved = self._get_route().json()
+        self.assertNotEqual(moved['stops'][0]['legDistanceKm'], route['stops'][0]['legDistanceKm'])
+
+        # So does cancelling it, a change unrelated to the route doesn't
+        first.owner_note = 'Gate code 1234'
+        first.save()
+        with self.assertNumQueries(1):
+            self._get_route()
+        first.status = 'cancelled'
+        first.save()
+        self.assertEqual(len(self._get_route().json()['stops']), 1)
+
+    @override_settings(DATABASE_REPLICAS=['replica_1'])
+    def test_cached_route_is_planned_from_the_primary(self):
+        make_job(self.detailer, self.service_type, self._at(9), status='accepted', latitude=51.5502, longitude=-0.1409)
+        service_types()
+        # replica_1 isn't a configured database, any read sent to it fails
+        with replica_reads() as alias:
+            self.assertEqual(alias, 'replica_1')
+            route = detailer_route(self.detailer, self.tomorrow)
+        self.assertEqual(len(route['stops']), 1)
+
+    @override_settings(SHARED_CACHE=False)
+    def test_process_local_cache_plans_every_request(self):
+        job = make_job(self.detailer, self.service_type, self._at(9), status='accepted', latitude=51.5502, longitude=-0.1409)
+        self._get_route()
+        Job.objects.filter(pk=job.pk).update(status='cancelled')
+        with self.assertNumQueries(2):
+            self.assertEqual(self._get_route().json()['stops'], [])
+
+    def test_route_dates(self):
+        self.assertEqual(self.client.get('/api/v1/dashboard/get_route/', {'date': '19-10-2026'}).status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get('/api/v1/dashboard/get_route/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['date'], timezone.localdate().isoformat())
+        self.assertEqual(response.json()['stops'], [])
@@ -2,12 +2,19 @@ from django.urls import path
 from .views.authentication import AuthenticationView, CustomTokenObtainPairView
 from rest_framework_simplejwt.views import TokenRefreshView 
 from .views.availability import AvailabilityView    
+from .views.catalog import CatalogView
 from .views.dashboard import DashboardView
+from .views.exports import ExportView
+from .views.uploads import PhotoUploadChunkView, PhotoUploadView
 
 urlpatterns = [
     path('onboard/<str:action>/', AuthenticationView.as_view(), name='onboard'),
     path('authentication/login/', CustomTokenObtainPairView.as_view(), name='login'),
     path('authentication/refresh/', TokenRefreshView.as_view(), name='refresh'),
     path('availability/<str:action>/', AvailabilityView.as_view(), name='availability'),
+    path('catalog/<str:action>/', CatalogView.as_view(), name='catalog'),
     path('dashboard/<str:action>/', DashboardView.as_view(), name='dashboard'),
+    path('export/<str:action>/', ExportView.as_view(), name='export'),
+    path('uploads/<uuid:upload_id>/', PhotoUploadChunkView.as_view(), name='upload_chunk'),
+    path('uploads/<str:action>/', PhotoUploadView.as_view(), name='uploads'),
 ]
\ No newline at end of file
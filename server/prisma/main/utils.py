@@ -1,15 +1,34 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal, ROUND_HALF_UP
 from django.conf import settings
+from django.utils import timezone
 
-def get_full_media_url(relative_url):
+TWO_PLACES = Decimal('0.01')
+
+def get_full_media_url(relative_url, variant=None, image_format='webp'):
     """
     Convert a relative media URL to a full URL.
     
     Args:
-        relative_url (str): Relative URL like '/media/products/images/...'
+        relative_url (str or FieldFile): Relative URL like '/media/products/images/...', or the image
+            field itself, e.g. job.before_photo, to serve one of its resized variants
+        variant (str): 'thumbnail' for lists, 'medium' for detail screens, None for the original.
+            The original is served until the upload has been processed, see services/media.py
+        image_format (str): 'webp' or 'jpeg', format of the variant
         
     Returns:
         str: Full URL with the server base URL
     """
+    if hasattr(relative_url, 'field'):
+        field_file = relative_url
+        if not field_file:
+            return None
+        processed = (getattr(field_file.instance, 'media_variants', None) or {}).get(field_file.field.name) or {}
+        name = field_file.name
+        if variant and processed.get('source') == name and variant in processed.get('variants', {}):
+            name = processed['variants'][variant][image_format]
+        relative_url = field_file.storage.url(name)
+
     if not relative_url:
         return None
     
@@ -22,4 +41,74 @@ def get_full_media_url(relative_url):
         relative_url = relative_url[1:]
     
     # Combine base URL with relative URL
-    return f"{base_url}/{relative_url}" 
\ No newline at end of file
+    return f"{base_url}/{relative_url}" 
+
+def split_earning(gross_amount, commission_rate):
+    """
+    Split a gross amount into the commission kept by the platform and the detailer's net amount.
+
+    Args:
+        gross_amount: Gross amount (float, Decimal or str), e.g. the service type price
+        commission_rate (float): Commission rate of the detailer, e.g. 0.15
+
+    Returns:
+        tuple: (gross, commission, net) as Decimals rounded to two places
+    """
+    gross = Decimal(str(gross_amount or 0)).quantize(TWO_PLACES, rounding=ROUND_HALF_UP)
+    commission = (gross * Decimal(str(commission_rate or 0))).quantize(TWO_PLACES, rounding=ROUND_HALF_UP)
+    return gross, commission, gross - commission
+
+
+def day_start(day):
+    """ Timezone aware datetime of midnight at the start of day, in the current timezone """
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def day_range(day):
+    """
+    Half-open datetime range covering one local day.
+
+    Filtering with field__gte=start, field__lt=end keeps the column bare, so the database can use
+    its indexes, where field__date=day wraps it in a timezone converting date cast.
+
+    Returns:
+        tuple: (start, end) timezone aware datetimes
+    """
+    return day_start(day), day_start(day + timedelta(days=1))
+
+
+def days_range(first_day, last_day):
+    """ Half-open datetime range from the start of first_day to the end of last_day (inclusive) """
+    return day_start(first_day), day_start(last_day + timedelta(days=1))
+
+
+def week_range(day):
+    """ Half-open datetime range of the Monday to Sunday week containing day """
+    monday = day - timedelta(days=day.weekday())
+    return days_range(monday, monday + timedelta(days=6))
+
+
+def month_range(day):
+    """ Half-open datetime range of the calendar month containing day """
+    first_day = day.replace(day=1)
+    next_month = (first_day + timedelta(days=32)).replace(day=1)
+    return day_start(first_day), day_start(next_month)
+
+
+def appointment_window(appointment_date, appointment_time, duration):
+    """
+    Compute the start and end of an appointment.
+
+    Args:
+        appointment_date (datetime): Day of the appointment, its local date is used
+        appointment_time (time): Local start time of the appointment
+        duration (int): Service duration in minutes
+
+    Returns:
+        tuple: (start, end) timezone aware datetimes
+    """
+    if timezone.is_naive(appointment_date):
+        appointment_date = timezone.make_aware(appointment_date)
+    local_day = timezone.localtime(appointment_date).date()
+    start = timezone.make_aware(datetime.combine(local_day, appointment_time))
+    return start, start + timedelta(minutes=duration or 0)
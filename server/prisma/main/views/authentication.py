@@ -8,6 +8,7 @@ from rest_framework.exceptions import ValidationError
 from ..serializer import CustomTokenObtainPairSerializer
 from rest_framework_simplejwt.views import TokenObtainPairView
 from main.models import User, Detailer
+from main.emails import queue_welcome_email
 
 # This simply handles the login process and returns the user data
 class CustomTokenObtainPairView(TokenObtainPairView):
@@ -23,6 +24,10 @@ class AuthenticationView(APIView):
     action_handler = {
         'create_new_user' : 'create_new_user',
     }
+    # Maximum number of queries each action may run, enforced by QueryBudgetTestCase
+    query_budgets = {
+        'create_new_user': 8,
+    }
 
     """ Override the post method to route the user to the appropriate view, given the action """
     def post(self, request, *args, **kwargs):
@@ -75,6 +80,8 @@ class AuthenticationView(APIView):
             # Save the user and the profile, then return the token and the user data
             user.save()
             profile.save()
+            # Sent by the celery worker, SMTP never slows the registration down
+            queue_welcome_email(user)
 
             return Response({
                 'user' :{
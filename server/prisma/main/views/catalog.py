@@ -0,0 +1,53 @@
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.permissions import AllowAny
+from rest_framework import status
+from django.utils.cache import patch_cache_control
+from ..catalog import catalog_etag, service_types
+
+
+class CatalogView(APIView):
+    """ Public catalog of the services offered, served from the catalog cache """
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    action_handler = {
+        "get_service_types": '_get_service_types',
+    }
+
+    # Maximum number of queries each action may run, a warm catalog runs none
+    query_budgets = {
+        "get_service_types": 1,
+    }
+
+    def get(self, request, *args, **kwargs):
+        action = kwargs.get('action')
+        if action not in self.action_handler:
+            return Response({"error": "Invalid action"}, status=status.HTTP_400_BAD_REQUEST)
+        handler = getattr(self, self.action_handler[action])
+        return handler(request)
+
+    def _get_service_types(self, request):
+        """Get every service type. Clients send back the ETag in If-None-Match and get a 304
+        without a body while the catalog is unchanged.
+        """
+        etag = catalog_etag()
+        if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response({
+                "serviceTypes": [
+                    {
+                        "id": service['id'],
+                        "name": service['name'],
+                        "description": service['description'],
+                        "washType": service['wash_type'],
+                        "duration": service['duration'],
+                        "price": service['price'],
+                    }
+                    for service in service_types()
+                ],
+            }, status=status.HTTP_200_OK)
+        response['ETag'] = etag
+        patch_cache_control(response, public=True, no_cache=True)
+        return response
@@ -2,12 +2,17 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from django.utils import timezone
 from datetime import datetime, timedelta
-from django.db.models import Sum, Avg, Count, Q
+from django.db.models import Sum, Avg, Count, Q, OuterRef, Subquery
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
+from ..catalog import service_duration, service_name
 from ..models import Detailer, Job, Earning, Review, ServiceType
+from ..routers import replica_reads
+from ..services.routes import detailer_route
+from ..utils import get_full_media_url
 import json
 
 class DashboardView(APIView):
@@ -17,30 +22,46 @@ class DashboardView(APIView):
         "get_today_overview": '_get_today_overview',
         "get_quick_stats": '_get_quick_stats',
         "get_recent_jobs": '_get_recent_jobs',
+        "get_route": '_get_route',
     }   
 
+    # Maximum number of queries each action may run, enforced by QueryBudgetTestCase
+    query_budgets = {
+        "get_today_overview": 4,
+        "get_quick_stats": 8,
+        "get_recent_jobs": 2,
+        "get_route": 2,
+    }
+
     def get(self, request, *args, **kwargs):
         action = kwargs.get('action')
         if action not in self.action_handler:
             return Response({"error": "Invalid action"}, status=status.HTTP_400_BAD_REQUEST)
         handler = getattr(self, self.action_handler[action])
-        return handler(request)
+        # Dashboard reads are aggregates only, they are served from a read replica when one is configured
+        with replica_reads(request.user):
+            return Response(handler(request), status=status.HTTP_200_OK)
         
 
     def _get_today_overview(self, request):
         """Get today's overview data which will include the total appointments, completed jobs, pending jobs, next appointment and current job. 
         """
-        today = timezone.now().date()
+        today = timezone.localdate()
 
         # Get today's jobs
         today_jobs = Job.objects.filter(
             detailer= Detailer.objects.get(user=request.user),
-            appointment_date__date=today
-        )
+        ).on_day(today)
         
-        total_appointments = today_jobs.count()
-        completed_jobs = today_jobs.filter(status='completed').count()
-        pending_jobs = today_jobs.filter(status__in=['pending', 'accepted', 'in_progress']).count()
+        # Count all three totals in a single query
+        counts = today_jobs.aggregate(
+            total=Count('id'),
+            completed=Count('id', filter=Q(status='completed')),
+            pending=Count('id', filter=Q(status__in=['pending', 'accepted', 'in_progress'])),
+        )
+        total_appointments = counts['total']
+        completed_jobs = counts['completed']
+        pending_jobs = counts['pending']
         
         # Get next appointment
         next_appointment = None
@@ -53,16 +74,16 @@ class DashboardView(APIView):
             next_appointment = {
                 "id": str(next_job.id) if next_job.id else None,
                 "clientName": next_job.client_name if next_job.client_name else None,
-                "serviceType": next_job.service_type.name if next_job.service_type else None,
+                "serviceType": service_name(next_job.service_type_id),
                 "appointmentTime": next_job.appointment_time.strftime("%H:%M") if next_job.appointment_time else None,
-                "duration": next_job.service_type.duration if next_job.service_type else None,
+                "duration": service_duration(next_job.service_type_id),
                 "address": next_job.address if next_job.address else None,
                 "vehicleInfo": f"{next_job.vehicle_make} {next_job.vehicle_model} ({next_job.vehicle_registration})" if next_job.vehicle_registration else None
             }
         
         # Get current job
         current_job = None
-        in_progress_job = today_jobs.filter(status=['in_progress', 'accepted']).first()
+        in_progress_job = today_jobs.filter(status__in=['in_progress', 'accepted']).first()
         
         if in_progress_job:
             # Calculate progress (simplified - you might want to track actual progress)
@@ -70,10 +91,10 @@ class DashboardView(APIView):
             current_job = {
                 "id": str(in_progress_job.id),
                 "clientName": in_progress_job.client_name,
-                "serviceType": in_progress_job.service_type.name,
+                "serviceType": service_name(in_progress_job.service_type_id),
                 "startTime": in_progress_job.appointment_time.strftime("%H:%M"),
                 "estimatedEndTime": (datetime.combine(today, in_progress_job.appointment_time) + 
-                                   timedelta(minutes=in_progress_job.service_type.duration)).strftime("%H:%M"),
+                                   timedelta(minutes=service_duration(in_progress_job.service_type_id))).strftime("%H:%M"),
                 "progress": progress,
                 "status": "in_progress"
             }
@@ -92,7 +113,7 @@ class DashboardView(APIView):
         """Get quick stats for the detailer which will include the weekly earnings, monthly earnings, completed jobs this week, completed jobs this month, pending jobs count, average rating and total reviews.
         """
         detailer = Detailer.objects.get(user=request.user)
-        today = timezone.now().date()
+        today = timezone.localdate()
         week_start = today - timedelta(days=today.weekday())
         month_start = today.replace(day=1)
         
@@ -114,17 +135,13 @@ class DashboardView(APIView):
         completed_jobs_this_week = Job.objects.filter(
             detailer=detailer,
             status='completed',
-            appointment_date__date__gte=week_start,
-            appointment_date__date__lte=today
-        ).count()
+        ).between_days(week_start, today).count()
         
         # Completed jobs this month
         completed_jobs_this_month = Job.objects.filter(
             detailer=detailer,
             status='completed',
-            appointment_date__date__gte=month_start,
-            appointment_date__date__lte=today
-        ).count()
+        ).between_days(month_start, today).count()
         
         # Pending jobs count
         pending_jobs_count = Job.objects.filter(
@@ -155,33 +172,48 @@ class DashboardView(APIView):
         """
         detailer = Detailer.objects.get(user=request.user)
 
-        # Recent jobs (last 7 days)
-        seven_days_ago = timezone.now().date() - timedelta(days=7)
+        # Recent jobs (last 7 days), with the service type read from the catalog cache and the earning and rating
+        # of each job read through subqueries instead of one query per job
+        seven_days_ago = timezone.localdate() - timedelta(days=7)
         recent_jobs = Job.objects.filter(
             detailer=detailer,
-            appointment_date__date__gte=seven_days_ago
+        ).since_day(seven_days_ago).annotate(
+            earning_net_amount=Subquery(Earning.objects.filter(job=OuterRef('pk')).values('net_amount')[:1]),
+            review_rating=Subquery(Review.objects.filter(job=OuterRef('pk')).values('rating')[:1]),
         ).order_by('-appointment_date')
         
         recent_jobs_data = []
         for job in recent_jobs:
-            # Get earnings for this job
-            earning = Earning.objects.filter(job=job).first()
-            earnings_amount = float(earning.net_amount) if earning else 0
-            
-            # Get rating for this job
-            review = Review.objects.filter(job=job).first()
-            rating = float(review.rating) if review else None
+            earnings_amount = float(job.earning_net_amount) if job.earning_net_amount is not None else 0
+            rating = float(job.review_rating) if job.review_rating is not None else None
             
             recent_jobs_data.append({
                 "id": str(job.id),
                 "clientName": job.client_name if job.client_name else None, 
-                "serviceType": job.service_type.name if job.service_type else None,
+                "serviceType": service_name(job.service_type_id),
                 "completedAt": job.appointment_date.isoformat() if job.appointment_date else None,
                 "earnings": earnings_amount if earnings_amount else None,
                 "rating": rating if rating else None,
-                "status": job.status if job.status else None
+                "status": job.status if job.status else None,
+                "beforePhoto": get_full_media_url(job.before_photo, variant='thumbnail'),
+                "afterPhoto": get_full_media_url(job.after_photo, variant='thumbnail'),
             })
         
         return {
             "recentJobs": recent_jobs_data,
         }
+
+    def _get_route(self, request):
+        """
+        Get the detailer's jobs of a day in the order that minimises driving while keeping to the appointment times
+
+        Query Parameters:
+        - date: YYYY-MM-DD format, defaults to today
+        """
+        date_str = request.query_params.get('date')
+        try:
+            day = datetime.strptime(date_str, '%Y-%m-%d').date() if date_str else timezone.localdate()
+        except ValueError:
+            raise ValidationError({"error": "Invalid date format. Use YYYY-MM-DD"})
+        detailer = Detailer.objects.only('id', 'latitude', 'longitude').get(user=request.user)
+        return detailer_route(detailer, day)
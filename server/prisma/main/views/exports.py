@@ -0,0 +1,65 @@
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.permissions import IsAdminUser
+from rest_framework import status
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from datetime import datetime
+from ..models import Earning
+from ..routers import replica_reads
+from ..services.exports import EXPORT_FORMATS, earnings_export_queryset, iter_export_rows, stream_arrow, stream_csv
+
+""" Streaming exports for finance. Rows are read through a server side cursor and written out
+    as they are produced, so memory stays constant however many rows are exported. Over ASGI the rows
+    are fetched a chunk at a time by main.middleware.AsyncStreamingMiddleware.
+"""
+class ExportView(APIView):
+    permission_classes = [IsAdminUser]
+
+    action_handler = {
+        'earnings': '_export_earnings',
+    }
+
+    def get(self, request, *args, **kwargs):
+        action = kwargs.get('action')
+        if action not in self.action_handler:
+            return Response({"error": "Invalid action"}, status=status.HTTP_400_BAD_REQUEST)
+        handler = getattr(self, self.action_handler[action])
+        return handler(request)
+
+    def _export_earnings(self, request):
+        """
+        Stream the earnings joined with their job and detailer
+
+        Query Parameters:
+        - file_format: csv (default) or arrow (Arrow IPC stream)
+        - start_date: YYYY-MM-DD, first day of the creation date range
+        - end_date: YYYY-MM-DD, last day of the creation date range
+        - payment_status: pending, paid or failed
+        """
+        data = request.query_params
+        file_format = data.get('file_format', 'csv')
+        payment_status = data.get('payment_status')
+
+        if file_format not in EXPORT_FORMATS:
+            return Response({"error": f"Invalid format. Use one of: {', '.join(EXPORT_FORMATS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        if payment_status and payment_status not in dict(Earning.PAYMENT_STATUS):
+            return Response({"error": "Invalid payment status"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            start_date = datetime.strptime(data['start_date'], '%Y-%m-%d').date() if data.get('start_date') else None
+            end_date = datetime.strptime(data['end_date'], '%Y-%m-%d').date() if data.get('end_date') else None
+        except ValueError:
+            return Response({"error": "Invalid date format. Use YYYY-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # The rows are streamed after the view returned, so the replica is bound to the queryset itself
+        with replica_reads(request.user) as alias:
+            rows = iter_export_rows(earnings_export_queryset(start_date, end_date, payment_status).using(alias))
+        stamp = timezone.localdate().isoformat()
+        if file_format == 'arrow':
+            response = StreamingHttpResponse(stream_arrow(rows), content_type='application/vnd.apache.arrow.stream')
+            response['Content-Disposition'] = f'attachment; filename="earnings-{stamp}.arrows"'
+        else:
+            response = StreamingHttpResponse(stream_csv(rows), content_type='text/csv')
+            response['Content-Disposition'] = f'attachment; filename="earnings-{stamp}.csv"'
+        return response
@@ -0,0 +1,64 @@
+import mimetypes
+import os
+from urllib.parse import quote
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.db.models import Q
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from ..models import Job, User
+from ..services.media import source_name
+
+# Private to the requesting user, the app may keep it a day. Photos are never changed in place, a new
+# upload gets a new name
+MEDIA_CACHE_CONTROL = 'private, max-age=86400'
+
+
+""" Media files hold customer vehicles and addresses, so every request is authorized here and the bytes
+    are then sent by nginx: the response only carries X-Accel-Redirect to the internal location of
+    nginx/conf.d/default.conf, which serves the file with sendfile, Range requests and conditional GETs.
+    Without MEDIA_ACCEL_REDIRECT (runserver without nginx) the file is streamed by Django instead.
+"""
+class MediaView(APIView):
+    # Bearer tokens for the app, the session for staff browsing photos from the admin
+    authentication_classes = [JWTAuthentication, SessionAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, path):
+        try:
+            full_path = safe_join(settings.MEDIA_ROOT, path)
+        except SuspiciousFileOperation:
+            raise Http404("File not found")
+        name = os.path.relpath(full_path, settings.MEDIA_ROOT).replace(os.sep, '/')
+        # Missing and forbidden files look the same, the response doesn't tell which photos exist
+        if not self._can_access(request.user, name):
+            raise Http404("File not found")
+
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        if settings.MEDIA_ACCEL_REDIRECT:
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_LOCATION + quote(name)
+        else:
+            if not os.path.isfile(full_path):
+                raise Http404("File not found")
+            response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+        response['Cache-Control'] = MEDIA_CACHE_CONTROL
+        return response
+
+    def _can_access(self, user, name):
+        """ Staff see everything, detailers the photos of their jobs and their own profile image """
+        if name.startswith('uploads/'):
+            # Partial uploads are never served, not even to staff
+            return False
+        if user.is_staff:
+            return True
+        source = source_name(name)
+        if source.startswith('jobs/'):
+            return Job.objects.filter(Q(before_photo=source) | Q(after_photo=source), detailer__user=user).exists()
+        if source.startswith('profile_images/'):
+            return User.objects.filter(pk=user.pk, image=source).exists()
+        return False
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from ..metrics import registry, render_prometheus
+
+
+def metrics_view(request):
+    """ Serve the per action metrics in the Prometheus text format.
+
+        Prometheus scrapes it with "Authorization: Bearer <METRICS_TOKEN>" and staff can open it from an
+        admin session. DEBUG opens nothing, the docker-compose setup runs with it on.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    authorized = (
+        (request.user.is_authenticated and request.user.is_staff)
+        or (token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'))
+    )
+    if not authorized:
+        return HttpResponseForbidden()
+    return HttpResponse(render_prometheus(registry.collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
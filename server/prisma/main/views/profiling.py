@@ -0,0 +1,23 @@
+import os
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import FileResponse, Http404
+from django.shortcuts import render
+from ..profiling import PROFILE_EXTENSIONS, list_profiles, profile_file
+
+
+@staff_member_required
+def profile_list_view(request):
+    """ Admin page listing the stored request profiles, newest first """
+    return render(request, 'admin/profiles.html', {
+        'title': 'Request profiles',
+        'profiles': list_profiles(),
+    })
+
+
+@staff_member_required
+def profile_download_view(request, profile_id, kind):
+    """ Download one file of a stored profile, kind is one of "meta", "collapsed" or "pstats" """
+    path = profile_file(profile_id, kind)
+    if path is None or not os.path.exists(path):
+        raise Http404("Profile not found")
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=profile_id + PROFILE_EXTENSIONS[kind])
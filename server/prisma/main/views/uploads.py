@@ -0,0 +1,136 @@
+import uuid
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.permissions import IsAuthenticated
+from rest_framework import status
+from django.conf import settings
+from django.shortcuts import get_object_or_404
+from ..models import Job, PhotoUpload
+from ..services.uploads import UploadConflict, append_chunk, create_upload, finalize_upload
+from ..utils import get_full_media_url
+
+""" Resumable job photo uploads, modelled on the tus protocol:
+      1. POST uploads/create/ with the job, the photo field, the file name and its total size
+      2. PATCH uploads/<id>/ with the next chunk as application/offset+octet-stream and the
+         Upload-Offset header, repeated until the offset reaches the size. After a dropped connection
+         HEAD uploads/<id>/ returns the offset to resume from
+      3. POST uploads/finalize/ to set the photo on the job
+    Chunks are streamed to disk as they are read, whatever the photo size.
+"""
+class PhotoUploadView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    action_handler = {
+        'create': '_create',
+        'finalize': '_finalize',
+    }
+
+    # Maximum number of queries each action may run, enforced by QueryBudgetTestCase
+    query_budgets = {
+        'create': 2,
+        'finalize': 8,
+    }
+
+    def post(self, request, *args, **kwargs):
+        action = kwargs.get('action')
+        if action not in self.action_handler:
+            return Response({"error": "Invalid action"}, status=status.HTTP_400_BAD_REQUEST)
+        handler = getattr(self, self.action_handler[action])
+        return handler(request)
+
+    def _create(self, request):
+        """
+        Start an upload
+
+        Body:
+        - job_id: Job the photo belongs to, assigned to the requesting detailer
+        - field: before_photo or after_photo
+        - filename: Name of the file, .jpg, .jpeg, .png or .webp
+        - size: Total size in bytes
+        """
+        data = request.data
+        try:
+            job_id = int(data.get('job_id'))
+            size = int(data.get('size'))
+        except (TypeError, ValueError):
+            return Response({"error": "job_id and size are required"}, status=status.HTTP_400_BAD_REQUEST)
+        job = Job.objects.filter(pk=job_id, detailer__user=request.user).first()
+        if job is None:
+            return Response({"error": "Job not found"}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            upload = create_upload(request.user, job, data.get('field'), data.get('filename'), size)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = Response({
+            "uploadId": str(upload.id),
+            "offset": upload.offset,
+            "size": upload.size,
+            "maxChunkSize": settings.PHOTO_UPLOAD_MAX_CHUNK_SIZE,
+        }, status=status.HTTP_201_CREATED)
+        response['Location'] = request.build_absolute_uri(f'../{upload.id}/')
+        return response
+
+    def _finalize(self, request):
+        """ Set the fully received upload as the job's photo. Body: upload_id """
+        try:
+            upload_id = uuid.UUID(str(request.data.get('upload_id')))
+        except ValueError:
+            return Response({"error": "upload_id is required"}, status=status.HTTP_400_BAD_REQUEST)
+        upload = PhotoUpload.objects.filter(pk=upload_id, user=request.user).first()
+        if upload is None:
+            return Response({"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            job = finalize_upload(upload)
+        except UploadConflict as e:
+            return Response({"error": str(e), "offset": e.offset}, status=status.HTTP_409_CONFLICT)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            "jobId": str(job.id),
+            "field": upload.field,
+            "url": get_full_media_url(getattr(job, upload.field)),
+        }, status=status.HTTP_200_OK)
+
+
+class PhotoUploadChunkView(APIView):
+    """ The bytes of one upload: HEAD for the offset to resume from, PATCH to append a chunk """
+    permission_classes = [IsAuthenticated]
+
+    def _get_upload(self, request, upload_id):
+        return get_object_or_404(PhotoUpload, pk=upload_id, user=request.user)
+
+    def _offset_response(self, upload, response_status=status.HTTP_204_NO_CONTENT):
+        response = Response(status=response_status)
+        response['Upload-Offset'] = str(upload.offset)
+        response['Upload-Length'] = str(upload.size)
+        response['Cache-Control'] = 'no-store'
+        return response
+
+    def head(self, request, upload_id):
+        return self._offset_response(self._get_upload(request, upload_id), status.HTTP_200_OK)
+
+    def patch(self, request, upload_id):
+        upload = self._get_upload(request, upload_id)
+        if request.content_type != 'application/offset+octet-stream':
+            return Response({"error": "Content-Type must be application/offset+octet-stream"}, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers['Content-Length'])
+        except (KeyError, ValueError):
+            return Response({"error": "Upload-Offset and Content-Length headers are required"}, status=status.HTTP_400_BAD_REQUEST)
+        if length > settings.PHOTO_UPLOAD_MAX_CHUNK_SIZE:
+            return Response({"error": f"Chunks are limited to {settings.PHOTO_UPLOAD_MAX_CHUNK_SIZE} bytes"}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        # The body is read from the request stream as it is written, request.data is never touched
+        try:
+            append_chunk(upload, offset, request, length)
+        except UploadConflict as e:
+            response = Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+            if e.offset is not None:
+                response['Upload-Offset'] = str(e.offset)
+            return response
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return self._offset_response(upload)
+
@@ -0,0 +1,41 @@
+from urllib.parse import parse_qs
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from .models import User
+
+
+def _token_from_scope(scope):
+    """ Access token from the "Authorization: Bearer" header, or the ?token= query parameter for clients that can't set headers """
+    for name, value in scope.get('headers', []):
+        if name == b'authorization':
+            scheme, _, token = value.decode('latin-1').partition(' ')
+            if scheme.lower() == 'bearer' and token:
+                return token.strip()
+    query = parse_qs(scope.get('query_string', b'').decode())
+    return query.get('token', [None])[0]
+
+
+@database_sync_to_async
+def _user_for_token(token):
+    try:
+        user_id = AccessToken(token)[api_settings.USER_ID_CLAIM]
+        return User.objects.get(**{api_settings.USER_ID_FIELD: user_id}, is_active=True)
+    except (TokenError, KeyError, User.DoesNotExist):
+        return AnonymousUser()
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    Channels middleware authenticating websocket connections with the same JWT access tokens as the API.
+
+    scope['user'] is the token's user, or AnonymousUser when the token is missing, expired or invalid,
+    consumers decide whether to accept anonymous connections.
+    """
+    async def __call__(self, scope, receive, send):
+        token = _token_from_scope(scope)
+        scope['user'] = await _user_for_token(token) if token else AnonymousUser()
+        return await super().__call__(scope, receive, send)
@@ -2,6 +2,9 @@
 ASGI config for prisma project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP requests go to Django, websockets to the channels consumers in main/routing.py,
+authenticated with the API's JWT access tokens. Served by gunicorn with uvicorn
+workers, see gunicorn.conf.py.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -13,4 +16,17 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'prisma.settings')
 
-application = get_asgi_application()
+# Initialise Django before importing anything that touches the models
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from channels.security.websocket import AllowedHostsOriginValidator  # noqa: E402
+from main.routing import websocket_urlpatterns  # noqa: E402
+from main.ws_auth import JWTAuthMiddleware  # noqa: E402
+
+application = ProtocolTypeRouter({
+    'http': django_asgi_app,
+    'websocket': AllowedHostsOriginValidator(
+        JWTAuthMiddleware(URLRouter(websocket_urlpatterns))
+    ),
+})
@@ -10,8 +10,8 @@ app = Celery('prisma')
 # the configuration object to child processes.
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
-# Load task modules from all registered Django apps.
-app.autodiscover_tasks()
+# Load task modules from all registered Django apps (the task module is named task.py).
+app.autodiscover_tasks(related_name='task')
 
 
 @app.task(bind=True, ignore_result=True)
@@ -1,5 +1,6 @@
 from pathlib import Path
 from datetime import timedelta
+from celery.schedules import crontab
 import os
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -30,16 +31,25 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Outermost, so it sees the streaming response every other middleware returns
+    'main.middleware.AsyncStreamingMiddleware',
+    'main.middleware.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'main.profiling.ProfilingMiddleware',
+    'main.middleware.ReplicaStickinessMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Count the queries of every request while debugging and warn when an action exceeds its query budget
+if DEBUG and os.getenv('QUERY_BUDGET_MIDDLEWARE', 'True') == 'True':
+    MIDDLEWARE.append('main.middleware.QueryBudgetMiddleware')
+
 ROOT_URLCONF = 'prisma.urls'
 
 TEMPLATES = [
@@ -61,13 +71,141 @@ TEMPLATES = [
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DATABASE_ENGINE picks the profile: "sqlite" (default, local development) or "postgresql" (deployments).
+# PROCESS_ROLE tells the web server ("web") and the celery workers ("celery") apart so each gets its own
+# connection pool size, compare the connection strategies with python manage.py bench_db_connections
+DATABASE_ENGINE = os.getenv('DATABASE_ENGINE', 'sqlite')
+PROCESS_ROLE = os.getenv('PROCESS_ROLE', 'web')
+
+if DATABASE_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('POSTGRES_DB', 'prisma'),
+            'USER': os.getenv('POSTGRES_USER', 'prisma'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
+            'HOST': os.getenv('POSTGRES_HOST', 'localhost'),
+            'PORT': os.getenv('POSTGRES_PORT', '5432'),
+            # Keep connections across requests, checked before reuse so a dropped connection isn't handed out
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '600')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', '5')),
+            },
+        }
+    }
+    # psycopg 3 connection pool per process instead of one persistent connection per thread. A web
+    # worker serves several threads at once, a prefork celery child runs one task at a time.
+    if os.getenv('DB_POOL', 'False') == 'True':
+        DB_POOL_SIZES = {
+            'web': (int(os.getenv('DB_POOL_MIN_SIZE_WEB', '2')), int(os.getenv('DB_POOL_MAX_SIZE_WEB', '10'))),
+            'celery': (int(os.getenv('DB_POOL_MIN_SIZE_CELERY', '1')), int(os.getenv('DB_POOL_MAX_SIZE_CELERY', '2'))),
+        }
+        min_size, max_size = DB_POOL_SIZES.get(PROCESS_ROLE, DB_POOL_SIZES['web'])
+        # Pooled connections are returned to the pool after each request, Django requires CONN_MAX_AGE = 0
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': min_size,
+            'max_size': max_size,
+            'timeout': int(os.getenv('DB_POOL_TIMEOUT', '10')),
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        }
+    }
+
+# SQLite tuning for the web server and celery worker writing at the same time. WAL lets readers run
+# alongside the single writer, write transactions take the write lock up front (BEGIN IMMEDIATE) so
+# they wait on busy_timeout instead of failing with "database is locked" when upgrading a read lock.
+# Compare with SQLITE_TUNING=False using python manage.py bench_sqlite_writes
+SQLITE_TUNING = DATABASE_ENGINE == 'sqlite' and os.getenv('SQLITE_TUNING', 'True') == 'True'
+if SQLITE_TUNING:
+    SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', '20'))  # seconds
+    DATABASES['default']['OPTIONS'] = {
+        'timeout': SQLITE_BUSY_TIMEOUT,
+        'transaction_mode': 'IMMEDIATE',
+        'init_command': ';'.join([
+            'PRAGMA journal_mode=WAL',
+            'PRAGMA synchronous=NORMAL',
+            f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT * 1000}',
+            f"PRAGMA mmap_size={int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))}",
+            f"PRAGMA cache_size=-{int(os.getenv('SQLITE_CACHE_SIZE_KB', '65536'))}",
+            'PRAGMA temp_store=MEMORY',
+        ]),
     }
+
+# Read replicas, a comma separated list of replica hosts ("host" or "host:port") on PostgreSQL, or of
+# sqlite files. Each one becomes a "replica_<n>" alias that dashboard and export reads are routed to,
+# see main/routers.py. For a local sqlite primary/replica pair:
+# cp db.sqlite3 replica.sqlite3 && DATABASE_REPLICAS=replica.sqlite3 python manage.py runserver
+DATABASE_REPLICAS = []
+for number, replica in enumerate(filter(None, os.getenv('DATABASE_REPLICAS', '').split(',')), start=1):
+    alias = f'replica_{number}'
+    if DATABASE_ENGINE == 'postgresql':
+        host, _, port = replica.strip().partition(':')
+        location = {'HOST': host, 'PORT': port or DATABASES['default']['PORT']}
+    else:
+        location = {'NAME': replica.strip()}
+    DATABASES[alias] = {**DATABASES['default'], **location, 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['main.routers.ReplicaRouter']
+# Seconds a user's reads stay on the primary after they wrote
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', '5'))
+
+# Redis cache shared by every worker when CACHE_REDIS_URL is set, otherwise a per process memory cache
+if os.getenv('CACHE_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('CACHE_REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+# Whether the default cache is shared by every web and celery process. Data invalidated across processes,
+# like the slot grids and routes, is only cached when it is: a process local cache would keep serving it stale
+SHARED_CACHE = os.getenv('SHARED_CACHE', 'True' if os.getenv('CACHE_REDIS_URL') else 'False') == 'True'
+
+
+# Service type catalog cache, see main/catalog.py. Each process keeps the catalog in memory and checks
+# the shared version every SERVICE_CATALOG_LOCAL_TTL seconds, so a change reaches every worker within it
+SERVICE_CATALOG_LOCAL_TTL = float(os.getenv('SERVICE_CATALOG_LOCAL_TTL', '5'))
+SERVICE_CATALOG_CACHE_TIMEOUT = int(os.getenv('SERVICE_CATALOG_CACHE_TIMEOUT', '86400'))
+
+# Customer slot grids, see main/services/slots.py. The next SLOT_PRECOMPUTE_DAYS days are precomputed
+# every night at SLOT_PRECOMPUTE_HOUR, grids outlive a missed run so they don't all go cold at once
+SLOT_PRECOMPUTE_DAYS = int(os.getenv('SLOT_PRECOMPUTE_DAYS', '14'))
+SLOT_PRECOMPUTE_HOUR = int(os.getenv('SLOT_PRECOMPUTE_HOUR', '3'))
+SLOT_CACHE_TIMEOUT = int(os.getenv('SLOT_CACHE_TIMEOUT', str(60 * 60 * 48)))
+
+# Automatic dispatch of unassigned jobs, see main/services/dispatch.py. Detailers further than
+# DISPATCH_MAX_DISTANCE_KM from a job are never offered it, the weights balance the candidate scores.
+# A job nobody could take waits DISPATCH_RETRY_DELAY seconds before it is scored again
+DISPATCH_BATCH_SIZE = int(os.getenv('DISPATCH_BATCH_SIZE', '200'))
+DISPATCH_RETRY_DELAY = int(os.getenv('DISPATCH_RETRY_DELAY', str(15 * 60)))
+DISPATCH_MAX_DISTANCE_KM = float(os.getenv('DISPATCH_MAX_DISTANCE_KM', '30'))
+DISPATCH_WEIGHTS = {
+    'distance': float(os.getenv('DISPATCH_WEIGHT_DISTANCE', '0.4')),
+    'capacity': float(os.getenv('DISPATCH_WEIGHT_CAPACITY', '0.25')),
+    'rating': float(os.getenv('DISPATCH_WEIGHT_RATING', '0.2')),
+    'load': float(os.getenv('DISPATCH_WEIGHT_LOAD', '0.15')),
 }
 
+# Daily routes of the detailers, see main/services/routes.py. Travel times assume ROUTE_SPEED_KMH over
+# the straight line distance times ROUTE_DETOUR_FACTOR, a stop may begin until ROUTE_ARRIVAL_WINDOW
+# minutes after its appointment time
+ROUTE_SPEED_KMH = float(os.getenv('ROUTE_SPEED_KMH', '30'))
+ROUTE_DETOUR_FACTOR = float(os.getenv('ROUTE_DETOUR_FACTOR', '1.3'))
+ROUTE_ARRIVAL_WINDOW = int(os.getenv('ROUTE_ARRIVAL_WINDOW', '60'))
+ROUTE_CACHE_TIMEOUT = int(os.getenv('ROUTE_CACHE_TIMEOUT', '86400'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -160,14 +298,88 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+# Seconds to wait on the broker when connecting, a request enqueueing a task gives up this soon when it's down
+CELERY_BROKER_TRANSPORT_OPTIONS = {'socket_connect_timeout': float(os.getenv('CELERY_BROKER_CONNECT_TIMEOUT', '2'))}
+# Periodic tasks, run by the celery beat service in docker-compose.yml
+CELERY_BEAT_SCHEDULE = {
+    # End of day reconciliation, so Sunday's completed jobs are earned before the Monday payout
+    'generate-earnings': {
+        'task': 'main.task.generate_earnings',
+        'schedule': crontab(hour=23, minute=30),
+    },
+    # The run id is derived from the ISO week, an extra tick in the same week pays nobody twice
+    'run-weekly-payouts': {
+        'task': 'main.task.run_weekly_payouts',
+        'schedule': crontab(day_of_week='mon', hour=6, minute=0),
+    },
+    'cleanup-photo-uploads': {
+        'task': 'main.task.cleanup_photo_uploads',
+        'schedule': 60 * 60,
+    },
+    # Retries and emails whose send task was lost
+    'send-queued-emails': {
+        'task': 'main.task.send_queued_emails',
+        'schedule': 60,
+    },
+    'send-job-reminders': {
+        'task': 'main.task.send_job_reminders',
+        'schedule': 60 * 60,
+    },
+    'dispatch-pending-jobs': {
+        'task': 'main.task.dispatch_pending_jobs',
+        'schedule': 60,
+    },
+    # Off peak, before the morning rush browses the next two weeks
+    'precompute-slot-grids': {
+        'task': 'main.task.precompute_slot_grids',
+        'schedule': crontab(hour=SLOT_PRECOMPUTE_HOUR, minute=30),
+    },
+}
 
-# Configure email settings
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
-EMAIL_HOST = 'smtp.gmail.com'
-EMAIL_PORT = 587
+# Per action metrics served on /metrics. Set METRICS_REDIS_URL to sum them across every worker process,
+# and METRICS_TOKEN to let Prometheus scrape them with "Authorization: Bearer <token>"
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+METRICS_REDIS_URL = os.getenv('METRICS_REDIS_URL')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '10'))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+# On demand profiling of single requests, triggered by a signed X-Prisma-Profile header
+# (python manage.py profile_token) or ?__profile=1 from a staff session. Profiles are listed on /admin/profiles/
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'True') == 'True'
+PROFILE_MODE = os.getenv('PROFILE_MODE', 'sample')  # 'sample' writes collapsed stacks, 'cprofile' writes .prof files
+PROFILE_SAMPLE_INTERVAL = float(os.getenv('PROFILE_SAMPLE_INTERVAL', '0.001'))
+PROFILE_TOKEN_MAX_AGE = int(os.getenv('PROFILE_TOKEN_MAX_AGE', '3600'))
+PROFILE_STORE_DIR = os.getenv('PROFILE_STORE_DIR', os.path.join(BASE_DIR, 'profiles'))
+PROFILE_STORE_MAX_PROFILES = int(os.getenv('PROFILE_STORE_MAX_PROFILES', '50'))
+
+# Resumable photo uploads, see main/views/uploads.py. Uploads idle for PHOTO_UPLOAD_EXPIRY_HOURS are
+# deleted by the cleanup_photo_uploads task
+PHOTO_UPLOAD_MAX_SIZE = int(os.getenv('PHOTO_UPLOAD_MAX_SIZE', str(20 * 1024 * 1024)))
+PHOTO_UPLOAD_MAX_CHUNK_SIZE = int(os.getenv('PHOTO_UPLOAD_MAX_CHUNK_SIZE', str(2 * 1024 * 1024)))
+PHOTO_UPLOAD_EXPIRY_HOURS = int(os.getenv('PHOTO_UPLOAD_EXPIRY_HOURS', '24'))
+
+# Configure email settings. Emails are queued with main.emails.queue_email and sent by the celery worker.
+# EMAIL_BACKEND=django.core.mail.backends.console.EmailBackend prints them, filebased.EmailBackend writes
+# them to EMAIL_FILE_PATH
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_FILE_PATH = os.getenv('EMAIL_FILE_PATH', os.path.join(BASE_DIR, 'sent_emails'))
+EMAIL_HOST = os.getenv('EMAIL_HOST', 'smtp.gmail.com')
+EMAIL_PORT = int(os.getenv('EMAIL_PORT', '587'))
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
-EMAIL_USE_TLS = True
+EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'True') == 'True'
+# A hung SMTP server fails the attempt instead of blocking the worker
+EMAIL_TIMEOUT = int(os.getenv('EMAIL_TIMEOUT', '15'))
+DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'Prisma <no-reply@prisma.app>')
+# Emails sent per batch over the worker's connection, and seconds a queueing waits for others to join it
+EMAIL_BATCH_SIZE = int(os.getenv('EMAIL_BATCH_SIZE', '50'))
+EMAIL_BATCH_DELAY = int(os.getenv('EMAIL_BATCH_DELAY', '5'))
+# Failed emails are retried after EMAIL_RETRY_BACKOFF seconds, doubling up to EMAIL_RETRY_BACKOFF_MAX
+EMAIL_MAX_ATTEMPTS = int(os.getenv('EMAIL_MAX_ATTEMPTS', '5'))
+EMAIL_RETRY_BACKOFF = int(os.getenv('EMAIL_RETRY_BACKOFF', '60'))
+EMAIL_RETRY_BACKOFF_MAX = int(os.getenv('EMAIL_RETRY_BACKOFF_MAX', '3600'))
+# Emails claimed by a worker that died are picked up again after this many seconds
+EMAIL_CLAIM_TIMEOUT = int(os.getenv('EMAIL_CLAIM_TIMEOUT', '600'))
 
 
 # Configure the auth user model
@@ -191,11 +403,12 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # orjson backed, same output as DRF's JSON renderer and parser, see python manage.py bench_renderers
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',
+        'main.renderers.FastJSONRenderer',
     ),
     'DEFAULT_PARSER_CLASSES': (
-        'rest_framework.parsers.JSONParser',
+        'main.renderers.FastJSONParser',
         'rest_framework.parsers.FormParser',
         'rest_framework.parsers.MultiPartParser',
     ),
@@ -208,6 +421,11 @@ STATICFILES_DIRS = [
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Media requests are authorized by main/views/media.py and handed to nginx through X-Accel-Redirect to
+# this internal location, see nginx/conf.d/default.conf. Set MEDIA_ACCEL_REDIRECT=False to let Django
+# stream the files when nginx isn't in front (runserver)
+MEDIA_ACCEL_REDIRECT = os.getenv('MEDIA_ACCEL_REDIRECT', 'True') == 'True'
+MEDIA_ACCEL_REDIRECT_LOCATION = os.getenv('MEDIA_ACCEL_REDIRECT_LOCATION', '/protected-media/')
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 ASGI_APPLICATION = 'prisma.asgi.application'
\ No newline at end of file
@@ -17,11 +17,18 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from django.http import JsonResponse
+from main.views.media import MediaView
+from main.views.metrics import metrics_view
+from main.views.profiling import profile_download_view, profile_list_view
 
 
 
 
 urlpatterns = [
+    path('admin/profiles/', profile_list_view, name='profile-list'),
+    path('admin/profiles/<str:profile_id>/<str:kind>/', profile_download_view, name='profile-download'),
     path('admin/', admin.site.urls),
-    path('api/v1/', include('main.urls'))
+    path('api/v1/', include('main.urls')),
+    path('metrics', metrics_view, name='metrics'),
+    path('media/<path:path>', MediaView.as_view(), name='media'),
 ]